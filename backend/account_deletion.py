@@ -0,0 +1,57 @@
+import queue
+import threading
+from typing import Optional
+
+from database import db_service
+
+class AccountDeletionWorker:
+    """
+    Purges deleted accounts in the background.
+
+    /user/delete-all only flags the account (revoking access in one write)
+    and queues it here; this thread then runs DatabaseService's concurrent
+    delete and removes the photo files. Accounts still flagged when the
+    process restarts are picked up again on start().
+    """
+
+    def __init__(self, db=db_service):
+        self.db = db
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the worker and resume any purges interrupted by a restart"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="account-deletion", daemon=True)
+        self._thread.start()
+        try:
+            for user_id in self.db.get_pending_deletions():
+                self._queue.put(user_id)
+        except Exception as e:
+            print(f"Error loading pending account deletions: {e}")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the worker after the queued purges finish"""
+        if self._thread and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+    def enqueue(self, user_id: str):
+        self._queue.put(user_id)
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            if user_id is None:
+                break
+            try:
+                results = self.db.delete_all_user_data(user_id)
+                print(f"Purged account {user_id}: {results}")
+            except Exception as e:
+                # The user document is only removed last, so the purge is retried on next start
+                print(f"Error purging account {user_id}: {e}")
+
+# Global account deletion worker
+account_deletion_worker = AccountDeletionWorker()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Response encoding benchmark: bytes on the wire and CPU per response for
+JSON and MessagePack, uncompressed and with gzip/brotli, using the same
+/chat/history and /profile payloads as bench_serialization.py.
+
+The compression settings are the ones ContentEncodingMiddleware uses
+(GZIP_LEVEL, BROTLI_QUALITY); pass --levels to compare others.
+
+Usage: python benchmarks/bench_encoding.py [--iterations 500]
+"""
+
+import argparse
+import gzip
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_serialization import chat_history_payload, profile_payload
+from content_encoding import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from fast_json import declared_fields, dumps, msgpack, packb
+from models import UserProfile
+
+def timed(func, iterations):
+    result = func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return result, (time.perf_counter() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--levels", action="store_true", help="also try gzip 1/9 and brotli 1/11")
+    args = parser.parse_args()
+
+    encoders = [("json", dumps)]
+    if msgpack is not None:
+        encoders.append(("msgpack", packb))
+    else:
+        print("msgpack not installed; skipping MessagePack rows")
+
+    compressors = [("identity", None), (f"gzip-{GZIP_LEVEL}", lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0))]
+    if brotli is not None:
+        compressors.append((f"br-{BROTLI_QUALITY}", lambda body: brotli.compress(body, quality=BROTLI_QUALITY)))
+    if args.levels:
+        compressors += [(f"gzip-{level}", lambda body, level=level: gzip.compress(body, level, mtime=0)) for level in (1, 9)]
+        if brotli is not None:
+            compressors += [(f"br-{quality}", lambda body, quality=quality: brotli.compress(body, quality=quality)) for quality in (1, 11)]
+
+    cases = [
+        ("/chat/history (50 messages)", chat_history_payload()),
+        ("/chat/history (50 messages, no insights)", {"chat_history": [
+            {key: value for key, value in message.items() if key != "insights"}
+            for message in chat_history_payload()["chat_history"]
+        ]}),
+        # What /profile sends: the document without its internal fields
+        ("/profile (full)", declared_fields(profile_payload(), UserProfile)),
+    ]
+    for name, payload in cases:
+        print(name)
+        print(f"  {'encoding':<22} {'bytes':>8} {'ratio':>7} {'encode us':>10} {'compress us':>12} {'total us':>9}")
+        baseline = None
+        for encoder_name, encode in encoders:
+            body, encode_us = timed(lambda: encode(payload), args.iterations)
+            baseline = baseline or len(body)
+            for compressor_name, compress in compressors:
+                if compress is None:
+                    wire, compress_us = body, 0.0
+                else:
+                    wire, compress_us = timed(lambda: compress(body), args.iterations)
+                label = f"{encoder_name}+{compressor_name}"
+                print(f"  {label:<22} {len(wire):>8} {len(wire) / baseline:>6.0%} {encode_us:>10.1f} "
+                      f"{compress_us:>12.1f} {encode_us + compress_us:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Concurrent-connection benchmark for the match messaging hub.
+
+Opens N in-memory websocket stand-ins spread over conversations of two,
+sends messages through MessagingHub and measures fan-out throughput,
+delivery latency and memory per connection for one worker. A fraction of
+clients can be made slow to check they get dropped without stalling others.
+
+Usage: python benchmarks/bench_messaging.py [--connections 10000] [--messages 20000] [--slow 0.01]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from messaging import MessagingHub
+
+class FakeWebSocket:
+    def __init__(self, latencies, delay: float = 0.0):
+        self.latencies = latencies
+        self.delay = delay
+        self.received = 0
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        # sent_at is the last field; cheaper than json.loads per message
+        self.latencies.append(time.perf_counter() - float(text.rsplit('"bench_t": ', 1)[1].rstrip("}")))
+
+    async def close(self, code: int = 1000):
+        pass
+
+class NullDB:
+    def __init__(self):
+        self.batches = 0
+        self.saved = 0
+
+    def save_messages(self, messages):
+        self.batches += 1
+        self.saved += len(messages)
+        return len(messages)
+
+async def run(connections: int, messages: int, slow_fraction: float):
+    db = NullDB()
+    hub = MessagingHub(db)
+    await hub.start()
+    latencies = []
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sockets = []
+    slow_every = int(1 / slow_fraction) if slow_fraction else 0
+    for index in range(connections):
+        delay = 10.0 if slow_every and index % slow_every == 0 else 0.0
+        websocket = FakeWebSocket(latencies, delay)
+        sockets.append((websocket, hub.connect(websocket, f"user-{index}", f"match-{index // 2}")))
+    per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / connections
+    tracemalloc.stop()
+
+    conversations = connections // 2
+    start = time.perf_counter()
+    for index in range(messages):
+        match_id = f"match-{index % conversations}"
+        # bench_t rides along in the payload to time delivery
+        await hub.broker.publish(f"match:{match_id}", {"type": "message", "text": "hey", "bench_t": time.perf_counter()})
+        if hub.writer:
+            hub.writer.enqueue({"match_id": match_id, "text": "hey"})
+        if index % 500 == 0:
+            await asyncio.sleep(0)
+    while len(latencies) < messages * 2 * (1 - slow_fraction) * 0.98 and time.perf_counter() - start < 30:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    slow = [connection for websocket, connection in sockets if websocket.delay]
+    max_backlog = max((connection.outbox.qsize() for connection in slow), default=0)
+    dropped = sum(1 for _, connection in sockets if connection.dropped)
+    await hub.stop()
+    for _, connection in sockets:
+        await hub.disconnect(connection)
+
+    latencies.sort()
+    print(f"connections:            {connections}")
+    print(f"memory per connection:  {per_connection / 1024:.1f} KiB")
+    print(f"messages sent:          {messages} ({len(latencies)} deliveries)")
+    print(f"deliveries/sec:         {len(latencies) / elapsed:,.0f}")
+    print(f"delivery p50 / p99 ms:  {statistics.median(latencies) * 1000:.2f} / {latencies[int(len(latencies) * 0.99)] * 1000:.2f}")
+    print(f"slow clients:           {len(slow)} (max backlog {max_backlog}, dropped {dropped})")
+    print(f"db batches / messages:  {db.batches} / {db.saved}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--slow", type=float, default=0.01, help="fraction of clients that never drain")
+    args = parser.parse_args()
+    asyncio.run(run(args.connections, args.messages, args.slow))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Profile schema benchmark: read/write latency and MongoDB commands per
+operation for the referenced layout (photos and prompts in their own
+collections) against the embedded one (PROFILE_SCHEMA=embedded).
+
+Each layout gets its own throwaway database on the same server, seeded
+through DatabaseService with identical profiles. The profile cache is
+turned off so every read reaches MongoDB. Under mongomock, commands are
+counted by mongomock_monitoring but timings are in-process, so compare
+latencies against a real mongod.
+
+Usage:
+    python benchmarks/bench_profile_schema.py --profiles 200 --mongo-url mongodb://localhost:27017/
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import DatabaseService, EmbeddedProfileDatabaseService
+from profile_cache import profile_cache
+from query_budget import watch_queries
+
+LAYOUTS = {"referenced": DatabaseService, "embedded": EmbeddedProfileDatabaseService}
+
+def photo_data(index: int, n: int):
+    return {
+        "id": str(uuid.uuid4()),
+        "url": f"https://cdn.example.com/bench/{index}/{n}.jpg",
+        "storage_key": f"bench/{index}/{n}.jpg",
+        "caption": "Bench photo",
+        "ai_suggestion": "AI suggested caption for a bench photo"
+    }
+
+def prompts_data(count: int):
+    return [
+        {"question": f"Bench prompt {n}?", "answer": "An answer of fairly typical length. " * 3, "order": n}
+        for n in range(count)
+    ]
+
+def seed(db: DatabaseService, profiles: int, photos: int, prompts: int):
+    user_ids = []
+    for index in range(profiles):
+        user_id = db.create_user(f"schema-bench-{index}@example.com", "not-a-password-hash")
+        db.create_profile(user_id, {
+            "user_id": user_id, "name": f"Bench {index}", "pronouns": "they/them",
+            "essential_details": [{"key": "age", "value": str(20 + index % 40), "is_visible": True}]
+        })
+        for n in range(photos):
+            db.add_photo(user_id, photo_data(index, n))
+        db.add_prompts(user_id, prompts_data(prompts))
+        user_ids.append(user_id)
+    return user_ids
+
+def stored_bytes(db: DatabaseService, user_ids) -> float:
+    """Average BSON bytes per user across profiles, photos and prompts"""
+    total = 0
+    for name in ("profiles", "photos", "prompts"):
+        for document in getattr(db, name).find({"user_id": {"$in": user_ids}}):
+            total += len(bson.encode(document))
+    return total / len(user_ids)
+
+def operations(db: DatabaseService, user_ids, photo_ids, prompts: int):
+    return [
+        ("read  profile", lambda user_id: db.get_profile(user_id)),
+        ("read  fields=name,photos.url", lambda user_id: db.get_profile(user_id, ["name", "photos.url"])),
+        ("read  photos", lambda user_id: db.get_user_photos(user_id)),
+        ("read  20 profiles", lambda user_id: db.get_profiles(random.sample(user_ids, min(20, len(user_ids))))),
+        ("write caption", lambda user_id: db.update_photo(user_id, photo_ids[user_id], {"caption": f"Caption {time.time()}"})),
+        ("write set primary", lambda user_id: db.set_primary_photo(user_id, photo_ids[user_id])),
+        ("write add+delete photo", lambda user_id: db.delete_photo(user_id, db.add_photo(user_id, photo_data(0, 99)))),
+        ("write replace prompts", lambda user_id: (
+            db.delete_user_prompts(user_id), db.add_prompts(user_id, prompts_data(prompts))
+        )),
+    ]
+
+def run_layout(layout: str, args):
+    db = LAYOUTS[layout](args.mongo_url, db_name=f"profile_schema_bench_{layout}")
+    db.connect(create_indexes=False)
+    db.client.drop_database(db.db_name)
+    db.ensure_indexes(force=True)
+
+    started = time.perf_counter()
+    user_ids = seed(db, args.profiles, args.photos, args.prompts)
+    print(f"{layout}: seeded {len(user_ids)} profiles in {time.perf_counter() - started:.1f}s")
+    # A photo per user for the single-photo writes (the last one, so primary moves each time)
+    photo_ids = {user_id: db.get_user_photos(user_id, ["id"])[-1]["_id"] for user_id in user_ids}
+
+    results = {"bytes/profile": stored_bytes(db, user_ids)}
+    for name, operation in operations(db, user_ids, photo_ids, args.prompts):
+        latencies = []
+        with watch_queries(name) as log:
+            for _ in range(args.iterations):
+                user_id = random.choice(user_ids)
+                start = time.perf_counter()
+                operation(user_id)
+                latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        results[name] = (
+            statistics.mean(latencies),
+            latencies[int(len(latencies) * 0.95) - 1],
+            log.count / args.iterations
+        )
+
+    if not args.keep:
+        db.client.drop_database(db.db_name)
+    db.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017/"))
+    parser.add_argument("--profiles", type=int, default=200)
+    parser.add_argument("--photos", type=int, default=6)
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark databases afterwards")
+    args = parser.parse_args()
+
+    random.seed(0)
+    profile_cache.enabled = False
+    results = {layout: run_layout(layout, args) for layout in LAYOUTS}
+
+    referenced, embedded = results["referenced"], results["embedded"]
+    print(f"\nstored: referenced {referenced['bytes/profile']:,.0f} B/profile, "
+          f"embedded {embedded['bytes/profile']:,.0f} B/profile\n")
+    print(f"{'operation':<30} {'referenced ms (p95)':>22} {'cmds':>5} {'embedded ms (p95)':>22} {'cmds':>5} {'speedup':>8}")
+    for name in [name for name in referenced if name != "bytes/profile"]:
+        ref_mean, ref_p95, ref_cmds = referenced[name]
+        emb_mean, emb_p95, emb_cmds = embedded[name]
+        print(f"{name:<30} {ref_mean:>12.2f} ({ref_p95:>6.2f}) {ref_cmds:>5.1f} "
+              f"{emb_mean:>12.2f} ({emb_p95:>6.2f}) {emb_cmds:>5.1f} {ref_mean / emb_mean:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Memory/latency benchmark for the per-user seen-profile Bloom filter.
+
+Compares the SeenFilter stored in seen_filters against the exact id list a
+$nin query would have to ship to Mongo, at realistic swipe counts. "write B"
+is the filter data one swipe writes back (the words it changed).
+
+Usage: python benchmarks/bench_seen_filter.py [--fp-rate 0.01] [--capacity 1000]
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bloom import SeenFilter
+
+SWIPE_COUNTS = [100, 1_000, 10_000, 100_000]
+PROBES = 20_000
+
+def nin_list_bson_bytes(count: int) -> int:
+    """BSON size of a $nin array of `count` uuid strings"""
+    total = 0
+    for index in range(count):
+        # type byte + array key ("0", "1", ...) + NUL + int32 length + 36 chars + NUL
+        total += 1 + len(str(index)) + 1 + 4 + 36 + 1
+    return total
+
+def run(swipes: int, capacity: int, fp_rate: float):
+    seen_ids = [str(uuid.uuid4()) for _ in range(swipes)]
+    seen = SeenFilter(capacity, fp_rate)
+
+    start = time.perf_counter()
+    for user_id in seen_ids:
+        seen.add(user_id)
+    add_us = (time.perf_counter() - start) / swipes * 1e6
+
+    # One swipe = load filter from BSON, add, build the update of the changed words
+    doc = seen.to_document()
+    written = 0
+    start = time.perf_counter()
+    for _ in range(100):
+        reloaded = SeenFilter.from_document(doc)
+        reloaded.add(str(uuid.uuid4()))
+        layer = reloaded.layers[-1]
+        if len(reloaded.layers) > len(seen.layers):
+            # A full last layer: the new one is pushed whole
+            written += layer.num_bytes
+        else:
+            written += sum(len(layer.word(word)) for word in layer.dirty_words)
+    swipe_us = (time.perf_counter() - start) / 100 * 1e6
+
+    probes = [str(uuid.uuid4()) for _ in range(PROBES)]
+    start = time.perf_counter()
+    false_positives = sum(1 for probe in probes if probe in seen)
+    check_us = (time.perf_counter() - start) / PROBES * 1e6
+
+    exact_set_bytes = sys.getsizeof(set(seen_ids)) + sum(sys.getsizeof(user_id) for user_id in seen_ids)
+
+    print(
+        f"{swipes:>8} | {len(seen.layers):>6} | {seen.size_bytes / 1024:>9.1f} | "
+        f"{nin_list_bson_bytes(swipes) / 1024:>9.1f} | {exact_set_bytes / 1024:>9.1f} | "
+        f"{false_positives / PROBES * 100:>6.3f} | {add_us:>6.2f} | {check_us:>6.2f} | {swipe_us:>8.1f} | "
+        f"{written / 100:>7.0f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fp-rate", type=float, default=0.01)
+    parser.add_argument("--capacity", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"Seen filter: first layer capacity={args.capacity}, target fp rate={args.fp_rate}")
+    print("  swipes | layers | bloom KiB |  $nin KiB |   set KiB |  fp %  | add us | chk us | swipe us | write B")
+    for swipes in SWIPE_COUNTS:
+        run(swipes, args.capacity, args.fp_rate)
+
+if __name__ == "__main__":
+    main()
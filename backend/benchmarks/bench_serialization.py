@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark: FastAPI's default response path vs the trusted
+orjson path (fast_json.trusted_response).
+
+Payloads are a 50-message chat history and a full profile (6 photos,
+3 prompts, 5 essential details), shaped like the Mongo documents the
+endpoints return.
+
+Usage: python benchmarks/bench_serialization.py [--iterations 2000]
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+
+from fast_json import dumps, trusted_response
+from models import UserProfile
+
+def chat_history_payload(messages: int = 50):
+    now = datetime.utcnow()
+    history = []
+    for index in range(messages):
+        sender = "user" if index % 2 == 0 else "ai"
+        history.append({
+            "_id": str(uuid.uuid4()),
+            "user_id": "user-1",
+            "message": "Honestly I think the best weekends are spent hiking then cooking something new " * 2,
+            "sender": sender,
+            "insights": {} if sender == "user" else {
+                "mbti_type": "I",
+                "attachment_style": "secure",
+                "personality_traits": ["curious", "empathetic", "adventurous"],
+                "values": ["honesty", "growth"],
+                "interests": ["hiking", "cooking", "travel"],
+                "relationship_goals": "long-term",
+                "communication_style": "direct",
+                "boundaries": [],
+                "immediate_needs": []
+            },
+            "timestamp": now - timedelta(minutes=messages - index)
+        })
+    return {"chat_history": history}
+
+def profile_payload():
+    now = datetime.utcnow()
+    return {
+        "_id": str(uuid.uuid4()),
+        "user_id": "user-1",
+        "name": "Test User",
+        "pronouns": "they/them",
+        "verification_status": "verified",
+        "essential_details": [
+            {"key": key, "value": value, "is_visible": True}
+            for key, value in [("age", "27"), ("height", "5'8\""), ("home", "New York, NY"), ("drinker", "Socially"), ("kids", "No")]
+        ],
+        "prompts": [
+            {"_id": str(uuid.uuid4()), "user_id": "user-1", "question": f"Question {i}", "answer": "An answer of moderate length " * 3, "order": i, "created_at": now}
+            for i in range(3)
+        ],
+        "photos": [
+            {"_id": str(uuid.uuid4()), "id": str(uuid.uuid4()), "user_id": "user-1", "url": f"http://localhost:8001/uploads/{i}.jpg",
+             "caption": "Sunset at the beach", "ai_suggestion": "AI suggested caption", "order": i, "is_primary": i == 0, "created_at": now}
+            for i in range(6)
+        ],
+        "created_at": now,
+        "updated_at": now
+    }
+
+def default_path(payload, model=None):
+    # What FastAPI does for a route with response_model: validate, then encode
+    if model is not None:
+        payload = model.model_validate(payload).model_dump()
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def fast_path(payload, model=None):
+    return trusted_response(payload, model).body
+
+def bench(label, func, payload, model, iterations):
+    func(payload, model)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = func(payload, model)
+    per_call = (time.perf_counter() - start) / iterations * 1e6
+    print(f"  {label:<28} {per_call:>9.1f} us/response  {len(body):>7} bytes")
+    return per_call
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    cases = [
+        ("/chat/history (50 messages)", chat_history_payload(), None),
+        ("/profile (full)", profile_payload(), UserProfile),
+    ]
+    for name, payload, model in cases:
+        print(name)
+        slow = bench("response_model + json", default_path, payload, model, args.iterations)
+        fast = bench("trusted + orjson", fast_path, payload, model, args.iterations)
+        print(f"  speedup: {slow / fast:.1f}x")
+    # Sanity check: both paths produce equivalent JSON
+    history = chat_history_payload(5)
+    assert json.loads(default_path(history)) == json.loads(dumps(history))
+    profile = profile_payload()
+    assert json.loads(default_path(profile, UserProfile)) == json.loads(fast_path(profile, UserProfile))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Multi-worker scaling benchmark: runs the real server under uvicorn with
+1..N worker processes and drives the same HTTP load at each size.
+
+Workers share nothing but MongoDB, so this needs a real mongod (mongomock
+would give every worker its own empty database; it is only accepted for a
+single-worker baseline). The mix is login
+(bcrypt, CPU bound) plus GET /profile (Mongo bound), which is where extra
+cores should pay off.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 --mongo-url mongodb://localhost:27017/
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def start_server(workers: int, port: int, mongo_url: str, pool_size: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_URL": mongo_url,
+        "MONGO_MAX_POOL_SIZE": str(pool_size),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+
+async def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/metrics")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start within {timeout}s")
+
+async def sign_up(client: httpx.AsyncClient, users: int):
+    accounts = []
+    for _ in range(users):
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        await client.post("/register", json={"email": email, "password": "bench-password"})
+        headers = {"Authorization": f"Bearer {email}"}
+        await client.post("/profile", headers=headers, json={
+            "name": "Bench", "pronouns": "they/them",
+            "essential_details": [{"key": "age", "value": "30", "is_visible": True}],
+            "prompts": [], "photos": []
+        })
+        accounts.append((email, headers))
+    return accounts
+
+async def drive(base_url: str, accounts, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+
+    async def virtual_user(index: int, client: httpx.AsyncClient, deadline: float):
+        nonlocal errors
+        email, headers = accounts[index % len(accounts)]
+        step = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if step % 5 == 0:
+                response = await client.post("/login", data={"username": email, "password": "bench-password"})
+            else:
+                response = await client.get("/profile", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+            step += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(i, client, deadline) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        "errors": errors,
+    }
+
+async def bench(workers: int, args) -> dict:
+    port = args.port + workers
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(workers, port, args.mongo_url, args.pool_size)
+    try:
+        await wait_ready(base_url)
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            accounts = await sign_up(client, args.accounts)
+        return await drive(base_url, accounts, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="uvicorn multi-worker scaling benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017/"))
+    parser.add_argument("--pool-size", type=int, default=20, help="MONGO_MAX_POOL_SIZE per worker")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--accounts", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=18000)
+    args = parser.parse_args()
+    if args.mongo_url.startswith("mongomock://") and max(args.workers) > 1:
+        parser.error("mongomock gives each worker its own database; use a real mongod for more than one worker")
+    if max(args.workers) > (os.cpu_count() or 1):
+        print(f"⚠️  {os.cpu_count()} CPU(s): workers beyond that share cores and won't show scaling")
+
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        result = asyncio.run(bench(workers, args))
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>9.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['errors']:>7} {result['rps'] / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import math
+from typing import List, Dict, Iterable, Optional, Set
+
+# Bits are stored as an array of binary words of this many bytes, so a
+# write only has to replace the few words an add() changed
+WORD_BYTES = 64
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, kept as a plain bytearray and
+    saved as an array of WORD_BYTES-sized BSON binary words.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float, bits: Optional[bytes] = None,
+                 num_hashes: Optional[int] = None, count: int = 0):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        # Optimal size for `capacity` items at `fp_rate`: m = -n ln p / (ln 2)^2
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        self.num_bytes = (num_bits + 7) // 8
+        self.num_bits = self.num_bytes * 8
+        self.num_hashes = num_hashes or max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray(self.num_bytes)
+        self.count = count
+        # Indexes of the words changed since this filter was created or loaded
+        self.dirty_words: Set[int] = set()
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Kirsch-Mitzenmacher double hashing: one digest gives all k positions
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> bool:
+        """Add an item, returning False if it was (probably) already present"""
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                self.dirty_words.add(byte // WORD_BYTES)
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
+
+    @property
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+    def word(self, index: int) -> bytes:
+        return bytes(self.bits[index * WORD_BYTES:(index + 1) * WORD_BYTES])
+
+    def to_document(self) -> Dict:
+        return {
+            "words": [self.word(index) for index in range((self.num_bytes + WORD_BYTES - 1) // WORD_BYTES)],
+            "capacity": self.capacity,
+            "fp_rate": self.fp_rate,
+            "num_hashes": self.num_hashes,
+            "count": self.count
+        }
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "BloomFilter":
+        return cls(
+            capacity=doc["capacity"],
+            fp_rate=doc["fp_rate"],
+            # Filters saved before the word layout hold one "bits" binary
+            bits=b"".join(doc["words"]) if "words" in doc else doc["bits"],
+            num_hashes=doc["num_hashes"],
+            count=doc.get("count", 0)
+        )
+
+class SeenFilter:
+    """
+    Scalable Bloom filter of profiles a user has already swiped on.
+
+    Starts with one small layer; when a layer reaches its capacity a new one
+    twice as large is added with a halved error rate, so the compounded
+    false-positive rate converges to `fp_rate` however many swipes a user makes.
+    """
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, capacity: int = 1000, fp_rate: float = 0.01, layers: Optional[List[BloomFilter]] = None):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.layers = layers or [BloomFilter(capacity, fp_rate * (1 - self.TIGHTENING))]
+
+    def add(self, item: str) -> bool:
+        """Add an item, returning False if it was (probably) already seen"""
+        if item in self:
+            return False
+        if self.layers[-1].is_full:
+            last = self.layers[-1]
+            self.layers.append(BloomFilter(last.capacity * self.GROWTH, last.fp_rate * self.TIGHTENING))
+        return self.layers[-1].add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in layer for layer in self.layers)
+
+    @property
+    def count(self) -> int:
+        return sum(layer.count for layer in self.layers)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(layer.num_bytes for layer in self.layers)
+
+    def to_document(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "fp_rate": self.fp_rate,
+            "layers": [layer.to_document() for layer in self.layers]
+        }
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "SeenFilter":
+        return cls(
+            capacity=doc["capacity"],
+            fp_rate=doc["fp_rate"],
+            layers=[BloomFilter.from_document(layer) for layer in doc["layers"]]
+        )
@@ -0,0 +1,284 @@
+"""
+Cold storage for old AI chat messages.
+
+Messages older than CHAT_ARCHIVE_AFTER_DAYS are moved out of MongoDB into
+compressed NDJSON segment files (one per run of up to
+CHAT_ARCHIVE_SEGMENT_SIZE messages of a user), on local disk or in an
+S3-compatible bucket. A small chat_archive_segments document per file
+records its time range, so reads only fetch the segments they need.
+History and export rehydrate archived messages through DatabaseService.
+
+Run from cron (or by hand):
+    python chat_archive.py run [--older-than-days 90] [--dry-run]
+    python chat_archive.py status
+"""
+
+import argparse
+import gzip
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING
+
+from photo_storage import LocalPhotoStorage, PhotoStorage, S3PhotoStorage
+from profile_cache import LocalLRUCache
+
+# zstandard is optional; without it segments are gzip-compressed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    print("⚠️  zstandard not available. Chat archive segments will be gzip-compressed.")
+
+# Where segment files go: "local" (CHAT_ARCHIVE_DIR) or "s3" (CHAT_ARCHIVE_BUCKET, S3_* credentials)
+CHAT_ARCHIVE_STORAGE = os.getenv("CHAT_ARCHIVE_STORAGE", "local").lower()
+CHAT_ARCHIVE_DIR = Path(os.getenv("CHAT_ARCHIVE_DIR", "data/chat_archive"))
+CHAT_ARCHIVE_BUCKET = os.getenv("CHAT_ARCHIVE_BUCKET", "zoobae-chat-archive")
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "90"))
+CHAT_ARCHIVE_SEGMENT_SIZE = int(os.getenv("CHAT_ARCHIVE_SEGMENT_SIZE", "1000"))
+CHAT_ARCHIVE_ZSTD_LEVEL = int(os.getenv("CHAT_ARCHIVE_ZSTD_LEVEL", "9"))
+# Compressed segments kept in memory, so paging back through history doesn't refetch them
+CHAT_ARCHIVE_CACHE_SIZE = int(os.getenv("CHAT_ARCHIVE_CACHE_SIZE", "256"))
+CHAT_ARCHIVE_CACHE_TTL = int(os.getenv("CHAT_ARCHIVE_CACHE_TTL", "300"))
+# How often reads re-check whether anything has been archived yet
+ARCHIVE_RECHECK_SECONDS = 60
+
+# Naive UTC datetimes back, like the ones pymongo returns
+SEGMENT_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=False)
+
+def encode_segment(messages: List[Dict], codec: str) -> bytes:
+    body = b"".join(
+        json_util.dumps(message, json_options=SEGMENT_JSON_OPTIONS).encode("utf-8") + b"\n"
+        for message in messages
+    )
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=CHAT_ARCHIVE_ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, mtime=0)
+
+def decode_segment(data: bytes, codec: str) -> List[Dict]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Reading zstd chat archive segments requires zstandard (pip install zstandard)")
+        body = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        body = gzip.decompress(data)
+    return [json_util.loads(line, json_options=SEGMENT_JSON_OPTIONS) for line in body.splitlines() if line]
+
+def build_archive_storage() -> PhotoStorage:
+    """Pick the backend from CHAT_ARCHIVE_STORAGE (local or s3); archives are never served publicly"""
+    if CHAT_ARCHIVE_STORAGE == "s3":
+        return S3PhotoStorage(
+            bucket=CHAT_ARCHIVE_BUCKET,
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+            region=os.getenv("S3_REGION"),
+            access_key=os.getenv("S3_ACCESS_KEY"),
+            secret_key=os.getenv("S3_SECRET_KEY")
+        )
+    return LocalPhotoStorage(root=CHAT_ARCHIVE_DIR, base_url="")
+
+class ChatArchive:
+    """
+    Archived chat segments of a DatabaseService. Messages are kept without
+    user_id (it is in the segment index) and in timestamp order; every
+    archived message is older than every hot one of the same user.
+    """
+
+    def __init__(self, db, storage: Optional[PhotoStorage] = None):
+        self.db = db
+        self._storage = storage
+        self.codec = "zstd" if zstandard is not None else "gzip"
+        self.cache = LocalLRUCache(max_entries=CHAT_ARCHIVE_CACHE_SIZE, ttl=CHAT_ARCHIVE_CACHE_TTL)
+        self._in_use = False
+        self._checked_at = float("-inf")
+
+    @property
+    def storage(self) -> PhotoStorage:
+        # Built on first use, so boto3 is only needed once something is archived or read
+        if self._storage is None:
+            self._storage = build_archive_storage()
+        return self._storage
+
+    def in_use(self) -> bool:
+        """
+        Whether any segment exists. Until the first archive run reads skip
+        the archive entirely; once one exists it stays that way.
+        """
+        now = time.monotonic()
+        if not self._in_use and now - self._checked_at >= ARCHIVE_RECHECK_SECONDS:
+            self._in_use = self.db.chat_archive_segments.find_one({}, {"_id": 1}) is not None
+            self._checked_at = now
+        return self._in_use
+
+    def read_segment(self, segment: Dict) -> List[Dict]:
+        data = self.cache.get(segment["key"])
+        if data is None:
+            data = self.storage.read(segment["key"])
+            self.cache.set(segment["key"], data)
+        messages = decode_segment(data, segment["codec"])
+        for message in messages:
+            message["user_id"] = segment["user_id"]
+        return messages
+
+    def find(self, user_id: str, limit: int, before: Optional[datetime] = None) -> List[Dict]:
+        """The newest `limit` archived messages (before `before`, if given), oldest first"""
+        if limit <= 0:
+            return []
+        query: Dict = {"user_id": user_id}
+        if before is not None:
+            query["start"] = {"$lt": before}
+        segments = self.db.chat_archive_segments.find(query).sort("start", DESCENDING)
+        messages: List[Dict] = []
+        for segment in segments:
+            chunk = self.read_segment(segment)
+            if before is not None:
+                chunk = [message for message in chunk if message["timestamp"] < before]
+            messages = chunk + messages
+            if len(messages) >= limit:
+                break
+        segments.close()
+        return messages[-limit:]
+
+    def iter_messages(self, user_id: str) -> Iterator[Dict]:
+        """Every archived message of a user, oldest first, one segment in memory at a time"""
+        for segment in self.db.chat_archive_segments.find({"user_id": user_id}).sort("start", ASCENDING):
+            yield from self.read_segment(segment)
+
+    def write_segment(self, user_id: str, messages: List[Dict]) -> Dict:
+        """
+        Store messages (oldest first) as one segment file, then index it.
+        File name and index id derive from the first message, so a run
+        interrupted before its hot copies were deleted redoes the same segment.
+        """
+        first, last = messages[0], messages[-1]
+        key = f"{user_id}-{first['timestamp']:%Y%m%dT%H%M%S}-{first['_id']}.ndjson.{'zst' if self.codec == 'zstd' else 'gz'}"
+        data = encode_segment([
+            {field: value for field, value in message.items() if field != "user_id"}
+            for message in messages
+        ], self.codec)
+        self.storage.save(key, io.BytesIO(data), "application/x-ndjson")
+        segment = {
+            "_id": f"{user_id}:{first['_id']}",
+            "user_id": user_id,
+            "start": first["timestamp"],
+            "end": last["timestamp"],
+            "count": len(messages),
+            "key": key,
+            "codec": self.codec,
+            "bytes": len(data),
+            "created_at": datetime.utcnow()
+        }
+        self.db.chat_archive_segments.replace_one({"_id": segment["_id"]}, segment, upsert=True)
+        self._in_use = True
+        return segment
+
+    def archive_user(self, user_id: str, cutoff: datetime, segment_size: int = CHAT_ARCHIVE_SEGMENT_SIZE) -> int:
+        """
+        Move a user's messages from before `cutoff` into segments; returns
+        how many moved. Hot copies are deleted only after their segment is
+        written and indexed. Buckets move whole, so only those of days before
+        the cutoff's are archived.
+        """
+        db = self.db
+        archived = 0
+        # Standalone messages (CHAT_STORAGE=messages, or not yet bucketed)
+        while True:
+            messages = list(db.chat_messages.find({"user_id": user_id, "timestamp": {"$lt": cutoff}})
+                            .sort("timestamp", ASCENDING).limit(segment_size))
+            if not messages:
+                break
+            self.write_segment(user_id, messages)
+            db.chat_messages.delete_many({"_id": {"$in": [message["_id"] for message in messages]}})
+            archived += len(messages)
+
+        cutoff_day = datetime(cutoff.year, cutoff.month, cutoff.day)
+        buckets = db.chat_buckets.find({"user_id": user_id, "bucket_start": {"$lt": cutoff_day}}) \
+            .sort("bucket_start", ASCENDING)
+        batch: List[Dict] = []
+
+        def flush():
+            messages = [message for bucket in batch for message in bucket.get("messages", [])]
+            if messages:
+                self.write_segment(user_id, messages)
+            db.chat_buckets.delete_many({"_id": {"$in": [bucket["_id"] for bucket in batch]}})
+            batch.clear()
+            return len(messages)
+
+        count = 0
+        for bucket in buckets:
+            batch.append(bucket)
+            count += bucket.get("count", 0)
+            if count >= segment_size:
+                archived += flush()
+                count = 0
+        if batch:
+            archived += flush()
+        return archived
+
+    def pending_users(self, cutoff: datetime) -> List[str]:
+        """Users with hot messages older than the cutoff"""
+        cutoff_day = datetime(cutoff.year, cutoff.month, cutoff.day)
+        users = set(self.db.chat_messages.distinct("user_id", {"timestamp": {"$lt": cutoff}}))
+        users.update(self.db.chat_buckets.distinct("user_id", {"bucket_start": {"$lt": cutoff_day}}))
+        return sorted(users)
+
+    def run(self, older_than_days: int = CHAT_ARCHIVE_AFTER_DAYS, dry_run: bool = False) -> Dict:
+        """Archive every user's messages older than `older_than_days`"""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        users = self.pending_users(cutoff)
+        if dry_run:
+            cutoff_day = datetime(cutoff.year, cutoff.month, cutoff.day)
+            messages = self.db.chat_messages.count_documents({"timestamp": {"$lt": cutoff}})
+            messages += sum(bucket.get("count", 0) for bucket in self.db.chat_buckets.find(
+                {"bucket_start": {"$lt": cutoff_day}}, {"count": 1}
+            ))
+            return {"cutoff": cutoff, "users": len(users), "messages": messages}
+
+        started = time.perf_counter()
+        archived = 0
+        for index, user_id in enumerate(users, 1):
+            archived += self.archive_user(user_id, cutoff)
+            if index % 100 == 0:
+                print(f"  {index}/{len(users)} users, {archived} messages archived")
+        return {"cutoff": cutoff, "users": len(users), "messages": archived,
+                "seconds": round(time.perf_counter() - started, 1)}
+
+    def delete_user(self, user_id: str) -> int:
+        """Delete a user's segment files and index; returns how many messages they held"""
+        segments = list(self.db.chat_archive_segments.find({"user_id": user_id}, {"key": 1, "count": 1}))
+        for segment in segments:
+            self.storage.delete(segment["key"])
+        self.cache.delete([segment["key"] for segment in segments])
+        self.db.chat_archive_segments.delete_many({"user_id": user_id})
+        return sum(segment.get("count", 0) for segment in segments)
+
+    def status(self) -> Dict:
+        totals = list(self.db.chat_archive_segments.aggregate([
+            {"$group": {"_id": None, "segments": {"$sum": 1}, "messages": {"$sum": "$count"},
+                        "bytes": {"$sum": "$bytes"}, "users": {"$addToSet": "$user_id"}}},
+            {"$project": {"_id": 0, "segments": 1, "messages": 1, "bytes": 1, "users": {"$size": "$users"}}}
+        ]))
+        return totals[0] if totals else {"segments": 0, "messages": 0, "bytes": 0, "users": 0}
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old AI chat messages to compressed segment files")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    run = subcommands.add_parser("run", help="archive messages older than the cutoff")
+    run.add_argument("--older-than-days", type=int, default=CHAT_ARCHIVE_AFTER_DAYS)
+    run.add_argument("--dry-run", action="store_true", help="count what would be archived without writing")
+    subcommands.add_parser("status", help="show archive totals")
+    args = parser.parse_args()
+
+    from database import db_service
+    if args.command == "status":
+        print(db_service.chat_archive.status())
+    else:
+        print(db_service.chat_archive.run(args.older_than_days, dry_run=args.dry_run))
+    db_service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Write-behind buffer for AI chat turns.
+
+/chat/ai saves two messages and, often, new personality insights. Rather
+than running those writes in the request, ChatWriteBuffer queues them and a
+background thread persists everything queued across requests in one
+insert_many/bulk_write per CHAT_WRITE_BATCH_SIZE records or per
+CHAT_WRITE_FLUSH_INTERVAL seconds, whichever comes first. Insights are
+coalesced per user (the latest wins) and chat versions are bumped once per
+user per batch.
+
+Buffered writes reach MongoDB a fraction of a second later. With
+CHAT_WRITE_WAL_DIR set they are first appended (and fsynced) to a local
+write-ahead log, replayed on the next start if the process dies before
+flushing. stop() flushes whatever is left. A batch that failed part way,
+or a log whose batch was saved just before a crash, may be written again;
+those writes pass resave=True, so bucketed chat storage skips the messages
+already saved instead of appending them twice.
+"""
+
+import fcntl
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bson import json_util
+
+from database import db_service
+from feed_service import feed_service
+
+# Set to 0 to write chat turns synchronously in the request
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "1").lower() in ("1", "true", "yes")
+# Buffered writes are flushed per this many records...
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200"))
+# ...or per this many seconds after the oldest one, whichever comes first
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.25"))
+# Requests wait (then write synchronously) when this many records are pending, e.g. while MongoDB is down
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000"))
+CHAT_WRITE_BACKPRESSURE_TIMEOUT = 5.0
+# Write-ahead log directory (one file per worker process); empty disables it
+CHAT_WRITE_WAL_DIR = os.getenv("CHAT_WRITE_WAL_DIR", "")
+CHAT_WRITE_WAL_FSYNC = os.getenv("CHAT_WRITE_WAL_FSYNC", "1").lower() in ("1", "true", "yes")
+
+WAL_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=False)
+
+class WriteAheadLog:
+    """
+    Append-only file of pending records, exclusively flock()ed while its
+    process is alive. Files nobody holds a lock on belong to a dead process
+    and are replayed by the next one to start.
+    """
+
+    def __init__(self, directory: Path, fsync: bool = CHAT_WRITE_WAL_FSYNC):
+        self.directory = directory
+        self.fsync = fsync
+        name = f"chat-{uuid.uuid4().hex}.wal"
+        self.path = directory / name
+        # Locked under a name orphaned() doesn't match, so no other process can
+        # take the new, still empty log for a dead one's and remove it
+        creating = directory / f"{name}.new"
+        self._file = open(creating, "ab")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(creating, self.path)
+
+    def append(self, record: Dict):
+        self._file.write(json_util.dumps(record, json_options=WAL_JSON_OPTIONS).encode("utf-8") + b"\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self, remove: bool):
+        if remove:
+            os.remove(self.path)
+        self._file.close()
+
+    @staticmethod
+    def orphaned(directory: Path) -> List[Tuple[Path, object]]:
+        """(path, locked open file) of every log left behind by a dead process"""
+        logs = []
+        for path in sorted(directory.glob("chat-*.wal")):
+            try:
+                handle = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            logs.append((path, handle))
+        return logs
+
+    @staticmethod
+    def read(handle) -> List[Dict]:
+        records = []
+        for line in handle:
+            try:
+                records.append(json_util.loads(line, json_options=WAL_JSON_OPTIONS))
+            except ValueError:
+                # A torn last line from a crash mid-append was never acknowledged
+                continue
+        return records
+
+class ChatWriteBuffer:
+    """Queues chat messages and insights and persists them in batches from a background thread"""
+
+    def __init__(self, db=db_service, on_insights_saved: Optional[Callable[[str], None]] = None,
+                 enabled: bool = CHAT_WRITE_BEHIND, batch_size: int = CHAT_WRITE_BATCH_SIZE,
+                 flush_interval: float = CHAT_WRITE_FLUSH_INTERVAL, max_pending: int = CHAT_WRITE_MAX_PENDING,
+                 wal_dir: str = CHAT_WRITE_WAL_DIR):
+        self.db = db
+        self.on_insights_saved = on_insights_saved
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.wal_dir = Path(wal_dir) if wal_dir else None
+        self._cond = threading.Condition()
+        self._pending: List[Dict] = []
+        self._writing: List[Dict] = []
+        self._oldest = 0.0
+        self._wal: Optional[WriteAheadLog] = None
+        self._sealed: List[WriteAheadLog] = []
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Replay logs left by crashed workers, then start the flush thread"""
+        if not self.enabled or self.running:
+            return
+        if self.wal_dir is not None:
+            self.wal_dir.mkdir(parents=True, exist_ok=True)
+            self._replay()
+            self._wal = WriteAheadLog(self.wal_dir)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush everything pending and stop the flush thread"""
+        if not self._thread:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._cond:
+            unsaved = len(self._pending) + len(self._writing)
+            if unsaved:
+                where = "left in the write-ahead log" if self._wal else "lost"
+                print(f"⚠️  {unsaved} buffered chat writes could not be saved ({where})")
+            # Logs of unsaved records stay on disk (unlocked) for the next start to replay
+            for wal in self._sealed:
+                wal.close(remove=not unsaved)
+            self._sealed = []
+            if self._wal:
+                self._wal.close(remove=not unsaved)
+                self._wal = None
+
+    def save_chat_message(self, user_id: str, message: str, sender: str, insights: Optional[Dict] = None) -> str:
+        """Same as DatabaseService.save_chat_message, but buffered while running"""
+        message_doc = self.db.new_chat_message(user_id, message, sender, insights)
+        if not self._append({"type": "message", "message": message_doc}):
+            self.db.save_chat_messages([message_doc])
+        return message_doc["_id"]
+
+    def save_personality_insights(self, user_id: str, insights: Dict):
+        """Same as DatabaseService.save_personality_insights, but buffered while running"""
+        record = {"type": "insights", "user_id": user_id, "insights": insights, "updated_at": datetime.utcnow()}
+        if not self._append(record):
+            self._write([record])
+
+    def pending_chat_messages(self, user_id: str) -> List[Dict]:
+        """A user's messages queued in this process but maybe not saved yet, oldest first"""
+        with self._cond:
+            return [
+                record["message"] for record in self._writing + self._pending
+                if record["type"] == "message" and record["message"]["user_id"] == user_id
+            ]
+
+    def get_recent_chat_messages(self, user_id: str, limit: int = 20) -> List[Dict]:
+        """DatabaseService.get_recent_chat_messages plus the user's messages still buffered here"""
+        # Pending first: a message saved in between is then in one of the two reads
+        pending = self.pending_chat_messages(user_id)
+        messages = self.db.get_recent_chat_messages(user_id, limit)
+        if pending:
+            saved = {message["_id"] for message in messages}
+            messages = (messages + [message for message in pending if message["_id"] not in saved])[-limit:]
+        return messages
+
+    def _append(self, record: Dict) -> bool:
+        """Queue a record; False when not running or still full after the backpressure timeout"""
+        if not self.running:
+            return False
+        with self._cond:
+            deadline = time.monotonic() + CHAT_WRITE_BACKPRESSURE_TIMEOUT
+            while len(self._pending) >= self.max_pending and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if self._stopping:
+                return False
+            if self._wal:
+                self._wal.append(record)
+            if not self._pending:
+                # Starts the flush interval
+                self._oldest = time.monotonic()
+                self._cond.notify_all()
+            self._pending.append(record)
+            if len(self._pending) == self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = self._oldest + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                records, self._pending = self._pending, []
+                self._writing = records
+                if self._wal:
+                    # Later records go to a fresh log; this one is removed once its records are saved
+                    self._sealed.append(self._wal)
+                    self._wal = WriteAheadLog(self.wal_dir)
+                self._cond.notify_all()
+            if not self._save(records):
+                return
+
+    def _save(self, records: List[Dict]) -> bool:
+        """Write a drained batch, retrying with backoff; False if it gave up because of stop()"""
+        delay = 0.5
+        resave = False
+        while True:
+            try:
+                self._write(records, resave=resave)
+                break
+            except Exception as e:
+                print(f"Error saving {len(records)} buffered chat writes: {e}")
+                if self._stopping:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                # Part of the batch may have been written
+                resave = True
+        with self._cond:
+            self._writing = []
+            for wal in self._sealed:
+                wal.close(remove=True)
+            self._sealed = []
+        return True
+
+    def _write(self, records: List[Dict], resave: bool = False):
+        messages = [record["message"] for record in records if record["type"] == "message"]
+        # Insights replace the previous ones, so only each user's latest is written
+        insights: Dict[str, Tuple[Dict, datetime]] = {}
+        for record in records:
+            if record["type"] == "insights":
+                insights[record["user_id"]] = (record["insights"], record["updated_at"])
+        for start in range(0, len(messages), self.batch_size):
+            self.db.save_chat_messages(messages[start:start + self.batch_size], resave=resave)
+        self.db.save_personality_insights_many(insights)
+        if self.on_insights_saved:
+            for user_id in insights:
+                self.on_insights_saved(user_id)
+
+    def _replay(self):
+        for path, handle in WriteAheadLog.orphaned(self.wal_dir):
+            try:
+                records = WriteAheadLog.read(handle)
+                if records:
+                    # The crash may have come after these were saved but before the log was removed
+                    self._write(records, resave=True)
+                    print(f"Replayed {len(records)} chat writes from {path.name}")
+                os.remove(path)
+            except Exception as e:
+                print(f"Error replaying {path}: {e}")
+            finally:
+                handle.close()
+
+# Global chat write buffer instance
+chat_writer = ChatWriteBuffer(on_insights_saved=feed_service.notify_changed)
@@ -0,0 +1,43 @@
+import hashlib
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+# Bump when a response shape changes, so clients don't keep a stale representation
+ETAG_FORMAT_VERSION = "1"
+
+def content_etag(user: Dict, *kinds: str, variant: Optional[str] = None) -> str:
+    """
+    Strong ETag for some of a user's content, from the per-kind versions
+    DatabaseService bumps after every write (user["content_versions"]).
+    The user document is already loaded for auth, so this costs no query.
+    `variant` distinguishes representations of the same content (e.g. fields=).
+    """
+    versions = user.get("content_versions") or {}
+    state = ":".join([ETAG_FORMAT_VERSION, str(user["_id"]), variant or ""] + [f"{kind}={versions.get(kind, 0)}" for kind in kinds])
+    return '"' + hashlib.blake2b(state.encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 specifies for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Encoded representations carry a suffix ("<etag>-gzip"), see ContentEncodingMiddleware
+        if tag == etag or tag.startswith(etag[:-1] + "-"):
+            return True
+    return False
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    # Clients may keep the response but must revalidate before reusing it
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,195 @@
+import gzip
+import json
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from fast_json import MSGPACK_MEDIA_TYPE, msgpack, packb, prefer_msgpack
+
+# brotli is optional; without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+    print("⚠️  brotli not available. Responses will only be gzip-compressed.")
+
+# Bodies smaller than this are sent as-is; compression overhead isn't worth it
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", MSGPACK_MEDIA_TYPE)
+
+def _quality_values(header: str) -> Dict[str, float]:
+    """Parse "gzip;q=0.8, br" style headers into {token: q}"""
+    values: Dict[str, float] = {}
+    for part in header.split(","):
+        token, *params = [piece.strip() for piece in part.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        values[token.lower()] = q
+    return values
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported content-coding the client accepts: br, then gzip"""
+    accepted = _quality_values(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def wants_msgpack(accept: str) -> bool:
+    """True when the client ranks a MessagePack type at least as high as JSON"""
+    if msgpack is None or not accept:
+        return False
+    accepted = _quality_values(accept)
+    msgpack_q = max((accepted.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES), default=0.0)
+    return msgpack_q > 0 and msgpack_q >= accepted.get("application/json", 0.0)
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class _StreamCompressor:
+    """Incremental gzip/brotli for streamed bodies (e.g. the NDJSON export)"""
+
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.coding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish() if self.coding == "br" else self._compressor.flush()
+
+class ContentEncodingMiddleware:
+    """
+    Negotiates response encodings for the whole app (pure ASGI, so streamed
+    responses and WebSockets pass through untouched where they should):
+
+    - Accept-Encoding: br or gzip for compressible types over
+      COMPRESSION_MIN_SIZE; streamed bodies are compressed incrementally.
+    - Accept: application/msgpack gets MessagePack. FastJSONResponse renders
+      it directly; other JSON responses are transcoded here.
+
+    Encoded responses get Vary and an encoding-suffixed ETag, since a strong
+    validator must differ between representations.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        coding = choose_encoding(request_headers.get("accept-encoding", ""))
+        msgpack_requested = wants_msgpack(request_headers.get("accept", ""))
+        if coding is None and not msgpack_requested:
+            await self.app(scope, receive, send)
+            return
+
+        token = prefer_msgpack.set(msgpack_requested)
+        start_message = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_encoded(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                content_type = headers.get("content-type", "")
+                encodable = (
+                    start_message["status"] not in (204, 304)
+                    and "content-encoding" not in headers
+                )
+                applied = []
+                reencoded = False
+
+                if encodable and msgpack_requested and not more_body and content_type.startswith("application/json"):
+                    try:
+                        body = packb(json.loads(body))
+                        reencoded = True
+                        headers["content-type"] = MSGPACK_MEDIA_TYPE
+                        content_type = MSGPACK_MEDIA_TYPE
+                        applied.append("msgpack")
+                    except ValueError:
+                        pass
+                elif content_type.startswith(MSGPACK_MEDIA_TYPE):
+                    applied.append("msgpack")
+
+                compressible = encodable and coding is not None and content_type.startswith(COMPRESSIBLE_TYPES)
+                if compressible and more_body:
+                    compressor = _StreamCompressor(coding)
+                    headers["content-encoding"] = coding
+                    del headers["content-length"]
+                    applied.append(coding)
+                    body = compressor.chunk(body)
+                elif compressible and len(body) >= self.minimum_size:
+                    body = compress(body, coding)
+                    reencoded = True
+                    headers["content-encoding"] = coding
+                    applied.append(coding)
+
+                if reencoded:
+                    headers["content-length"] = str(len(body))
+                if applied:
+                    headers.add_vary_header("Accept-Encoding")
+                    if msgpack_requested:
+                        headers.add_vary_header("Accept")
+                    etag = headers.get("etag")
+                    if etag and etag.endswith('"'):
+                        headers["etag"] = f'{etag[:-1]}-{"-".join(applied)}"'
+                elif coding is not None and encodable and content_type.startswith(COMPRESSIBLE_TYPES):
+                    headers.add_vary_header("Accept-Encoding")
+
+                await send(start_message)
+                start_message = None
+                passthrough = compressor is None
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            # Later chunks of a compressed stream
+            body = compressor.chunk(message.get("body", b""))
+            more_body = message.get("more_body", False)
+            if not more_body:
+                body += compressor.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        try:
+            await self.app(scope, receive, send_encoded)
+        finally:
+            prefer_msgpack.reset(token)
@@ -1,28 +1,208 @@
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import DuplicateKeyError
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateMany, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import List, Optional, Dict, Any, Callable, Iterable, Iterator, Set, Tuple
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
+import time
 from bson import ObjectId
 import uuid
 
+from profile_attributes import derive_filter_attributes
+from bloom import SeenFilter
+from metrics import MongoCommandMetrics
+from query_budget import QueryCountingListener
+from photo_storage import photo_storage
+from profile_cache import profile_cache, PROFILE_CACHE_KINDS
+from fieldsets import PROFILE_CHILDREN, apply_projection, projection_for, split_profile_fields
+from chat_archive import ChatArchive
+
+# Threads used to run account-deletion work concurrently
+DELETION_WORKERS = 8
+
+# Seen-profile Bloom filter sizing (first layer capacity and target error rate)
+SEEN_FILTER_CAPACITY = int(os.getenv("SEEN_FILTER_CAPACITY", "1000"))
+SEEN_FILTER_FP_RATE = float(os.getenv("SEEN_FILTER_FP_RATE", "0.01"))
+
+# Per-process connection pool settings. Each worker opens its own pool,
+# so the deployment holds up to (workers x MONGO_MAX_POOL_SIZE) connections.
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000")),
+}
+
+# Bump whenever _create_indexes changes so the next deployment rebuilds them once
+INDEX_VERSION = 5
+CREATE_INDEXES = os.getenv("MONGO_CREATE_INDEXES", "1").lower() in ("1", "true", "yes")
+# A worker that claimed an index build and stopped for this long is presumed dead
+INDEX_BUILD_LEASE_SECONDS = int(os.getenv("MONGO_INDEX_BUILD_LEASE_SECONDS", "600"))
+# Other workers wait this long for the build before failing to start
+INDEX_BUILD_WAIT_SECONDS = float(os.getenv("MONGO_INDEX_BUILD_WAIT_SECONDS", "900"))
+MONGO_DB = os.getenv("MONGO_DB", "dating_app")
+
+# Where a profile's photos and prompts live: "referenced" (their own collections)
+# or "embedded" (ordered arrays inside the profile document, see EmbeddedProfileDatabaseService)
+PROFILE_SCHEMA = os.getenv("PROFILE_SCHEMA", "referenced").lower()
+# Embedded arrays are bounded so a profile document stays small and cheap to rewrite
+MAX_PROFILE_PHOTOS = int(os.getenv("MAX_PROFILE_PHOTOS", "9"))
+MAX_PROFILE_PROMPTS = int(os.getenv("MAX_PROFILE_PROMPTS", "30"))
+
+# How AI chat messages are stored: "messages" (one document each) or "buckets"
+# (chat_buckets: one document per user holding up to CHAT_BUCKET_SIZE messages of one UTC day)
+CHAT_STORAGE = os.getenv("CHAT_STORAGE", "messages").lower()
+CHAT_BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", "100"))
+# How often bucketed reads re-check whether chat_messages still holds unmigrated messages
+LEGACY_CHAT_RECHECK_SECONDS = 60
+
 class DatabaseService:
-    def __init__(self):
-        MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
-        self.client = MongoClient(MONGO_URL)
-        self.db = self.client["dating_app"]
-        
-        # Collections
-        self.users = self.db["users"]
-        self.profiles = self.db["profiles"]
-        self.photos = self.db["photos"]
-        self.prompts = self.db["prompts"]
-        # Create missing collections for chat functionality
-        self.chat_messages = self.db["chat_messages"]
-        self.personality_insights = self.db["personality_insights"]
-        
-        # Create indexes for better performance
-        self._create_indexes()
+    """
+    MongoDB access for the app.
+
+    Constructing the service does not connect: the client is opened by
+    connect(), which the FastAPI lifespan calls in each worker after the
+    fork (scripts connect lazily on first collection access). A client
+    inherited across a fork is replaced rather than reused.
+    """
+
+    COLLECTIONS = (
+        "users", "profiles", "photos", "prompts",
+        # Chat functionality
+        "chat_messages", "personality_insights",
+        # AI chat messages grouped per user and day (CHAT_STORAGE=buckets)
+        "chat_buckets",
+        # Index of chat messages archived to compressed segment files (see chat_archive.py)
+        "chat_archive_segments",
+        # Precomputed discovery feeds, refreshed by the feed worker
+        "candidate_feeds",
+        # Checkpoints for resumable data migrations (see migrations.py)
+        "migrations",
+        # Swipe state: compact per-user seen filters; likes (legacy) is only purged,
+        # likes are now recorded in matches
+        "seen_filters", "likes",
+        # One document per user pair: who liked whom, matched once both have
+        "matches",
+        # Messages between matched users, partitioned by match_id
+        "messages",
+    )
+    
+    # Bounds on a profile's photos/prompts; the referenced layout has none
+    CHILD_LIMITS: Dict[str, int] = {}
+
+    def __init__(self, mongo_url: Optional[str] = None, client_options: Optional[Dict[str, Any]] = None,
+                 db_name: str = MONGO_DB, chat_storage: str = CHAT_STORAGE):
+        if chat_storage not in ("messages", "buckets"):
+            raise ValueError(f"Unknown CHAT_STORAGE {chat_storage!r}; expected messages or buckets")
+        self.mongo_url = mongo_url or os.getenv("MONGO_URL", "mongodb://localhost:27017/")
+        self.db_name = db_name
+        self.chat_storage = chat_storage
+        self._legacy_chat = True
+        self._legacy_chat_checked_at = float("-inf")
+        self.chat_archive = ChatArchive(self)
+        self.client_options = {**MONGO_CLIENT_OPTIONS, **(client_options or {})}
+        self.client = None
+        self.db = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def __getattr__(self, name: str):
+        # Only reached for attributes not set yet, i.e. collections before connect()
+        if name in DatabaseService.COLLECTIONS:
+            self.connect()
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+    
+    def connect(self, create_indexes: bool = CREATE_INDEXES) -> "DatabaseService":
+        """Open this process's client (idempotent) and make sure indexes exist"""
+        with self._lock:
+            if self.client is not None and self._pid == os.getpid():
+                return self
+            listeners = [MongoCommandMetrics(), QueryCountingListener()]
+            if self.mongo_url.startswith("mongomock://"):
+                # In-memory database for the load harness, tests and local experiments;
+                # it takes no event listeners, so its collections are wrapped to feed them
+                import mongomock
+                from mongomock_monitoring import monitor
+                monitor(listeners)
+                self.client = mongomock.MongoClient()
+            else:
+                self.client = MongoClient(self.mongo_url, event_listeners=listeners, **self.client_options)
+            self._pid = os.getpid()
+            self.db = self.client[self.db_name]
+            for name in self.COLLECTIONS:
+                setattr(self, name, self.db[name])
+        
+        if create_indexes:
+            self.ensure_indexes()
+        return self
+    
+    def ensure_indexes(self, force: bool = False, wait_seconds: float = INDEX_BUILD_WAIT_SECONDS) -> bool:
+        """
+        Build indexes once per INDEX_VERSION rather than once per worker.
+        The first process to claim the build (a lease in the migrations
+        collection) creates them and only then records the version; every
+        other worker waits until the version is recorded, so none serves
+        traffic before the unique and geo indexes exist. A builder that
+        crashed leaves its lease to expire and a waiting worker takes over.
+        Returns True if this process built them.
+        """
+        if force:
+            self._create_indexes()
+            self._record_index_version()
+            return True
+        
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            now = datetime.utcnow()
+            try:
+                self.migrations.find_one_and_update(
+                    {
+                        "_id": "indexes",
+                        "version": {"$ne": INDEX_VERSION},
+                        "$or": [{"building_version": {"$ne": INDEX_VERSION}}, {"building_until": {"$lt": now}}]
+                    },
+                    {"$set": {
+                        "building_version": INDEX_VERSION,
+                        "building_until": now + timedelta(seconds=INDEX_BUILD_LEASE_SECONDS)
+                    }},
+                    upsert=True
+                )
+                break
+            except DuplicateKeyError:
+                # Built already, or another worker is building this version
+                state = self.migrations.find_one({"_id": "indexes"}) or {}
+                if state.get("version") == INDEX_VERSION:
+                    return False
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"Timed out waiting for another worker to build indexes (version {INDEX_VERSION})")
+                time.sleep(1)
+        
+        try:
+            self._create_indexes()
+        except Exception:
+            # Let the next worker retry right away instead of after the lease
+            self.migrations.update_one(
+                {"_id": "indexes", "building_version": INDEX_VERSION},
+                {"$unset": {"building_version": "", "building_until": ""}}
+            )
+            raise
+        self._record_index_version()
+        return True
+    
+    def _record_index_version(self):
+        self.migrations.update_one(
+            {"_id": "indexes"},
+            {
+                "$set": {"version": INDEX_VERSION, "built_at": datetime.utcnow()},
+                "$unset": {"building_version": "", "building_until": ""}
+            },
+            upsert=True
+        )
     
     def _convert_objectid_to_str(self, doc: Dict) -> Dict:
         """Convert ObjectId to string in MongoDB document"""
@@ -40,11 +220,18 @@ class DatabaseService:
         self.profiles.create_index([("user_id", ASCENDING)], unique=True)
         self.profiles.create_index([("verification_status", ASCENDING)])
         self.profiles.create_index([("updated_at", DESCENDING)])
+        self.profiles.create_index([("location", "2dsphere")], sparse=True)
+        # Derived filter attributes: equality fields before the age range
+        self.profiles.create_index([("drinker", ASCENDING), ("has_kids", ASCENDING), ("age", ASCENDING)])
+        self.profiles.create_index([("age", ASCENDING), ("height_cm", ASCENDING)])
+        # Embedded photos/prompts (PROFILE_SCHEMA=embedded), found by id for positional updates
+        self.profiles.create_index([("photos._id", ASCENDING)], sparse=True)
+        self.profiles.create_index([("photos.id", ASCENDING)], sparse=True)
+        self.profiles.create_index([("prompts._id", ASCENDING)], sparse=True)
         
         # Photos collection indexes
-        self.photos.create_index([("user_id", ASCENDING)])
-        self.photos.create_index([("order", ASCENDING)])
-        self.photos.create_index([("is_primary", ASCENDING)])
+        # A user's photos in display order; the lowest order is the primary photo
+        self.photos.create_index([("user_id", ASCENDING), ("order", ASCENDING)])
         
         # Prompts collection indexes
         self.prompts.create_index([("user_id", ASCENDING)])
@@ -53,9 +240,59 @@ class DatabaseService:
         # Chat messages collection indexes
         self.chat_messages.create_index([("user_id", ASCENDING)])
         self.chat_messages.create_index([("timestamp", ASCENDING)])
+        # A user's chat buckets in order
+        self.chat_buckets.create_index([("user_id", ASCENDING), ("bucket_start", ASCENDING)])
+        # A user's archived segments in order
+        self.chat_archive_segments.create_index([("user_id", ASCENDING), ("start", ASCENDING)])
         
         # Personality insights collection indexes
         self.personality_insights.create_index([("user_id", ASCENDING)], unique=True)
+        
+        # Candidate feeds collection indexes
+        self.candidate_feeds.create_index([("user_id", ASCENDING)], unique=True)
+        self.candidate_feeds.create_index([("candidates.user_id", ASCENDING)])
+        
+        # Swipe collections indexes
+        self.seen_filters.create_index([("user_id", ASCENDING)], unique=True)
+        
+        # Matches collection indexes (keyset pagination over a user's matches)
+        self.matches.create_index([("users", ASCENDING), ("matched_at", DESCENDING), ("_id", DESCENDING)])
+        
+        # Messages collection indexes
+        self.messages.create_index([("match_id", ASCENDING), ("sent_at", DESCENDING)])
+    
+    def filter_attribute_update(self, essential_details: Optional[List[Dict]]) -> Dict[str, Dict]:
+        """Build $set/$unset for the typed fields derived from essential_details"""
+        attributes = derive_filter_attributes(essential_details)
+        update: Dict[str, Dict] = {}
+        to_set = {field: value for field, value in attributes.items() if value is not None}
+        to_unset = {field: "" for field, value in attributes.items() if value is None}
+        if to_set:
+            update["$set"] = to_set
+        if to_unset:
+            update["$unset"] = to_unset
+        return update
+    
+    def _content_changed(self, user_id: Optional[str], *kinds: str):
+        """
+        Record a write to some of a user's content: bump its per-kind version
+        (the source of ETags) after the write, and drop cached profile data.
+        """
+        if not user_id:
+            return
+        self.users.update_one({"_id": user_id}, {"$inc": {f"content_versions.{kind}": 1 for kind in kinds}})
+        if any(kind in PROFILE_CACHE_KINDS for kind in kinds):
+            profile_cache.invalidate(user_id)
+    
+    def contents_changed(self, user_ids: Iterable[str], *kinds: str):
+        """_content_changed for many users at once (bulk writes such as migrations)"""
+        user_ids = [user_id for user_id in set(user_ids) if user_id]
+        if not user_ids:
+            return
+        self.users.update_many({"_id": {"$in": user_ids}}, {"$inc": {f"content_versions.{kind}": 1 for kind in kinds}})
+        if any(kind in PROFILE_CACHE_KINDS for kind in kinds):
+            for user_id in user_ids:
+                profile_cache.invalidate(user_id)
     
     def create_user(self, email: str, hashed_password: str) -> str:
         """Create a new user and return user_id"""
@@ -75,13 +312,13 @@ class DatabaseService:
             raise ValueError("Email already exists")
     
     def get_user_by_email(self, email: str) -> Optional[Dict]:
-        """Get user by email"""
-        user = self.users.find_one({"email": email})
+        """Get user by email (accounts pending deletion are treated as gone)"""
+        user = self.users.find_one({"email": email, "deleted_at": {"$exists": False}})
         return self._convert_objectid_to_str(user) if user else None
     
     def get_user_by_id(self, user_id: str) -> Optional[Dict]:
-        """Get user by ID"""
-        user = self.users.find_one({"_id": user_id})
+        """Get user by ID (accounts pending deletion are treated as gone)"""
+        user = self.users.find_one({"_id": user_id, "deleted_at": {"$exists": False}})
         return self._convert_objectid_to_str(user) if user else None
     
     def create_profile(self, user_id: str, profile_data: Dict) -> str:
@@ -95,107 +332,213 @@ class DatabaseService:
             "updated_at": datetime.utcnow()
         }
         
-        self.profiles.insert_one(profile_doc)
+        attributes = derive_filter_attributes(profile_data.get("essential_details"))
+        profile_doc.update({field: value for field, value in attributes.items() if value is not None})
+        
+        try:
+            self.profiles.insert_one(profile_doc)
+        except DuplicateKeyError:
+            raise ValueError("Profile already exists")
+        self._content_changed(user_id, "profile")
         return profile_id
     
     def update_profile(self, user_id: str, update_data: Dict) -> bool:
         """Update user profile"""
         update_data["updated_at"] = datetime.utcnow()
+        update: Dict[str, Any] = {"$set": update_data}
+        
+        # Keep the indexed filter attributes in sync with essential_details
+        if "essential_details" in update_data:
+            derived = self.filter_attribute_update(update_data["essential_details"])
+            update_data.update(derived.get("$set", {}))
+            if "$unset" in derived:
+                update["$unset"] = derived["$unset"]
+        
         result = self.profiles.update_one(
             {"user_id": user_id},
-            {"$set": update_data}
+            update
         )
+        self._content_changed(user_id, "profile")
         return result.modified_count > 0
     
-    def get_profile(self, user_id: str) -> Optional[Dict]:
-        """Get user profile with photos and prompts"""
-        profile = self.profiles.find_one({"user_id": user_id})
+    def get_profile(self, user_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Get user profile with photos and prompts. The full default shape is
+        served from the profile cache; a fields= selection ("name",
+        "photos.url", ...) is read with Mongo projections instead, and
+        photos/prompts are only queried when selected.
+        """
+        if fields is None:
+            own = None
+            children: Dict[str, Optional[List[str]]] = {"photos": None, "prompts": None}
+        else:
+            own, children = split_profile_fields(fields)
+        profile = self.get_profile_document(user_id, own)
         if not profile:
             return None
         
-        # Convert ObjectId to string
-        profile = self._convert_objectid_to_str(profile)
-        
-        # Get user photos
-        photos = self.get_user_photos(user_id)
-        photos = [self._convert_objectid_to_str(photo) for photo in photos]
-        
-        # Get user prompts
-        prompts = self.get_user_prompts(user_id)
-        prompts = [self._convert_objectid_to_str(prompt) for prompt in prompts]
-        
         # Add photos and prompts to profile
-        profile["photos"] = photos
-        profile["prompts"] = prompts
+        if "photos" in children:
+            profile["photos"] = self.get_user_photos(user_id, children["photos"])
+        if "prompts" in children:
+            profile["prompts"] = self.get_user_prompts(user_id, children["prompts"])
         
         return profile
     
+    def get_profile_document(self, user_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """The profile document alone, without photos and prompts (cached unless fields are selected)"""
+        def load():
+            profile = self.profiles.find_one({"user_id": user_id}, projection_for("profiles", fields))
+            return self._convert_objectid_to_str(profile) if profile else None
+        if fields is not None:
+            return load()
+        return profile_cache.get("profile", user_id, load)
+    
+    def _next_photo_seq(self, user_id: str) -> int:
+        """Atomically take the next value of the user's photo order counter"""
+        user = self.users.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"photo_seq": 1}},
+            projection={"photo_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return user["photo_seq"] if user else 1
+    
     def add_photo(self, user_id: str, photo_data: Dict) -> str:
-        """Add a new photo for user"""
+        """
+        Add a new photo for user. It goes to the end of the user's photos, or
+        to the front (becoming primary) when is_primary is set.
+        """
         photo_id = str(uuid.uuid4())
+        photo_data = dict(photo_data)
+        seq = self._next_photo_seq(user_id)
         photo_doc = {
             "_id": photo_id,
             "user_id": user_id,
             **photo_data,
+            "order": -seq if photo_data.pop("is_primary", False) else seq,
             "created_at": datetime.utcnow()
         }
-        
-        # If this is the first photo, make it primary
-        if photo_data.get("is_primary", False):
-            self.photos.update_many(
-                {"user_id": user_id},
-                {"$set": {"is_primary": False}}
-            )
+        photo_doc.pop("is_primary", None)
         
         self.photos.insert_one(photo_doc)
+        self._content_changed(user_id, "photos")
         return photo_id
     
-    def update_photo(self, photo_id: str, update_data: Dict) -> bool:
-        """Update photo data"""
+    def set_primary_photo(self, user_id: str, photo_id: str) -> bool:
+        """
+        Make a photo primary by moving it in front of all the user's photos.
+        Counter values only grow, so -seq sorts before every existing order
+        and concurrent calls resolve to whichever took the counter last.
+        """
+        seq = self._next_photo_seq(user_id)
         result = self.photos.update_one(
-            {"_id": photo_id},
-            {"$set": update_data}
+            {"user_id": user_id, "$or": [{"_id": photo_id}, {"id": photo_id}]},
+            {"$set": {"order": -seq}}
         )
-        return result.modified_count > 0
+        self._content_changed(user_id, "photos")
+        return result.matched_count > 0
     
-    def delete_photo(self, photo_id: str) -> bool:
-        """Delete a photo"""
-        import os
-        from pathlib import Path
-        
-        # Try to delete by _id first, then by id field
-        photo = self.photos.find_one({"_id": photo_id})
-        if not photo:
-            # If not found by _id, try by id field
-            photo = self.photos.find_one({"id": photo_id})
+    def reorder_photos(self, user_id: str, photo_ids: List[str]) -> bool:
+        """
+        Apply a complete new ordering (first = primary) in one bulk_write.
+        Returns False unless photo_ids names exactly the user's photos.
+        """
+        photos = list(self.photos.find({"user_id": user_id}, {"_id": 1, "id": 1}))
+        ordered = self._resolve_photo_order(photos, photo_ids)
+        if ordered is None:
+            return False
         
-        if photo:
-            # Delete the physical file
+        operations = [
+            UpdateOne({"_id": _id, "user_id": user_id}, {"$set": {"order": order}})
+            for order, _id in enumerate(ordered)
+        ]
+        if operations:
+            self.photos.bulk_write(operations, ordered=False)
+            # Keep the counter ahead of the dense orders so later uploads still append
+            self.users.update_one({"_id": user_id}, {"$max": {"photo_seq": len(operations)}})
+            self._content_changed(user_id, "photos")
+        return True
+    
+    def _resolve_photo_order(self, photos: List[Dict], photo_ids: List[str]) -> Optional[List[str]]:
+        """Map a requested ordering (by _id or id) to photo _ids; None unless it names each photo exactly once"""
+        by_id = {}
+        for photo in photos:
+            by_id[photo["_id"]] = photo["_id"]
+            if photo.get("id"):
+                by_id[photo["id"]] = photo["_id"]
+        ordered = [by_id.get(photo_id) for photo_id in photo_ids]
+        if None in ordered or len(set(ordered)) != len(photos) or len(ordered) != len(photos):
+            return None
+        return ordered
+    
+    def _mark_primary(self, photos: List[Dict]) -> List[Dict]:
+        """Flag the first photo of an ordered list as primary"""
+        for index, photo in enumerate(photos):
+            photo["is_primary"] = index == 0
+        return photos
+    
+    def update_photo(self, user_id: str, photo_id: str, update_data: Dict) -> bool:
+        """Update one of the user's photos; False when they have no such photo"""
+        result = self.photos.update_one(
+            {"user_id": user_id, "$or": [{"_id": photo_id}, {"id": photo_id}]},
+            {"$set": update_data}
+        )
+        if result.matched_count == 0:
+            return False
+        self._content_changed(user_id, "photos")
+        return True
+    
+    def remove_photo_files(self, photos: List[Dict]) -> int:
+        """Delete the stored files behind several photos in parallel, returning how many were removed"""
+        def remove(key: str) -> int:
             try:
-                # Extract filename from URL or use photo_id
-                filename = f"{photo.get('id', photo_id)}.jpg"
-                file_path = Path("uploads") / filename
-                
-                if file_path.exists():
-                    os.remove(file_path)
-                    print(f"Deleted physical file: {file_path}")
+                return int(photo_storage.delete(key))
             except Exception as e:
-                print(f"Error deleting physical file: {e}")
-            
-            # Delete from database
-            result = self.photos.delete_one({"_id": photo["_id"]})
-            return result.deleted_count > 0
+                print(f"Error deleting photo file {key}: {e}")
+                return 0
         
-        return False
+        keys = [photo_storage.key_for(photo) for photo in photos]
+        if not keys:
+            return 0
+        with ThreadPoolExecutor(max_workers=DELETION_WORKERS) as executor:
+            return sum(executor.map(remove, keys))
     
-    def get_user_photos(self, user_id: str) -> List[Dict]:
-        """Get all photos for a user, ordered by order field"""
-        photos = list(self.photos.find(
-            {"user_id": user_id}
-        ).sort("order", ASCENDING))
-        
-        # Convert ObjectIds to strings
-        return [self._convert_objectid_to_str(photo) for photo in photos]
+    def _delete_photo_file(self, photo: Dict):
+        """Delete the stored file behind one photo"""
+        try:
+            key = photo_storage.key_for(photo)
+            if photo_storage.delete(key):
+                print(f"Deleted photo file: {key}")
+        except Exception as e:
+            print(f"Error deleting photo file: {e}")
+    
+    def delete_photo(self, user_id: str, photo_id: str) -> bool:
+        """Delete one of the user's photos (by _id or id) and its file; False when they have no such photo"""
+        photo = self.photos.find_one_and_delete({"user_id": user_id, "$or": [{"_id": photo_id}, {"id": photo_id}]})
+        if not photo:
+            return False
+        self._delete_photo_file(photo)
+        self._content_changed(user_id, "photos")
+        return True
+    
+    def get_user_photos(self, user_id: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all photos for a user, ordered by order field (optionally only some fields)"""
+        def load():
+            photos = list(self.photos.find(
+                {"user_id": user_id},
+                projection_for("photos", fields)
+            ).sort("order", ASCENDING))
+            
+            # Convert ObjectIds to strings
+            photos = self._mark_primary([self._convert_objectid_to_str(photo) for photo in photos])
+            if fields is not None and "is_primary" not in fields:
+                for photo in photos:
+                    del photo["is_primary"]
+            return photos
+        if fields is not None:
+            return load()
+        return profile_cache.get("photos", user_id, load)
     
     def add_prompt(self, user_id: str, prompt_data: Dict) -> str:
         """Add a new prompt for user"""
@@ -208,104 +551,785 @@ class DatabaseService:
         }
         
         self.prompts.insert_one(prompt_doc)
+        self._content_changed(user_id, "prompts")
         return prompt_id
     
+    def add_prompts(self, user_id: str, prompts: List[Dict]) -> List[str]:
+        """Add several prompts for user in one round trip"""
+        if not prompts:
+            return []
+        prompt_docs = [
+            {
+                "_id": str(uuid.uuid4()),
+                "user_id": user_id,
+                **prompt_data,
+                "created_at": datetime.utcnow()
+            }
+            for prompt_data in prompts
+        ]
+        self.prompts.insert_many(prompt_docs)
+        self._content_changed(user_id, "prompts")
+        return [doc["_id"] for doc in prompt_docs]
+    
     def update_prompt(self, prompt_id: str, update_data: Dict) -> bool:
         """Update prompt data"""
-        result = self.prompts.update_one(
+        prompt = self.prompts.find_one_and_update(
             {"_id": prompt_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"user_id": 1}
         )
-        return result.modified_count > 0
+        if not prompt:
+            return False
+        self._content_changed(prompt.get("user_id"), "prompts")
+        return True
     
-    def get_user_prompts(self, user_id: str) -> List[Dict]:
-        """Get all prompts for a user, ordered by order field"""
-        prompts = list(self.prompts.find(
-            {"user_id": user_id}
-        ).sort("order", ASCENDING))
-        
-        # Convert ObjectIds to strings
-        return [self._convert_objectid_to_str(prompt) for prompt in prompts]
+    def get_user_prompts(self, user_id: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all prompts for a user, ordered by order field (optionally only some fields)"""
+        def load():
+            prompts = list(self.prompts.find(
+                {"user_id": user_id},
+                projection_for("prompts", fields)
+            ).sort("order", ASCENDING))
+            
+            # Convert ObjectIds to strings
+            return [self._convert_objectid_to_str(prompt) for prompt in prompts]
+        if fields is not None:
+            return load()
+        return profile_cache.get("prompts", user_id, load)
     
-    def get_profiles_for_matching(self, limit: int = 50, skip: int = 0) -> List[Dict]:
-        """Get profiles for matching algorithm (optimized query)"""
-        pipeline = [
-            {"$match": {"is_active": True}},
-            {"$lookup": {
-                "from": "profiles",
-                "localField": "_id",
-                "foreignField": "user_id",
-                "as": "profile"
+    def get_profiles_for_matching(
+        self,
+        limit: int = 50,
+        skip: int = 0,
+        near: Optional[Dict] = None,
+        radius_km: Optional[float] = None,
+        filters: Optional[Dict] = None,
+        seen: Optional[SeenFilter] = None,
+        exclude_user_id: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Get profiles for matching algorithm (optimized query).
+        
+        The pipeline starts from profiles so that a radius filter around
+        `near` (a GeoJSON point) runs as a 2dsphere index scan via $geoNear,
+        nearest first, before any $lookup. `filters` is a query over the
+        derived attributes (see profile_attributes.build_attribute_filter).
+        `exclude_user_id` (the searcher) is dropped in the query itself, so
+        pages stay `limit` long.
+        
+        When a `seen` filter is given, already-swiped profiles are dropped as
+        the cursor streams back instead of with an ever-growing $nin list.
+        """
+        pipeline: List[Dict] = []
+        query = dict(filters or {})
+        if exclude_user_id is not None:
+            query["user_id"] = {"$ne": exclude_user_id}
+        if near is not None:
+            geo_near: Dict[str, Any] = {
+                "near": near,
+                "key": "location",
+                "distanceField": "distance_km",
+                "distanceMultiplier": 0.001,
+                "spherical": True
+            }
+            if radius_km is not None:
+                geo_near["maxDistance"] = radius_km * 1000
+            if query:
+                geo_near["query"] = query
+            pipeline.append({"$geoNear": geo_near})
+        elif query:
+            pipeline.append({"$match": query})
+        
+        pipeline += [
+            {"$project": {
+                "_id": "$user_id",
+                "distance_km": 1,
+                "profile": "$$ROOT"
             }},
-            {"$unwind": "$profile"},
             {"$lookup": {
-                "from": "photos",
+                "from": "users",
                 "localField": "_id",
-                "foreignField": "user_id",
-                "as": "photos"
+                "foreignField": "_id",
+                "as": "user"
             }},
+            {"$unwind": "$user"},
+            {"$match": {"user.is_active": True}},
+        ]
+        if seen is None:
+            pipeline += [{"$skip": skip}, {"$limit": limit}]
+        pipeline += self._primary_photo_stages() + [
             {"$project": {
                 "user_id": "$_id",
-                "email": 1,
+                "email": "$user.email",
+                "distance_km": 1,
                 "profile": 1,
-                "photos": {"$slice": ["$photos", 1]}  # Only get primary photo
+                "photos": 1
             }},
-            {"$skip": skip},
-            {"$limit": limit}
+            # Stale creation-time copies; photos come from their own collection
+            {"$unset": ["profile.photos", "profile.prompts"]}
         ]
         
-        return list(self.users.aggregate(pipeline))
+        if seen is None:
+            return list(self.profiles.aggregate(pipeline))
+        
+        results = []
+        unseen = 0
+        for match in self.profiles.aggregate(pipeline, batchSize=max(limit * 2, 20)):
+            if match["user_id"] in seen:
+                continue
+            unseen += 1
+            if unseen <= skip:
+                continue
+            results.append(match)
+            if len(results) >= limit:
+                break
+        return results
     
-    def close(self):
-        """Close database connection"""
-        self.client.close()
-
-    def update_photo_urls_to_localhost(self):
-        """Update existing photo URLs to use localhost instead of placeholder URLs"""
-        try:
-            # Find all photos with placeholder URLs
-            placeholder_photos = self.photos.find({
-                "url": {"$regex": "^https://storage\\.example\\.com/"}
-            })
+    def _primary_photo_stages(self) -> List[Dict]:
+        """Matching pipeline stages that set `photos` to just the primary photo"""
+        return [
+            # Read off the (user_id, order) index
+            {"$lookup": {
+                "from": "photos",
+                "let": {"user_id": "$_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$user_id", "$$user_id"]}}},
+                    {"$sort": {"order": 1}},
+                    {"$limit": 1},
+                    {"$set": {"is_primary": True}}
+                ],
+                "as": "photos"
+            }}
+        ]
+    
+    def get_seen_filter(self, user_id: str) -> SeenFilter:
+        """Get a user's seen-profile filter (empty if they haven't swiped yet)"""
+        doc = self.seen_filters.find_one({"user_id": user_id})
+        if not doc:
+            return SeenFilter(SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE)
+        return SeenFilter.from_document(doc["filter"])
+    
+    def mark_seen(self, user_id: str, target_user_id: str, max_retries: int = 5) -> bool:
+        """
+        Atomically add target_user_id to user_id's seen filter.
+        
+        Only the bit words the add changed are written, each guarded by its
+        previous value, so concurrent swipes from the same user never
+        overwrite each other's bits (a conflicting swipe re-reads and
+        retries). A full layer grows the filter with a $push guarded by the
+        layer count. Returns False if the filter already (probably)
+        contained the target.
+        """
+        for _ in range(max_retries):
+            doc = self.seen_filters.find_one({"user_id": user_id})
+            seen = SeenFilter.from_document(doc["filter"]) if doc else SeenFilter(SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE)
+            if not seen.add(target_user_id):
+                return False
             
-            for photo in placeholder_photos:
-                # Extract the photo ID from the placeholder URL
-                photo_id = photo["id"]
-                # Create new localhost URL
-                new_url = f"http://localhost:8001/uploads/{photo_id}.jpg"
-                
-                # Update the photo URL
-                self.photos.update_one(
-                    {"_id": photo["_id"]},
-                    {"$set": {"url": new_url}}
-                )
-                print(f"Updated photo {photo_id} URL to {new_url}")
-                
-        except Exception as e:
-            print(f"Error updating photo URLs: {e}")
+            if doc is None:
+                try:
+                    self.seen_filters.insert_one({
+                        "_id": str(uuid.uuid4()),
+                        "user_id": user_id,
+                        "filter": seen.to_document(),
+                        "updated_at": datetime.utcnow()
+                    })
+                    return True
+                except DuplicateKeyError:
+                    continue
+            
+            stored_layers = doc["filter"]["layers"]
+            query: Dict[str, Any] = {"_id": doc["_id"]}
+            if any("words" not in layer for layer in stored_layers):
+                # Saved before the word layout: rewrite it once as words
+                query["filter.layers.words"] = {"$exists": False}
+                update: Dict[str, Any] = {"$set": {"filter": seen.to_document()}}
+            elif len(seen.layers) > len(stored_layers):
+                query["filter.layers"] = {"$size": len(stored_layers)}
+                update = {"$push": {"filter.layers": seen.layers[-1].to_document()}}
+            else:
+                index = len(seen.layers) - 1
+                layer, stored_words = seen.layers[index], stored_layers[index]["words"]
+                path = f"filter.layers.{index}"
+                update = {"$set": {}, "$inc": {f"{path}.count": 1}}
+                for word in layer.dirty_words:
+                    query[f"{path}.words.{word}"] = stored_words[word]
+                    update["$set"][f"{path}.words.{word}"] = layer.word(word)
+            update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+            
+            if self.seen_filters.update_one(query, update).modified_count:
+                return True
+        raise RuntimeError(f"Could not update seen filter for {user_id} after {max_retries} attempts")
+    
+    def has_liked(self, from_user: str, to_user: str) -> bool:
+        """Exact check for a like (the seen filter can return false positives)"""
+        match_id = ":".join(sorted([from_user, to_user]))
+        return self.matches.count_documents({"_id": match_id, "liked_by": from_user}, limit=1) > 0
+    
+    def like_user(self, from_user: str, to_user: str) -> Dict[str, Any]:
+        """
+        Record a like and detect a mutual match atomically, in one round trip.
+        
+        The pair's match document holds the like itself: a single
+        findOneAndUpdate upserts it, adds the liker to `liked_by` and stamps
+        `matched_at` once both users are in it. Document-level atomicity
+        serializes two users liking each other at the same moment, so
+        exactly one of them sees the match being created.
+        """
+        match_id = ":".join(sorted([from_user, to_user]))
+        now = datetime.utcnow()
+        before = self.matches.find_one_and_update(
+            {"_id": match_id},
+            [
+                {"$set": {
+                    "users": {"$ifNull": ["$users", sorted([from_user, to_user])]},
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "liked_by": {"$setUnion": [{"$ifNull": ["$liked_by", []]}, [from_user]]}
+                }},
+                {"$set": {
+                    "matched_at": {"$cond": [
+                        {"$eq": [{"$size": "$liked_by"}, 2]},
+                        {"$ifNull": ["$matched_at", now]},
+                        "$matched_at"
+                    ]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        previous_likers = (before or {}).get("liked_by", [])
+        new_match = to_user in previous_likers and from_user not in previous_likers
+        return {
+            "new_like": from_user not in previous_likers,
+            "matched": to_user in previous_likers,
+            "new_match": new_match,
+            "match_id": match_id
+        }
+    
+    def get_user_matches(self, user_id: str, limit: int = 20, cursor: Optional[Dict] = None) -> List[Dict]:
+        """
+        Get a page of a user's matches, newest first.
+        
+        `cursor` is the (matched_at, _id) of the last match on the previous
+        page; paging seeks past it on the index instead of using $skip.
+        """
+        query: Dict[str, Any] = {"users": user_id, "matched_at": {"$exists": True}}
+        if cursor:
+            query["$or"] = [
+                {"matched_at": {"$lt": cursor["matched_at"]}},
+                {"matched_at": cursor["matched_at"], "_id": {"$lt": cursor["_id"]}}
+            ]
+        matches = self.matches.find(query).sort(
+            [("matched_at", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit)
+        return list(matches)
+    
+    def get_match(self, match_id: str, user_id: str) -> Optional[Dict]:
+        """Get a mutual match the user belongs to"""
+        return self.matches.find_one({
+            "_id": match_id,
+            "users": user_id,
+            "matched_at": {"$exists": True}
+        })
+    
+    def save_messages(self, messages: List[Dict]) -> int:
+        """Insert a batch of match messages in one round trip (messages saved by an earlier attempt are skipped)"""
+        if not messages:
+            return 0
+        try:
+            return len(self.messages.insert_many(messages, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nInserted", 0)
+    
+    def get_match_messages(self, match_id: str, limit: int = 50, before: Optional[datetime] = None) -> List[Dict]:
+        """Get the latest messages in a match conversation, oldest first"""
+        query: Dict[str, Any] = {"match_id": match_id}
+        if before is not None:
+            query["sent_at"] = {"$lt": before}
+        messages = list(self.messages.find(query).sort("sent_at", DESCENDING).limit(limit))
+        messages.reverse()
+        return messages
+    
+    def delete_user_swipes(self, user_id: str) -> int:
+        """
+        Delete a user's seen filter, match messages and the match documents
+        holding every like they sent or received; returns how many of those
+        """
+        self.seen_filters.delete_one({"user_id": user_id})
+        match_ids = self.matches.distinct("_id", {"users": user_id})
+        if match_ids:
+            self.messages.delete_many({"match_id": {"$in": match_ids}})
+        result = self.matches.delete_many({"users": user_id})
+        # Likes saved before they moved into matches; the collection is no longer written
+        # (or indexed, beyond what older deployments already built), so skip it once empty
+        if self.likes.find_one({}, {"_id": 1}) is not None:
+            self.likes.delete_many({"$or": [{"from_user": user_id}, {"to_user": user_id}]})
+        return result.deleted_count
+    
+    def get_profiles(self, user_ids: List[str]) -> List[Dict]:
+        """Get several profiles with photos and prompts, preserving the order of user_ids"""
+        if not user_ids:
+            return []
+        
+        profiles = {
+            profile["user_id"]: self._convert_objectid_to_str(profile)
+            for profile in self.profiles.find({"user_id": {"$in": user_ids}}, projection_for("profiles", None))
+        }
+        for profile in profiles.values():
+            profile["photos"] = []
+            profile["prompts"] = []
+        
+        # One query per child collection instead of one per profile
+        for photo in self.photos.find({"user_id": {"$in": list(profiles)}}).sort("order", ASCENDING):
+            profiles[photo["user_id"]]["photos"].append(self._convert_objectid_to_str(photo))
+        for prompt in self.prompts.find({"user_id": {"$in": list(profiles)}}).sort("order", ASCENDING):
+            profiles[prompt["user_id"]]["prompts"].append(self._convert_objectid_to_str(prompt))
+        for profile in profiles.values():
+            self._mark_primary(profile["photos"])
+        
+        return [profiles[user_id] for user_id in user_ids if user_id in profiles]
+    
+    def get_matching_snapshots(self, user_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Get the fields the feed scorer and pool need for active users with a profile"""
+        user_filter: Dict[str, Any] = {"is_active": True}
+        if user_ids is not None:
+            user_filter["_id"] = {"$in": user_ids}
+        active_ids = [user["_id"] for user in self.users.find(user_filter, {"_id": 1})]
+        if not active_ids:
+            return []
+        
+        snapshots = {
+            profile["user_id"]: {
+                "user_id": profile["user_id"],
+                "location": profile.get("location"),
+                "insights": {},
+                "has_photo": False
+            }
+            for profile in self.profiles.find({"user_id": {"$in": active_ids}}, {"user_id": 1, "location": 1})
+        }
+        for insight in self.personality_insights.find(
+            {"user_id": {"$in": list(snapshots)}}, {"user_id": 1, "insights": 1}
+        ):
+            snapshots[insight["user_id"]]["insights"] = insight.get("insights") or {}
+        for user_id in self._users_with_photos(list(snapshots)):
+            snapshots[user_id]["has_photo"] = True
+        
+        return list(snapshots.values())
+    
+    def get_feed_pool(self, user_id: str, location: Optional[Dict], radius_km: float, limit: int) -> List[str]:
+        """
+        The users a change to user_id's profile can matter to, and who can be
+        in its feed: up to `limit` profiles within radius_km of `location`,
+        nearest first (a 2dsphere index scan), or the most recently updated
+        profiles when user_id has no location.
+        """
+        query: Dict[str, Any] = {"user_id": {"$ne": user_id}}
+        if location is not None:
+            nearby = {**query, "location": {"$nearSphere": {"$geometry": location, "$maxDistance": radius_km * 1000}}}
+            try:
+                return [profile["user_id"] for profile in self.profiles.find(nearby, {"user_id": 1}).limit(limit)]
+            except NotImplementedError:
+                # mongomock has no geo operators; the load harness gets the recency pool
+                pass
+        return [
+            profile["user_id"]
+            for profile in self.profiles.find(query, {"user_id": 1}).sort("updated_at", DESCENDING).limit(limit)
+        ]
+    
+    def get_feeds_containing(self, candidate_id: str) -> List[str]:
+        """Owners of the candidate feeds that list candidate_id"""
+        return self.candidate_feeds.distinct("user_id", {"candidates.user_id": candidate_id})
+    
+    def _users_with_photos(self, user_ids: List[str]) -> List[str]:
+        """Which of these users have at least one photo"""
+        return self.photos.distinct("user_id", {"user_id": {"$in": user_ids}})
+    
+    def embedded_children(self, user_id: str) -> Dict[str, List[Dict]]:
+        """A user's photos and prompts read from their collections, shaped as embedded arrays"""
+        return {
+            child: [
+                {field: value for field, value in document.items() if field != "user_id"}
+                for document in getattr(self, child).find({"user_id": user_id}).sort("order", ASCENDING)
+            ]
+            for child in PROFILE_CHILDREN
+        }
+    
+    def drop_referenced_children(self, embedded: Iterable[Dict]):
+        """
+        Delete the collection copies of the photos/prompts in these embedded
+        arrays (profile documents or embedded_children() results). Only
+        those _ids: a child inserted after the arrays were copied stays.
+        """
+        embedded = list(embedded)
+        for child in PROFILE_CHILDREN:
+            child_ids = [item["_id"] for arrays in embedded for item in arrays.get(child) or []]
+            if child_ids:
+                getattr(self, child).delete_many({"_id": {"$in": child_ids}})
+    
+    def get_candidate_feed(self, user_id: str, limit: int = 20, skip: int = 0) -> Optional[Dict]:
+        """Get a page of a user's precomputed candidate feed"""
+        return self.candidate_feeds.find_one(
+            {"user_id": user_id},
+            {"candidates": {"$slice": [skip, limit]}, "refreshed_at": 1}
+        )
+    
+    def save_candidate_feed(self, user_id: str, candidates: List[Dict]):
+        """Replace a user's candidate feed with a freshly ranked list"""
+        self.candidate_feeds.update_one(
+            {"user_id": user_id},
+            {
+                "$set": {"candidates": candidates, "refreshed_at": datetime.utcnow()},
+                "$setOnInsert": {"_id": str(uuid.uuid4())}
+            },
+            upsert=True
+        )
+    
+    def rerank_in_feeds(self, candidate_id: str, scores: Dict[str, float], max_candidates: int) -> int:
+        """Re-insert one candidate into other users' feeds with updated scores"""
+        operations = []
+        for owner_id, score in scores.items():
+            # $pull and $push can't target the same array in one update,
+            # so each feed gets two ops; ordered=True keeps them in sequence
+            operations.append(UpdateOne(
+                {"user_id": owner_id},
+                {"$pull": {"candidates": {"user_id": candidate_id}}}
+            ))
+            operations.append(UpdateOne(
+                {"user_id": owner_id},
+                {"$push": {"candidates": {
+                    "$each": [{"user_id": candidate_id, "score": score}],
+                    "$sort": {"score": DESCENDING},
+                    "$slice": max_candidates
+                }}}
+            ))
+        if not operations:
+            return 0
+        result = self.candidate_feeds.bulk_write(operations, ordered=True)
+        return result.modified_count
+    
+    def remove_from_feeds(self, candidate_id: str, owner_ids: Optional[List[str]] = None) -> int:
+        """Remove a user from every candidate feed they appear in (or just from these owners' feeds)"""
+        query: Dict[str, Any] = {"candidates.user_id": candidate_id}
+        if owner_ids is not None:
+            query["user_id"] = {"$in": owner_ids}
+        result = self.candidate_feeds.update_many(
+            query,
+            {"$pull": {"candidates": {"user_id": candidate_id}}}
+        )
+        return result.modified_count
+    
+    def delete_candidate_feed(self, user_id: str) -> bool:
+        """Delete a user's own candidate feed"""
+        result = self.candidate_feeds.delete_one({"user_id": user_id})
+        return result.deleted_count > 0
+    
+    def close(self):
+        """Close this process's connection; the next collection access reconnects"""
+        with self._lock:
+            if self.client is not None:
+                self.client.close()
+            self.client = None
+            self.db = None
+            self._pid = None
+            for name in self.COLLECTIONS:
+                self.__dict__.pop(name, None)
 
-    def save_chat_message(self, user_id: str, message: str, sender: str, insights: Optional[Dict] = None) -> str:
-        """Save a chat message to the database"""
-        message_id = str(uuid.uuid4())
-        message_doc = {
-            "_id": message_id,
+    @staticmethod
+    def new_chat_message(user_id: str, message: str, sender: str, insights: Optional[Dict] = None) -> Dict:
+        """A chat message document, timestamped now"""
+        return {
+            "_id": str(uuid.uuid4()),
             "user_id": user_id,
             "message": message,
             "sender": sender,  # 'user' or 'ai'
             "insights": insights or {},
             "timestamp": datetime.utcnow()
         }
-        
-        self.chat_messages.insert_one(message_doc)
-        return message_id
 
-    def get_user_chat_history(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """Get user's chat history with AI"""
+    def save_chat_message(self, user_id: str, message: str, sender: str, insights: Optional[Dict] = None) -> str:
+        """Save a chat message to the database"""
+        message_doc = self.new_chat_message(user_id, message, sender, insights)
+        if self.chat_storage == "buckets":
+            self.chat_buckets.bulk_write(self._chat_bucket_append(user_id, [message_doc]), ordered=True)
+        else:
+            self.chat_messages.insert_one(message_doc)
+        self._content_changed(user_id, "chat")
+        return message_doc["_id"]
+
+    def save_chat_messages(self, messages: List[Dict], resave: bool = False) -> int:
+        """
+        Save a batch of new_chat_message documents (any users, oldest first)
+        in one insert_many or bulk_write, plus one bulk_write bumping each
+        user's chat version. Re-saving a batch is harmless under
+        CHAT_STORAGE=messages (duplicate ids are skipped). Bucket appends
+        would add the messages twice, so pass resave=True when the batch may
+        already be (partly) saved, e.g. a retry or a replay: messages already
+        in a bucket are then looked up and skipped first.
+        """
+        if self.chat_storage == "buckets" and resave and messages:
+            saved = self._bucketed_chat_message_ids(messages)
+            messages = [message for message in messages if message["_id"] not in saved]
+        if not messages:
+            return 0
+        by_user: Dict[str, List[Dict]] = {}
+        for message in messages:
+            by_user.setdefault(message["user_id"], []).append(message)
+
+        if self.chat_storage == "buckets":
+            operations = []
+            for user_id, user_messages in by_user.items():
+                # One $push per run of same-day messages that fits in a bucket
+                run: List[Dict] = []
+                for message in user_messages:
+                    if run and (len(run) >= CHAT_BUCKET_SIZE or run[0]["timestamp"].date() != message["timestamp"].date()):
+                        operations.extend(self._chat_bucket_append(user_id, run))
+                        run = []
+                    run.append(message)
+                operations.extend(self._chat_bucket_append(user_id, run))
+            self.chat_buckets.bulk_write(operations, ordered=True)
+        else:
+            try:
+                self.chat_messages.insert_many(messages, ordered=False)
+            except BulkWriteError as e:
+                # Already saved by an earlier attempt at this batch
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+        self.users.bulk_write([
+            UpdateOne({"_id": user_id}, {"$inc": {"content_versions.chat": 1}})
+            for user_id in by_user
+        ], ordered=False)
+        return len(messages)
+
+    def _bucketed_chat_message_ids(self, messages: List[Dict]) -> Set[str]:
+        """Which of these messages are already in chat_buckets, by _id"""
+        message_ids = {message["_id"] for message in messages}
+        buckets = self.chat_buckets.find(
+            {
+                "user_id": {"$in": list({message["user_id"] for message in messages})},
+                "messages._id": {"$in": list(message_ids)}
+            },
+            {"messages._id": 1}
+        )
+        return {message["_id"] for bucket in buckets for message in bucket.get("messages", [])} & message_ids
+
+    def _chat_bucket_append(self, user_id: str, messages: List[Dict]) -> List[Any]:
+        """
+        Ordered bulk_write operations that $push same-day messages onto the
+        user's open bucket, upserting a new bucket when it has no room. The
+        open bucket is sealed first if it is from an earlier day or too full,
+        so a user has one open bucket and later messages never land in an
+        older one.
+        """
+        first = messages[0]["timestamp"]
+        day = datetime(first.year, first.month, first.day)
+        return [
+            UpdateMany(
+                {
+                    "user_id": user_id,
+                    "sealed": {"$ne": True},
+                    "$or": [{"bucket_start": {"$lt": day}}, {"count": {"$gt": CHAT_BUCKET_SIZE - len(messages)}}]
+                },
+                {"$set": {"sealed": True}}
+            ),
+            UpdateOne(
+                {"user_id": user_id, "bucket_start": {"$gte": day}, "sealed": {"$ne": True}},
+                {
+                    "$push": {"messages": {"$each": [
+                        {field: value for field, value in message.items() if field != "user_id"}
+                        for message in messages
+                    ]}},
+                    "$inc": {"count": len(messages)},
+                    "$setOnInsert": {"_id": str(uuid.uuid4()), "bucket_start": first}
+                },
+                upsert=True
+            )
+        ]
+
+    def _chat_bucket_documents(self, user_id: str, messages: List[Dict]) -> List[Dict]:
+        """
+        Group a user's messages (oldest first) into whole buckets. Bucket ids
+        derive from their first message, so re-inserting them is a no-op, and
+        they are sealed so new messages don't land among older ones.
+        """
+        buckets: List[Dict] = []
+        for message in messages:
+            timestamp = message["timestamp"]
+            bucket = buckets[-1] if buckets else None
+            if (bucket is None or bucket["count"] >= CHAT_BUCKET_SIZE
+                    or bucket["bucket_start"].date() != timestamp.date()):
+                bucket = {
+                    "_id": f"{user_id}:{message['_id']}",
+                    "user_id": user_id,
+                    "bucket_start": timestamp,
+                    "count": 0,
+                    "sealed": True,
+                    "messages": []
+                }
+                buckets.append(bucket)
+            bucket["messages"].append({field: value for field, value in message.items() if field != "user_id"})
+            bucket["count"] += 1
+        return buckets
+
+    def move_chat_messages_to_buckets(self, user_id: str) -> int:
+        """Move a user's chat_messages into chat_buckets (safe to repeat); returns how many moved"""
+        messages = list(self.chat_messages.find({"user_id": user_id}).sort("timestamp", ASCENDING))
+        if not messages:
+            return 0
+        try:
+            self.chat_buckets.insert_many(self._chat_bucket_documents(user_id, messages), ordered=False)
+        except BulkWriteError as e:
+            # Buckets left by an interrupted earlier run are already there
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        self.chat_messages.delete_many({"_id": {"$in": [message["_id"] for message in messages]}})
+        return len(messages)
+
+    def _legacy_chat_pending(self) -> bool:
+        """
+        Whether chat_messages may still hold messages not yet moved into
+        buckets. Nothing writes there under CHAT_STORAGE=buckets, so once it
+        is empty it stays empty and bucketed reads stop looking at it.
+        """
+        now = time.monotonic()
+        if self._legacy_chat and now - self._legacy_chat_checked_at >= LEGACY_CHAT_RECHECK_SECONDS:
+            self._legacy_chat = self.chat_messages.find_one({}, {"_id": 1}) is not None
+            self._legacy_chat_checked_at = now
+        return self._legacy_chat
+
+    def _find_chat_messages(self, user_id: str, limit: int, fields: Optional[List[str]],
+                            before: Optional[datetime] = None) -> List[Dict]:
+        """The newest `limit` messages (before `before`, if given) from chat_messages, oldest first"""
+        if limit <= 0:
+            return []
+        query: Dict[str, Any] = {"user_id": user_id}
+        if before is not None:
+            query["timestamp"] = {"$lt": before}
         messages = list(self.chat_messages.find(
-            {"user_id": user_id}
-        ).sort("timestamp", ASCENDING).limit(limit))
+            query,
+            projection_for("chat_messages", fields)
+        ).sort("timestamp", DESCENDING).limit(limit))
+        messages.reverse()
         return [self._convert_objectid_to_str(message) for message in messages]
 
+    def _find_bucketed_chat_messages(self, user_id: str, limit: int, fields: Optional[List[str]],
+                                     before: Optional[datetime] = None) -> List[Dict]:
+        """
+        The newest `limit` messages (before `before`, if given) from
+        chat_buckets, oldest first, reading only the buckets needed
+        """
+        if limit <= 0:
+            return []
+        projection = {f"messages.{field}": value for field, value in projection_for("chat_messages", fields).items()}
+        # Cut at `before` needs timestamps even when they weren't selected
+        strip_timestamp = before is not None and 1 in projection.values() and "messages.timestamp" not in projection
+        if 1 in projection.values():
+            projection["messages._id"] = 1
+            if strip_timestamp:
+                projection["messages.timestamp"] = 1
+        query: Dict[str, Any] = {"user_id": user_id}
+        if before is not None:
+            query["bucket_start"] = {"$lt": before}
+        buckets = self.chat_buckets.find(query, projection) \
+            .sort("bucket_start", DESCENDING) \
+            .limit(limit) \
+            .batch_size(limit // CHAT_BUCKET_SIZE + 2)
+        messages: List[Dict] = []
+        for bucket in buckets:
+            chunk = bucket.get("messages", [])
+            if before is not None:
+                chunk = [message for message in chunk if message["timestamp"] < before]
+            messages = chunk + messages
+            if len(messages) >= limit:
+                break
+        buckets.close()
+        messages = messages[-limit:]
+        if fields is None:
+            for message in messages:
+                message["user_id"] = user_id
+        if strip_timestamp:
+            for message in messages:
+                del message["timestamp"]
+        return messages
+
+    def _find_archived_chat_messages(self, user_id: str, limit: int, fields: Optional[List[str]],
+                                     before: Optional[datetime] = None) -> List[Dict]:
+        """The newest `limit` archived messages (before `before`, if given), oldest first"""
+        projection = projection_for("chat_messages", fields)
+        return [apply_projection(message, projection)
+                for message in self.chat_archive.find(user_id, limit, before)]
+
+    def _chat_tiers(self) -> List[Callable[..., List[Dict]]]:
+        """
+        Readers for where a user's chat messages may be, oldest tier first:
+        the archive, then chat_messages, then chat_buckets. Each tier only
+        holds messages newer than the ones before it.
+        """
+        tiers: List[Callable[..., List[Dict]]] = []
+        if self.chat_archive.in_use():
+            tiers.append(self._find_archived_chat_messages)
+        if self.chat_storage != "buckets" or self._legacy_chat_pending():
+            tiers.append(self._find_chat_messages)
+        if self.chat_storage == "buckets":
+            tiers.append(self._find_bucketed_chat_messages)
+        return tiers
+
+    def _merge_chat(self, older: List[Dict], newer: List[Dict]) -> List[Dict]:
+        """Concatenate two runs of messages, dropping any seen twice mid-migration"""
+        seen = {message["_id"] for message in older}
+        return older + [message for message in newer if message["_id"] not in seen]
+
+    def get_recent_chat_messages(self, user_id: str, limit: int = 20, fields: Optional[List[str]] = None,
+                                 before: Optional[datetime] = None) -> List[Dict]:
+        """The user's latest AI chat messages (only those before `before`, if given), oldest first"""
+        messages: List[Dict] = []
+        for find in reversed(self._chat_tiers()):
+            messages = self._merge_chat(find(user_id, limit - len(messages), fields, before=before), messages)
+            if len(messages) >= limit:
+                break
+        return messages
+
+    def iter_user_export(self, user_id: str, batch_size: int = 500) -> Iterator[Tuple[str, Dict]]:
+        """
+        Stream everything stored about a user as (record_type, document) pairs.
+        
+        Every collection is read through a cursor with a bounded batch size,
+        so memory stays flat no matter how many chat messages a user has.
+        """
+        user = self.users.find_one({"_id": user_id}, {"password": 0})
+        if user:
+            yield "user", user
+        
+        profile = self.profiles.find_one({"user_id": user_id})
+        if profile:
+            yield "profile", profile
+        
+        for photo in self.photos.find({"user_id": user_id}).sort("order", ASCENDING).batch_size(batch_size):
+            yield "photo", photo
+        
+        for prompt in self.prompts.find({"user_id": user_id}).sort("order", ASCENDING).batch_size(batch_size):
+            yield "prompt", prompt
+        
+        insights = self.personality_insights.find_one({"user_id": user_id})
+        if insights:
+            yield "personality_insights", insights
+        
+        for message in self.chat_archive.iter_messages(user_id):
+            yield "chat_message", message
+        
+        messages = self.chat_messages.find({"user_id": user_id}).sort("timestamp", ASCENDING).batch_size(batch_size)
+        for message in messages:
+            yield "chat_message", message
+        
+        buckets = self.chat_buckets.find({"user_id": user_id}).sort("bucket_start", ASCENDING) \
+            .batch_size(max(1, batch_size // CHAT_BUCKET_SIZE))
+        for bucket in buckets:
+            for message in bucket.get("messages", []):
+                yield "chat_message", {**message, "user_id": user_id}
+    
     def save_personality_insights(self, user_id: str, insights: Dict) -> str:
         """Save personality insights for a user"""
         insight_id = str(uuid.uuid4())
@@ -329,9 +1353,25 @@ class DatabaseService:
             self.personality_insights.insert_one(insight_doc)
             return insight_id
 
-    def get_personality_insights(self, user_id: str) -> Optional[Dict]:
+    def save_personality_insights_many(self, updates: Dict[str, Tuple[Dict, datetime]]):
+        """Upsert the latest (insights, updated_at) of several users in one bulk_write"""
+        if not updates:
+            return
+        self.personality_insights.bulk_write([
+            UpdateOne(
+                {"user_id": user_id},
+                {
+                    "$set": {"insights": insights, "updated_at": updated_at},
+                    "$setOnInsert": {"_id": str(uuid.uuid4()), "created_at": updated_at}
+                },
+                upsert=True
+            )
+            for user_id, (insights, updated_at) in updates.items()
+        ], ordered=False)
+
+    def get_personality_insights(self, user_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
         """Get personality insights for a user"""
-        insights = self.personality_insights.find_one({"user_id": user_id})
+        insights = self.personality_insights.find_one({"user_id": user_id}, projection_for("personality_insights", fields))
         if insights:
             return self._convert_objectid_to_str(insights)
         return None
@@ -340,16 +1380,21 @@ class DatabaseService:
     def delete_user_profile(self, user_id: str) -> bool:
         """Delete user profile from profiles collection"""
         result = self.profiles.delete_one({"user_id": user_id})
+        self._content_changed(user_id, "profile")
         return result.deleted_count > 0
 
     def delete_user_photos(self, user_id: str) -> int:
-        """Delete all user photos from photos collection"""
+        """Delete all user photos from photos collection and their files from disk"""
+        photos = list(self.photos.find({"user_id": user_id}, {"id": 1, "url": 1, "storage_key": 1}))
         result = self.photos.delete_many({"user_id": user_id})
+        self._content_changed(user_id, "photos")
+        self.remove_photo_files(photos)
         return result.deleted_count
 
     def delete_user_prompts(self, user_id: str) -> int:
         """Delete all user prompts from prompts collection"""
         result = self.prompts.delete_many({"user_id": user_id})
+        self._content_changed(user_id, "prompts")
         return result.deleted_count
 
     def delete_user(self, user_id: str) -> bool:
@@ -358,48 +1403,436 @@ class DatabaseService:
         return result.deleted_count > 0
 
     def delete_user_chat_messages(self, user_id: str) -> int:
-        """Delete all user chat messages"""
+        """Delete all user chat messages, in either storage layout and from the archive"""
+        bucketed = sum(bucket.get("count", 0) for bucket in self.chat_buckets.find({"user_id": user_id}, {"count": 1}))
+        self.chat_buckets.delete_many({"user_id": user_id})
         result = self.chat_messages.delete_many({"user_id": user_id})
-        return result.deleted_count
+        archived = self.chat_archive.delete_user(user_id)
+        self._content_changed(user_id, "chat")
+        return result.deleted_count + bucketed + archived
 
     def delete_user_personality_insights(self, user_id: str) -> bool:
         """Delete user personality insights"""
         result = self.personality_insights.delete_one({"user_id": user_id})
         return result.deleted_count > 0
 
+    def _delete_user_feeds(self, user_id: str) -> int:
+        """Delete a user's candidate feed and drop them from everyone else's"""
+        self.remove_from_feeds(user_id)
+        return int(self.delete_candidate_feed(user_id))
+    
+    def mark_user_deleted(self, user_id: str) -> bool:
+        """Flag an account as deleted, which immediately revokes access; data is purged in the background"""
+        result = self.users.update_one(
+            {"_id": user_id, "deleted_at": {"$exists": False}},
+            {"$set": {"deleted_at": datetime.utcnow(), "is_active": False, "deletion_status": "pending"}}
+        )
+        return result.modified_count > 0
+    
+    def get_pending_deletions(self) -> List[str]:
+        """Get ids of accounts flagged for deletion whose data hasn't been purged yet"""
+        return [user["_id"] for user in self.users.find({"deletion_status": "pending"}, {"_id": 1})]
+    
     def delete_all_user_data(self, user_id: str) -> Dict[str, int]:
-        """Delete all user data from all collections"""
-        results = {
-            "profile_deleted": 0,
-            "photos_deleted": 0,
-            "prompts_deleted": 0,
-            "user_deleted": 0,
-            "chat_messages_deleted": 0,
-            "personality_insights_deleted": 0
+        """Delete all user data from all collections, running the independent deletes concurrently"""
+        tasks = {
+            "profile_deleted": lambda: int(self.delete_user_profile(user_id)),
+            "photos_deleted": lambda: self.delete_user_photos(user_id),
+            "prompts_deleted": lambda: self.delete_user_prompts(user_id),
+            "chat_messages_deleted": lambda: self.delete_user_chat_messages(user_id),
+            "personality_insights_deleted": lambda: int(self.delete_user_personality_insights(user_id)),
+            "candidate_feed_deleted": lambda: self._delete_user_feeds(user_id),
+            # Delete seen filter, matches and likes
+            "likes_deleted": lambda: self.delete_user_swipes(user_id)
         }
         
-        # Delete profile
-        if self.delete_user_profile(user_id):
-            results["profile_deleted"] = 1
+        with ThreadPoolExecutor(max_workers=DELETION_WORKERS) as executor:
+            futures = {name: executor.submit(task) for name, task in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
         
-        # Delete photos
-        results["photos_deleted"] = self.delete_user_photos(user_id)
+        # Delete user (do this last, so an interrupted purge can be resumed)
+        results["user_deleted"] = int(self.delete_user(user_id))
         
-        # Delete prompts
-        results["prompts_deleted"] = self.delete_user_prompts(user_id)
+        return results
+
+class EmbeddedProfileDatabaseService(DatabaseService):
+    """
+    DatabaseService for PROFILE_SCHEMA=embedded: a profile's photos and
+    prompts are ordered arrays inside the profile document, so a full
+    profile is one read and every change to a photo or prompt is one atomic
+    update of one document (positional $ / $[<id>] updates, guarded by
+    MAX_PROFILE_PHOTOS / MAX_PROFILE_PROMPTS).
+
+    Switching is online. Profiles still in the referenced layout are
+    embedded the first time they are read or written (and in bulk by the
+    embed_profile_children migration), after which their collection copies
+    are dropped. Photos uploaded before the profile exists stay in the
+    photos collection until create_profile embeds them.
+    """
+    
+    CHILD_LIMITS = {"photos": MAX_PROFILE_PHOTOS, "prompts": MAX_PROFILE_PROMPTS}
+    
+    def embed_profile_children(self, user_id: str) -> bool:
+        """Move a profile's photos and prompts into it, once; False when the user has no profile"""
+        profile = self.profiles.find_one({"user_id": user_id}, {"embedded": 1})
+        if not profile:
+            return False
+        if profile.get("embedded"):
+            return True
+        children = self.embedded_children(user_id)
+        result = self.profiles.update_one(
+            {"_id": profile["_id"], "embedded": {"$ne": True}},
+            {"$set": {**children, "embedded": True}}
+        )
+        if result.modified_count:
+            self.drop_referenced_children([children])
+            profile_cache.invalidate(user_id)
+        return True
+    
+    def _update_embedded(self, user_id: str, query: Dict, update: Dict, **kwargs):
+        """
+        update_one on the user's embedded profile, embedding it first if it is
+        still referenced. None when the user has no profile; matched_count is 0
+        when `query` (e.g. an array bound) doesn't hold.
+        """
+        query = {"user_id": user_id, "embedded": True, **query}
+        result = self.profiles.update_one(query, update, **kwargs)
+        if result.matched_count == 0:
+            if not self.embed_profile_children(user_id):
+                return None
+            result = self.profiles.update_one(query, update, **kwargs)
+        return result
+    
+    def _modify_embedded_child(self, child: str, child_id: str, update: Dict, projection: Dict,
+                               user_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        find_one_and_update on the profile holding one photo/prompt (by _id or
+        id), only user_id's profile if given, returning the profile as it was.
+        None when it isn't embedded there, i.e. it doesn't exist (for that
+        user) or belongs to a user without a profile.
+        """
+        match = {"$or": [{"_id": child_id}, {"id": child_id}]}
+        query = {"embedded": True, child: {"$elemMatch": match}}
+        owner = {"user_id": user_id} if user_id is not None else {}
+        query.update(owner)
+        profile = self.profiles.find_one_and_update(query, update, projection=projection)
+        if profile is None:
+            referenced = getattr(self, child).find_one({**match, **owner}, {"user_id": 1})
+            if referenced and self.embed_profile_children(referenced["user_id"]):
+                profile = self.profiles.find_one_and_update(query, update, projection=projection)
+        return profile
+    
+    def _embedded_profile(self, user_id: str, projection: Optional[Dict] = None) -> Optional[Dict]:
+        """The user's profile document with its arrays (embedding them on first read)"""
+        profile = self.profiles.find_one({"user_id": user_id}, projection)
+        if profile and not profile.get("embedded"):
+            self.embed_profile_children(user_id)
+            profile = self.profiles.find_one({"user_id": user_id}, projection)
+        return self._convert_objectid_to_str(profile) if profile else None
+    
+    def _cached_profile(self, user_id: str) -> Optional[Dict]:
+        return profile_cache.get("embedded_profile", user_id, lambda: self._embedded_profile(user_id))
+    
+    def _child_projection(self, child: str, fields: Optional[List[str]]) -> Dict[str, int]:
+        """Projection of one embedded array, or some fields of its elements"""
+        if fields is None:
+            return {child: 1}
+        # Validates the selection; _id and order are needed to identify and sort the elements
+        selected = {**projection_for(child, fields), "_id": 1, "order": 1}
+        return {f"{child}.{field}": 1 for field in selected}
+    
+    def _children_view(self, user_id: str, profile: Dict, child: str, fields: Optional[List[str]]) -> List[Dict]:
+        """An embedded array shaped like the child collection's documents, in display order"""
+        items = sorted(profile.get(child) or [], key=lambda item: item.get("order", 0))
+        if fields is None:
+            for item in items:
+                item["user_id"] = user_id
+        if child == "photos":
+            self._mark_primary(items)
+            if fields is not None and "is_primary" not in fields:
+                for item in items:
+                    del item["is_primary"]
+        if fields is not None and "order" not in fields:
+            for item in items:
+                item.pop("order", None)
+        return items
+    
+    def create_profile(self, user_id: str, profile_data: Dict) -> str:
+        """Create a profile, embedding any photos uploaded before it existed"""
+        # Drop creation-time copies of photos/prompts; the arrays here are authoritative
+        profile_data = {field: value for field, value in profile_data.items() if field not in PROFILE_CHILDREN}
+        children = self.embedded_children(user_id)
+        profile_id = super().create_profile(user_id, {**profile_data, **children, "embedded": True})
+        if any(children.values()):
+            self.drop_referenced_children([children])
+        return profile_id
+    
+    def update_profile(self, user_id: str, update_data: Dict) -> bool:
+        update_data = {
+            field: value for field, value in update_data.items()
+            if field not in PROFILE_CHILDREN and field != "embedded"
+        }
+        return super().update_profile(user_id, update_data)
+    
+    def get_profile(self, user_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """Get user profile with photos and prompts from the one profile document"""
+        if fields is None:
+            profile = self._cached_profile(user_id)
+            children: Dict[str, Optional[List[str]]] = {child: None for child in PROFILE_CHILDREN}
+        else:
+            own, children = split_profile_fields(fields)
+            projection = {**projection_for("profiles", own), "embedded": 1}
+            for child, child_fields in children.items():
+                projection.update(self._child_projection(child, child_fields))
+            profile = self._embedded_profile(user_id, projection)
+        if not profile:
+            return None
         
-        # Delete chat messages
-        results["chat_messages_deleted"] = self.delete_user_chat_messages(user_id)
+        for child in PROFILE_CHILDREN:
+            if child in children:
+                profile[child] = self._children_view(user_id, profile, child, children[child])
+            else:
+                profile.pop(child, None)
+        profile.pop("embedded", None)
+        return profile
+    
+    def _get_children(self, child: str, user_id: str, fields: Optional[List[str]]) -> Optional[List[Dict]]:
+        if fields is None:
+            profile = self._cached_profile(user_id)
+        else:
+            profile = self._embedded_profile(user_id, {**self._child_projection(child, fields), "embedded": 1})
+        return self._children_view(user_id, profile, child, fields) if profile else None
+    
+    def get_user_photos(self, user_id: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        photos = self._get_children("photos", user_id, fields)
+        # No profile yet: photos uploaded ahead of it are still in the collection
+        return super().get_user_photos(user_id, fields) if photos is None else photos
+    
+    def get_user_prompts(self, user_id: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        prompts = self._get_children("prompts", user_id, fields)
+        return super().get_user_prompts(user_id, fields) if prompts is None else prompts
+    
+    def get_profiles(self, user_ids: List[str]) -> List[Dict]:
+        """Get several profiles with photos and prompts in one query (plus one per child for any not yet embedded)"""
+        if not user_ids:
+            return []
         
-        # Delete personality insights
-        if self.delete_user_personality_insights(user_id):
-            results["personality_insights_deleted"] = 1
+        profiles = {
+            profile["user_id"]: self._convert_objectid_to_str(profile)
+            for profile in self.profiles.find({"user_id": {"$in": user_ids}})
+        }
+        # Read-only, so referenced profiles are read as they are rather than embedded here
+        referenced = [user_id for user_id, profile in profiles.items() if not profile.get("embedded")]
+        for child in PROFILE_CHILDREN:
+            for user_id in referenced:
+                profiles[user_id][child] = []
+            if referenced:
+                for document in getattr(self, child).find({"user_id": {"$in": referenced}}):
+                    profiles[document["user_id"]][child].append(document)
+        for profile in profiles.values():
+            for child in PROFILE_CHILDREN:
+                profile[child] = self._children_view(profile["user_id"], profile, child, None)
+            profile.pop("embedded", None)
         
-        # Delete user (do this last)
-        if self.delete_user(user_id):
-            results["user_deleted"] = 1
+        return [profiles[user_id] for user_id in user_ids if user_id in profiles]
+    
+    def add_photo(self, user_id: str, photo_data: Dict) -> str:
+        """
+        Push a photo onto the profile's photos, to the end or (is_primary) the
+        front. Raises ValueError when the profile already has MAX_PROFILE_PHOTOS.
+        """
+        photo_id = str(uuid.uuid4())
+        fields = {field: value for field, value in photo_data.items() if field not in ("user_id", "is_primary")}
+        seq = self._next_photo_seq(user_id)
+        photo_doc = {
+            "_id": photo_id,
+            **fields,
+            "order": -seq if photo_data.get("is_primary") else seq,
+            "created_at": datetime.utcnow()
+        }
         
-        return results
+        result = self._update_embedded(
+            user_id,
+            {f"photos.{MAX_PROFILE_PHOTOS - 1}": {"$exists": False}},
+            {"$push": {"photos": photo_doc}}
+        )
+        if result is None:
+            return super().add_photo(user_id, photo_data)
+        if result.matched_count == 0:
+            raise ValueError(f"A profile can have at most {MAX_PROFILE_PHOTOS} photos")
+        self._content_changed(user_id, "photos")
+        return photo_id
+    
+    def set_primary_photo(self, user_id: str, photo_id: str) -> bool:
+        seq = self._next_photo_seq(user_id)
+        result = self._update_embedded(
+            user_id,
+            {"photos": {"$elemMatch": {"$or": [{"_id": photo_id}, {"id": photo_id}]}}},
+            {"$set": {"photos.$.order": -seq}}
+        )
+        if result is None:
+            return super().set_primary_photo(user_id, photo_id)
+        self._content_changed(user_id, "photos")
+        return result.matched_count > 0
+    
+    def reorder_photos(self, user_id: str, photo_ids: List[str]) -> bool:
+        """Apply a complete new ordering in one update of the profile, via per-photo array filters"""
+        profile = self._embedded_profile(user_id, {"embedded": 1, "photos._id": 1, "photos.id": 1})
+        if profile is None:
+            return super().reorder_photos(user_id, photo_ids)
+        photos = profile.get("photos") or []
+        ordered = self._resolve_photo_order(photos, photo_ids)
+        if ordered is None:
+            return False
+        if not ordered:
+            return True
+        
+        result = self.profiles.update_one(
+            # Only if the photos are still the ones just validated
+            {"_id": profile["_id"], "photos._id": {"$all": ordered}, "photos": {"$size": len(ordered)}},
+            {"$set": {f"photos.$[p{order}].order": order for order in range(len(ordered))}},
+            array_filters=[{f"p{order}._id": _id} for order, _id in enumerate(ordered)]
+        )
+        if result.matched_count == 0:
+            return False
+        self.users.update_one({"_id": user_id}, {"$max": {"photo_seq": len(ordered)}})
+        self._content_changed(user_id, "photos")
+        return True
+    
+    def update_photo(self, user_id: str, photo_id: str, update_data: Dict) -> bool:
+        profile = self._modify_embedded_child(
+            "photos", photo_id,
+            {"$set": {f"photos.$.{field}": value for field, value in update_data.items()}},
+            {"user_id": 1},
+            user_id=user_id
+        )
+        if profile is None:
+            return super().update_photo(user_id, photo_id, update_data)
+        self._content_changed(user_id, "photos")
+        return True
+    
+    def delete_photo(self, user_id: str, photo_id: str) -> bool:
+        profile = self._modify_embedded_child(
+            "photos", photo_id,
+            {"$pull": {"photos": {"$or": [{"_id": photo_id}, {"id": photo_id}]}}},
+            {"user_id": 1, "photos.$": 1},
+            user_id=user_id
+        )
+        if profile is None:
+            return super().delete_photo(user_id, photo_id)
+        for photo in profile.get("photos") or []:
+            self._delete_photo_file(photo)
+        self._content_changed(user_id, "photos")
+        return True
+    
+    def add_prompt(self, user_id: str, prompt_data: Dict) -> str:
+        return self.add_prompts(user_id, [prompt_data])[0]
+    
+    def add_prompts(self, user_id: str, prompts: List[Dict]) -> List[str]:
+        """Push several prompts in one update; raises ValueError past MAX_PROFILE_PROMPTS"""
+        if not prompts:
+            return []
+        if len(prompts) > MAX_PROFILE_PROMPTS:
+            raise ValueError(f"A profile can have at most {MAX_PROFILE_PROMPTS} prompts")
+        prompt_docs = [
+            {
+                "_id": str(uuid.uuid4()),
+                **{field: value for field, value in prompt_data.items() if field != "user_id"},
+                "created_at": datetime.utcnow()
+            }
+            for prompt_data in prompts
+        ]
+        result = self._update_embedded(
+            user_id,
+            {f"prompts.{MAX_PROFILE_PROMPTS - len(prompt_docs)}": {"$exists": False}},
+            {"$push": {"prompts": {"$each": prompt_docs}}}
+        )
+        if result is None:
+            return super().add_prompts(user_id, prompts)
+        if result.matched_count == 0:
+            raise ValueError(f"A profile can have at most {MAX_PROFILE_PROMPTS} prompts")
+        self._content_changed(user_id, "prompts")
+        return [doc["_id"] for doc in prompt_docs]
+    
+    def update_prompt(self, prompt_id: str, update_data: Dict) -> bool:
+        profile = self._modify_embedded_child(
+            "prompts", prompt_id,
+            {"$set": {f"prompts.$.{field}": value for field, value in update_data.items()}},
+            {"user_id": 1}
+        )
+        if profile is None:
+            return super().update_prompt(prompt_id, update_data)
+        self._content_changed(profile["user_id"], "prompts")
+        return True
+    
+    def _primary_photo_stages(self) -> List[Dict]:
+        # Profiles not embedded yet still get theirs from the photos collection
+        embedded_primary = {"$map": {
+            "input": {"$slice": [{"$filter": {
+                "input": {"$ifNull": ["$profile.photos", []]},
+                "cond": {"$eq": ["$$this.order", {"$min": "$profile.photos.order"}]}
+            }}, 1]},
+            "in": {"$mergeObjects": ["$$this", {"is_primary": True}]}
+        }}
+        return super()._primary_photo_stages() + [
+            {"$set": {"photos": {"$cond": [{"$eq": ["$profile.embedded", True]}, embedded_primary, "$photos"]}}}
+        ]
+    
+    def _users_with_photos(self, user_ids: List[str]) -> List[str]:
+        embedded = self.profiles.distinct(
+            "user_id", {"user_id": {"$in": user_ids}, "embedded": True, "photos.0": {"$exists": True}}
+        )
+        return list(set(embedded) | set(super()._users_with_photos(user_ids)))
+    
+    def iter_user_export(self, user_id: str, batch_size: int = 500) -> Iterator[Tuple[str, Dict]]:
+        for record_type, document in super().iter_user_export(user_id, batch_size):
+            if record_type != "profile" or not document.get("embedded"):
+                yield record_type, document
+                continue
+            # Same records as the referenced layout: the profile, then its photos and prompts
+            children = {child: document.pop(child, None) or [] for child in PROFILE_CHILDREN}
+            yield record_type, document
+            for child, child_type in (("photos", "photo"), ("prompts", "prompt")):
+                for item in sorted(children[child], key=lambda item: item.get("order", 0)):
+                    yield child_type, {**item, "user_id": user_id}
+    
+    def delete_user_profile(self, user_id: str) -> bool:
+        """Delete the profile document, and the files of the photos embedded in it"""
+        profile = self.profiles.find_one_and_delete(
+            {"user_id": user_id},
+            projection={"embedded": 1, "photos.id": 1, "photos.url": 1, "photos.storage_key": 1}
+        )
+        self._content_changed(user_id, "profile", "photos", "prompts")
+        if profile and profile.get("embedded"):
+            self.remove_photo_files(profile.get("photos") or [])
+        return profile is not None
+    
+    def delete_user_photos(self, user_id: str) -> int:
+        profile = self.profiles.find_one_and_update(
+            {"user_id": user_id, "embedded": True},
+            {"$set": {"photos": []}},
+            projection={"photos.id": 1, "photos.url": 1, "photos.storage_key": 1}
+        )
+        photos = (profile or {}).get("photos") or []
+        self.remove_photo_files(photos)
+        # Also clears photos uploaded before a profile existed
+        return len(photos) + super().delete_user_photos(user_id)
+    
+    def delete_user_prompts(self, user_id: str) -> int:
+        profile = self.profiles.find_one_and_update(
+            {"user_id": user_id, "embedded": True},
+            {"$set": {"prompts": []}},
+            projection={"prompts._id": 1}
+        )
+        return len((profile or {}).get("prompts") or []) + super().delete_user_prompts(user_id)
+
+PROFILE_SCHEMAS = {
+    "referenced": DatabaseService,
+    "embedded": EmbeddedProfileDatabaseService,
+}
+
+if PROFILE_SCHEMA not in PROFILE_SCHEMAS:
+    raise ValueError(f"Unknown PROFILE_SCHEMA {PROFILE_SCHEMA!r}; expected one of: {', '.join(PROFILE_SCHEMAS)}")
 
 # Global database instance
-db_service = DatabaseService() 
\ No newline at end of file
+db_service = PROFILE_SCHEMAS[PROFILE_SCHEMA]()
\ No newline at end of file
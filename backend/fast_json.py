@@ -0,0 +1,104 @@
+import json
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional, Type, get_args
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# orjson is optional; without it responses fall back to the standard encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    print("⚠️  orjson not available. Fast JSON responses will use the standard json encoder.")
+
+# msgpack is optional; without it clients asking for MessagePack get JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Set by ContentEncodingMiddleware for requests that prefer MessagePack
+prefer_msgpack: ContextVar[bool] = ContextVar("prefer_msgpack", default=False)
+
+def _default(value: Any):
+    """Encode the few non-JSON types that come out of Mongo documents"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    return str(value)
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # orjson serializes datetimes natively; _default only sees ObjectId and friends
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def packb(content: Any) -> bytes:
+    """MessagePack encoding with the same type fallbacks as dumps()"""
+    return msgpack.packb(content, default=_default, use_bin_type=True)
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson, for routes that opt in via response_class.
+    Renders MessagePack instead when the client negotiated it.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if msgpack is not None and prefer_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return packb(content)
+        return dumps(content)
+
+def _nested_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """The model inside a field annotation (Photo in List[Photo], Optional[UserProfile], ...), if any"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for argument in get_args(annotation):
+        nested = _nested_model(argument)
+        if nested is not None:
+            return nested
+    return None
+
+@lru_cache(maxsize=None)
+def _declared(model: Type[BaseModel]) -> Dict[str, Optional[Type[BaseModel]]]:
+    """A model's field names, each with the model of its nested documents (or None)"""
+    return {name: _nested_model(field.annotation) for name, field in model.model_fields.items()}
+
+def declared_fields(content: Dict, model: Type[BaseModel]) -> Dict:
+    """
+    `content` without the keys `model` does not declare (internal document
+    fields), applied to nested documents too, e.g. a profile's photos
+    """
+    fields = _declared(model)
+    declared = {}
+    for key, value in content.items():
+        if key not in fields:
+            continue
+        nested = fields[key]
+        if nested is not None:
+            if isinstance(value, dict):
+                value = declared_fields(value, nested)
+            elif isinstance(value, list):
+                value = [declared_fields(item, nested) if isinstance(item, dict) else item for item in value]
+        declared[key] = value
+    return declared
+
+def trusted_response(content: Any, model: Optional[Type[BaseModel]] = None) -> FastJSONResponse:
+    """
+    Return data we already trust (it came from our own Mongo documents)
+    without FastAPI re-validating it against the route's response_model.
+
+    When `model` is given, keys not declared on it (or on the models of
+    nested documents) are dropped so the payload keeps the documented shape.
+    """
+    if model is not None and isinstance(content, dict):
+        content = declared_fields(content, model)
+    return FastJSONResponse(content)
@@ -0,0 +1,165 @@
+import heapq
+import os
+import queue
+import threading
+from typing import List, Dict, Any, Optional
+
+from database import db_service
+
+# How many ranked candidates each feed keeps
+MAX_FEED_CANDIDATES = 200
+
+# A feed draws from profiles within FEED_RADIUS_KM (up to FEED_POOL_SIZE of them),
+# which bounds how many feeds one profile change touches
+FEED_RADIUS_KM = float(os.getenv("FEED_RADIUS_KM", "150"))
+FEED_POOL_SIZE = int(os.getenv("FEED_POOL_SIZE", "2000"))
+
+# Insight fields compared as sets when scoring a pair of users
+SHARED_INSIGHT_WEIGHTS = {
+    "interests": 3.0,
+    "values": 3.0,
+    "personality_traits": 1.5,
+    "relationship_goals": 2.0
+}
+
+def _as_set(value: Any) -> set:
+    """Normalize an insight value (string or list) into a set of lowercase strings"""
+    if not value:
+        return set()
+    if isinstance(value, str):
+        value = [value]
+    return {str(item).strip().lower() for item in value if str(item).strip()}
+
+def score_candidate(owner: Dict, candidate: Dict) -> float:
+    """Score how good a candidate is for the feed owner (higher is better)"""
+    owner_insights = owner.get("insights") or {}
+    candidate_insights = candidate.get("insights") or {}
+    score = 0.0
+
+    # Jaccard overlap of shared interests, values, traits and goals
+    for field, weight in SHARED_INSIGHT_WEIGHTS.items():
+        mine = _as_set(owner_insights.get(field))
+        theirs = _as_set(candidate_insights.get(field))
+        if mine and theirs:
+            score += weight * len(mine & theirs) / len(mine | theirs)
+
+    # Secure attachment pairs well with anything, anxious/avoidant less so
+    styles = {owner_insights.get("attachment_style"), candidate_insights.get("attachment_style")}
+    if "secure" in styles:
+        score += 1.0
+    elif styles == {"anxious", "avoidant"}:
+        score -= 1.0
+
+    # Profiles with photos get surfaced first
+    if candidate.get("has_photo"):
+        score += 0.5
+
+    return round(score, 4)
+
+class FeedService:
+    """
+    Maintains the materialized candidate_feeds collection.
+
+    Changes are queued by user_id and a background thread refreshes only the
+    feeds they affect: the changed user's own feed is rebuilt from its pool
+    (nearby profiles, see DatabaseService.get_feed_pool), and the changed
+    user is re-ranked in place inside the feeds of that same pool.
+    """
+
+    def __init__(self, db=db_service, max_candidates: int = MAX_FEED_CANDIDATES,
+                 radius_km: float = FEED_RADIUS_KM, pool_size: int = FEED_POOL_SIZE):
+        self.db = db
+        self.max_candidates = max_candidates
+        self.radius_km = radius_km
+        self.pool_size = pool_size
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background refresh worker"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="feed-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background refresh worker after the queue drains"""
+        if self._thread and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+    def notify_changed(self, user_id: str):
+        """Queue a refresh for a user whose profile, photos or insights changed"""
+        with self._pending_lock:
+            # Coalesce bursts of writes (e.g. several photo uploads) into one refresh
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._queue.put(user_id)
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            if user_id is None:
+                break
+            with self._pending_lock:
+                self._pending.discard(user_id)
+            try:
+                self.refresh_for(user_id)
+            except Exception as e:
+                print(f"Error refreshing candidate feeds for {user_id}: {e}")
+
+    def refresh_for(self, user_id: str):
+        """
+        Rebuild user_id's feed and re-rank user_id inside the feeds of its
+        pool; O(pool size) reads and writes, however many users there are
+        """
+        subjects = self.db.get_matching_snapshots([user_id])
+        if not subjects:
+            # Inactive or profile deleted: nobody should see them any more
+            self.db.remove_from_feeds(user_id)
+            return
+        subject = subjects[0]
+
+        own_feed = []
+        scores_in_other_feeds = {}
+        pool = self.db.get_feed_pool(user_id, subject.get("location"), self.radius_km, self.pool_size)
+        for other in self.db.get_matching_snapshots(pool):
+            own_feed.append((score_candidate(subject, other), other["user_id"]))
+            scores_in_other_feeds[other["user_id"]] = score_candidate(other, subject)
+
+        top = heapq.nlargest(self.max_candidates, own_feed)
+        self.db.save_candidate_feed(
+            user_id,
+            [{"user_id": candidate_id, "score": score} for score, candidate_id in top]
+        )
+        self.db.rerank_in_feeds(user_id, scores_in_other_feeds, self.max_candidates)
+        # Feeds that listed user_id before it moved out of their pool
+        stale = set(self.db.get_feeds_containing(user_id)) - set(scores_in_other_feeds)
+        if stale:
+            self.db.remove_from_feeds(user_id, list(stale))
+
+    def get_feed(self, user_id: str, limit: int = 20, skip: int = 0) -> List[Dict]:
+        """Get a page of hydrated, not-yet-swiped candidate profiles for user_id"""
+        # Feeds are bounded, so fetch the whole ranked list and page after
+        # dropping profiles the user already swiped on
+        feed = self.db.get_candidate_feed(user_id, limit=self.max_candidates)
+        if feed is None:
+            # First visit: build synchronously once, later changes go through the worker
+            self.refresh_for(user_id)
+            feed = self.db.get_candidate_feed(user_id, limit=self.max_candidates)
+        if not feed:
+            return []
+
+        seen = self.db.get_seen_filter(user_id)
+        candidate_ids = [
+            candidate["user_id"] for candidate in feed.get("candidates", [])
+            if candidate["user_id"] not in seen
+        ]
+        return self.db.get_profiles(candidate_ids[skip:skip + limit])
+
+# Global feed service instance
+feed_service = FeedService()
@@ -0,0 +1,75 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Fields a client may select with fields=, per collection
+SELECTABLE_FIELDS: Dict[str, Set[str]] = {
+    "profiles": {"user_id", "name", "pronouns", "verification_status", "essential_details", "created_at", "updated_at"},
+    "photos": {"id", "url", "caption", "ai_suggestion", "order", "is_primary", "created_at"},
+    "prompts": {"question", "answer", "order", "created_at"},
+    "chat_messages": {"message", "sender", "insights", "timestamp"},
+    "personality_insights": {"insights", "created_at", "updated_at"},
+}
+
+# Computed after the read, so never part of a Mongo projection
+DERIVED_FIELDS: Dict[str, Set[str]] = {
+    "photos": {"is_primary"},
+}
+
+# Child collections a profile selection can pull in ("photos", "photos.url", ...)
+PROFILE_CHILDREN = ("photos", "prompts")
+
+# Applied when no fields= is given: drop heavy fields that no screen renders by default.
+# Profiles keep stale creation-time copies of photos/prompts (served from their own
+# collections), and every AI chat message carries its full insights dict.
+DEFAULT_PROJECTIONS: Dict[str, Dict[str, int]] = {
+    "profiles": {"photos": 0, "prompts": 0},
+    "chat_messages": {"insights": 0},
+}
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Split a fields= query value ("name,photos.url") into a list; None when absent"""
+    if fields is None:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+def projection_for(collection: str, fields: Optional[Iterable[str]]) -> Optional[Dict[str, int]]:
+    """
+    Mongo projection for a selection of fields, or the collection's default
+    projection when fields is None. Raises ValueError for unknown fields.
+    """
+    if fields is None:
+        # A copy: drivers may add to the projection they are given (mongomock adds _id)
+        default = DEFAULT_PROJECTIONS.get(collection)
+        return dict(default) if default is not None else None
+    fields = set(fields)
+    unknown = fields - SELECTABLE_FIELDS.get(collection, set())
+    if unknown:
+        raise ValueError(f"Unknown {collection} fields: {', '.join(sorted(unknown))}")
+    stored = fields - DERIVED_FIELDS.get(collection, set())
+    # An empty inclusion projection would return whole documents, so ask for _id only
+    return {field: 1 for field in stored} or {"_id": 1}
+
+def apply_projection(document: Dict, projection: Optional[Dict[str, int]]) -> Dict:
+    """Apply a projection from projection_for to a document already in memory"""
+    if not projection:
+        return document
+    if 1 in projection.values():
+        return {field: value for field, value in document.items() if field == "_id" or projection.get(field)}
+    return {field: value for field, value in document.items() if field not in projection}
+
+def split_profile_fields(fields: Iterable[str]) -> Tuple[List[str], Dict[str, Optional[List[str]]]]:
+    """
+    Split a profile selection into its own fields and per-child selections.
+    "photos" selects whole photos, "photos.url" just their URLs; children that
+    are not mentioned are left out (and not queried).
+    """
+    own: List[str] = []
+    children: Dict[str, Optional[List[str]]] = {}
+    for field in fields:
+        child, _, subfield = field.partition(".")
+        if child not in PROFILE_CHILDREN:
+            own.append(field)
+        elif not subfield:
+            children[child] = None
+        elif children.get(child, []) is not None:
+            children.setdefault(child, []).append(subfield)
+    return own, children
@@ -0,0 +1,75 @@
+import csv
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEFAULT_GAZETTEER_PATH = Path(__file__).parent / "data" / "gazetteer.csv"
+
+def _normalize(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace so "New York,  NY." matches "new york, ny" """
+    text = re.sub(r"[^\w\s,]", " ", text.lower())
+    parts = [" ".join(part.split()) for part in text.split(",")]
+    return ", ".join(part for part in parts if part)
+
+class Gazetteer:
+    """
+    Offline place-name lookup used to turn the free-text "home" essential
+    detail into coordinates. No network geocoder is involved; unknown places
+    simply resolve to None.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH))
+        # "city, region" / "city, country" -> (lon, lat)
+        self._qualified: Dict[str, Tuple[float, float]] = {}
+        # bare "city" or alias -> (population, (lon, lat)), largest place wins
+        self._bare: Dict[str, Tuple[int, Tuple[float, float]]] = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            print(f"⚠️  Gazetteer file not found at {self.path}, location filtering disabled")
+            return
+
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["lon"]), float(row["lat"]))
+                population = int(row.get("population") or 0)
+                names = [row["city"]] + [alias for alias in (row.get("aliases") or "").split("|") if alias]
+
+                for name in names:
+                    name = _normalize(name)
+                    for qualifier in (row.get("region"), row.get("country")):
+                        if qualifier:
+                            self._qualified[f"{name}, {_normalize(qualifier)}"] = point
+                    if name not in self._bare or self._bare[name][0] < population:
+                        self._bare[name] = (population, point)
+
+    def lookup(self, place: str) -> Optional[Tuple[float, float]]:
+        """Resolve a place string to (longitude, latitude), or None if unknown"""
+        if not place:
+            return None
+        key = _normalize(place)
+        if key in self._qualified:
+            return self._qualified[key]
+
+        # "Brooklyn, New York, USA" -> try "brooklyn, new york", then "brooklyn"
+        parts = key.split(", ")
+        for end in range(len(parts) - 1, 0, -1):
+            candidate = ", ".join(parts[:end])
+            if candidate in self._qualified:
+                return self._qualified[candidate]
+        if parts[0] in self._bare:
+            return self._bare[parts[0]][1]
+        return None
+
+    def to_geojson(self, place: str) -> Optional[Dict]:
+        """Resolve a place string to a GeoJSON point for a 2dsphere index"""
+        point = self.lookup(place)
+        if point is None:
+            return None
+        return {"type": "Point", "coordinates": [point[0], point[1]]}
+
+# Global gazetteer instance
+gazetteer = Gazetteer()
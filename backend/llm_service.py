@@ -1,5 +1,6 @@
 import os
 import json
+import time
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
@@ -18,6 +19,8 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.memory import ConversationBufferMemory
 
+from metrics import llm_request_duration, llm_failures, record_llm_usage
+
 class LLMService:
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
@@ -27,13 +30,9 @@ class LLMService:
         # Configure Google Generative AI
         genai.configure(api_key=self.api_key)
         
-        # Use Gemini 1.5 Flash for chat (free tier)
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            temperature=0.7,
-            max_output_tokens=500,
-            convert_system_message_to_human=True  # Gemini doesn't support system messages directly
-        )
+        # The Gemini client (and its gRPC channel) is created per process on first use
+        self._llm = None
+        self._llm_pid = None
         
         # Simple system prompt for Zooboo
         self.system_prompt ="""
@@ -99,6 +98,33 @@ This isn’t a form. This is just a good conversation.
 """
 
 
+    @property
+    def llm(self) -> ChatGoogleGenerativeAI:
+        """Gemini chat model for this process; not shared across a pre-fork"""
+        if self._llm is None or self._llm_pid != os.getpid():
+            # Use Gemini 1.5 Flash for chat (free tier)
+            self._llm = ChatGoogleGenerativeAI(
+                model="gemini-1.5-flash",
+                temperature=0.7,
+                max_output_tokens=500,
+                convert_system_message_to_human=True  # Gemini doesn't support system messages directly
+            )
+            self._llm_pid = os.getpid()
+        return self._llm
+    
+    def _invoke(self, messages: List, operation: str):
+        """Call the LLM, recording latency and token usage under `operation`"""
+        start = time.perf_counter()
+        try:
+            response = self.llm.invoke(messages)
+        except Exception:
+            llm_failures.inc(operation)
+            raise
+        finally:
+            llm_request_duration.observe(time.perf_counter() - start, operation)
+        record_llm_usage(operation, response)
+        return response
+
     def generate_response(self, user_message: str, conversation_history: Optional[List[Dict]] = None, user_context: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Generate a contextual AI response using RAG-based approach
@@ -127,7 +153,7 @@ This isn’t a form. This is just a good conversation.
             messages.append(HumanMessage(content=user_message))
             
             # Generate response
-            response = self.llm.invoke(messages)
+            response = self._invoke(messages, "chat")
             
             # Extract personality insights from the conversation
             insights = self._extract_insights(user_message, conversation_history, user_context)
@@ -183,7 +209,7 @@ This isn’t a form. This is just a good conversation.
                 HumanMessage(content=insight_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            response = self._invoke(messages, "extract_insights")
             
             # Try to parse JSON response
             try:
@@ -250,7 +276,7 @@ This isn’t a form. This is just a good conversation.
                 HumanMessage(content=question_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            response = self._invoke(messages, "follow_up_questions")
             
             # Parse questions from response
             questions = [q.strip() for q in response.content.split('\n') if q.strip()]
@@ -293,7 +319,7 @@ This isn’t a form. This is just a good conversation.
                 HumanMessage(content=summary_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            response = self._invoke(messages, "conversation_summary")
             
             try:
                 return json.loads(response.content)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end load harness for the Zoobae backend.
+
+Starts the FastAPI app in-process (no uvicorn, no network) against mongomock
+or a local mongod, swaps the Gemini service for a fake LLM, and drives a
+realistic mix of register / login / profile / photo / chat requests from
+concurrent virtual users. Prints throughput and p50/p95/p99 per endpoint,
+MongoDB commands per request and routes that went over their query budget,
+and saves the run as JSON so regressions can be compared run to run.
+Under mongomock, commands are counted through mongomock_monitoring and
+latencies are in-process, not server round trips.
+
+Usage:
+    python loadtest.py --users 20 --duration 30
+    python loadtest.py --mongo-url mongodb://localhost:27017/ --output results/base.json
+    python loadtest.py --compare results/base.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+# Weighted request mix for each virtual user after it has signed up
+DEFAULT_MIX = {
+    "login": 10,
+    "get_profile": 25,
+    "update_profile": 15,
+    "upload_photo": 10,
+    "get_photos": 10,
+    "chat": 20,
+    "chat_history": 10,
+}
+
+# Placeholder upload body; the server stores photos without decoding them
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + bytes(4096) + b"\xff\xd9"
+
+class FakeLLMService:
+    """Stands in for the Gemini-backed LLMService with a fixed think time"""
+
+    def __init__(self, latency: float):
+        from simple_llm_service import SimpleLLMService
+        self.latency = latency
+        self.simple = SimpleLLMService()
+
+    def generate_response(self, user_message, conversation_history=None, user_context=None):
+        time.sleep(self.latency)
+        return self.simple.generate_response(user_message, conversation_history, user_context)
+
+    def analyze_conversation_summary(self, conversation_history):
+        time.sleep(self.latency)
+        return {"overall_personality": "load test"}
+
+def load_app(mongo_url: str, llm_latency: float):
+    """Import main with an isolated upload dir, the chosen database and a fake LLM"""
+    os.environ["MONGO_URL"] = mongo_url
+    # Count commands per request so over-budget routes are reported
+    os.environ.setdefault("QUERY_BUDGET", "1")
+    workdir = tempfile.mkdtemp(prefix="zoobae-load-")
+    os.chdir(workdir)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    fake_llm_module = types.ModuleType("llm_service")
+    fake_llm_module.llm_service = FakeLLMService(llm_latency)
+    sys.modules["llm_service"] = fake_llm_module
+
+    import main
+    return main.app, workdir
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class VirtualUser:
+    def __init__(self, client, recorder, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        self.password = "loadtest-password"
+        self.headers: Dict[str, str] = {}
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.recorder[name].append((time.perf_counter() - start, ok))
+        return response
+
+    async def sign_up(self):
+        await self.request("register", "POST", "/register", json={"email": self.email, "password": self.password})
+        await self.login()
+        await self.request("create_profile", "POST", "/profile", headers=self.headers, json={
+            "name": "Load Tester",
+            "pronouns": "they/them",
+            "essential_details": [
+                {"key": "age", "value": str(self.rng.randint(21, 45)), "is_visible": True},
+                {"key": "height", "value": "5'8\"", "is_visible": True},
+                {"key": "home", "value": self.rng.choice(["New York, NY", "Austin, TX", "Mumbai"]), "is_visible": True}
+            ],
+            "prompts": [],
+            "photos": []
+        })
+
+    async def login(self):
+        response = await self.request("login", "POST", "/login", data={"username": self.email, "password": self.password})
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def get_profile(self):
+        await self.request("get_profile", "GET", "/profile", headers=self.headers)
+
+    async def update_profile(self):
+        prompts = [
+            {"question": f"Question {i}", "answer": f"Answer {self.rng.random():.4f}", "order": i}
+            for i in range(self.rng.randint(1, 5))
+        ]
+        await self.request("update_profile", "PUT", "/profile", headers=self.headers, json={"prompts": prompts})
+
+    async def upload_photo(self):
+        files = {"file": ("photo.jpg", io.BytesIO(JPEG_BYTES), "image/jpeg")}
+        await self.request("upload_photo", "POST", "/profile/photos", headers=self.headers, files=files)
+
+    async def get_photos(self):
+        await self.request("get_photos", "GET", "/profile/photos", headers=self.headers)
+
+    async def chat(self):
+        message = self.rng.choice(["I love travel", "I'm an introvert honestly", "work has been a lot", "tell me something"])
+        await self.request("chat", "POST", "/chat/ai", headers=self.headers, json={"message": message, "user_id": self.email})
+
+    async def chat_history(self):
+        await self.request("chat_history", "GET", "/chat/history", headers=self.headers)
+
+    async def run(self, mix: Dict[str, int], deadline: float):
+        await self.sign_up()
+        actions, weights = zip(*mix.items())
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(actions, weights)[0])()
+
+async def run_load(app, users: int, duration: float, mix: Dict[str, int], seed: int) -> Dict:
+    import httpx
+    import query_budget
+
+    recorder: Dict[str, list] = defaultdict(list)
+    # ASGITransport does not send lifespan events, so run the app's lifespan directly
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            started = time.perf_counter()
+            deadline = started + duration
+            rng = random.Random(seed)
+            query_budget.violations.clear()
+            with query_budget.watch_queries("load") as commands:
+                await asyncio.gather(*(
+                    VirtualUser(client, recorder, random.Random(rng.random())).run(mix, deadline)
+                    for _ in range(users)
+                ))
+            elapsed = time.perf_counter() - started
+    over_budget: Dict[str, int] = defaultdict(int)
+    for log in query_budget.violations:
+        over_budget[log.label] += 1
+
+    endpoints = {}
+    for name, samples in sorted(recorder.items()):
+        latencies = sorted(latency for latency, _ in samples)
+        endpoints[name] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, ok in samples if not ok),
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        # Background work (feed refresh, write-behind) included
+        "mongo_commands": commands.count,
+        "mongo_commands_per_request": round(commands.count / total, 2) if total else 0.0,
+        "over_budget": dict(over_budget),
+        "endpoints": endpoints,
+    }
+
+def print_report(results: Dict, baseline: Optional[Dict] = None):
+    print(f"\n{results['total_requests']} requests in {results['elapsed_s']}s "
+          f"({results['throughput_rps']} req/s, {results['config']['users']} users, db={results['config']['mongo_url']})")
+    print(f"{results['mongo_commands']} MongoDB commands ({results['mongo_commands_per_request']} per request)")
+    for route, count in sorted(results["over_budget"].items()):
+        print(f"⚠️  {route} went over its query budget {count} times")
+    print(f"{'endpoint':<16} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in results["endpoints"].items():
+        line = (f"{name:<16} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+                f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"]:
+            change = (stats["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+            line += f"   p95 {change:+.1f}% vs baseline"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end load harness")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run after sign-up starts")
+    parser.add_argument("--mongo-url", default="mongomock://", help="mongomock:// or a local mongod URL")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM think time in seconds")
+    parser.add_argument("--mix", help='JSON weights, e.g. \'{"chat": 50, "get_profile": 50}\'')
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="where to save results (default loadtest_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous results JSON to diff p95 against")
+    args = parser.parse_args()
+
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    output = Path(args.output or BACKEND_DIR / "loadtest_results" / f"{datetime.now():%Y%m%d-%H%M%S}.json").resolve()
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    app, workdir = load_app(args.mongo_url, args.llm_latency)
+    print(f"🚀 Running {args.users} users for {args.duration}s (uploads go to {workdir})")
+    results = asyncio.run(run_load(app, args.users, args.duration, mix, args.seed))
+    results["config"] = {
+        "users": args.users,
+        "duration": args.duration,
+        "mongo_url": args.mongo_url,
+        "llm_latency": args.llm_latency,
+        "mix": mix,
+        "seed": args.seed,
+        "started_at": datetime.utcnow().isoformat(),
+    }
+
+    print_report(results, baseline)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\n💾 Results saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,82 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from passlib.context import CryptContext
+import pymongo
 import os
 import uuid
-import shutil
-from datetime import datetime
+import json
+import base64
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Optional
 
-from models import UserCreate, UserOut, UserProfile, ProfileUpdate, LoginResponse, ChatMessage, AIResponse, PersonalityInsight
+from models import UserCreate, UserOut, UserProfile, ProfileUpdate, LoginResponse, ChatMessage, AIResponse, PersonalityInsight, Swipe, PhotoOrder
 from pydantic import BaseModel
 from database import db_service
 from llm_service import llm_service
 from simple_llm_service import simple_llm_service
+from feed_service import feed_service
+from chat_writer import chat_writer
+from account_deletion import account_deletion_worker
+from messaging import MessagingHub
+from metrics import MetricsMiddleware, render_metrics
+from query_budget import QUERY_BUDGET_ENABLED, QueryBudgetMiddleware, query_budget
+from fast_json import FastJSONResponse, declared_fields, trusted_response, dumps
+from profile_attributes import build_attribute_filter
+from migrations import MIGRATIONS, MigrationLeaseHeld, MigrationRunner
+from photo_storage import photo_storage, LocalPhotoStorage
+from profile_cache import profile_cache
+from conditional import content_etag, etag_matches, not_modified, with_etag
+from fieldsets import parse_fields, projection_for
+from content_encoding import ContentEncodingMiddleware
 
 # Simple test message model
 class TestChatMessage(BaseModel):
     message: str
     user_context: Optional[dict] = None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker lifecycle: runs in every process after a pre-fork server
+    forks it, so each worker opens its own Mongo pool and background threads.
+    """
+    db_service.connect()
+    profile_cache.start()
+    feed_service.start()
+    chat_writer.start()
+    account_deletion_worker.start()
+    await messaging_hub.start()
+    try:
+        yield
+    finally:
+        # Flush buffered messages before the connection goes away
+        await messaging_hub.stop()
+        chat_writer.stop()
+        feed_service.stop()
+        account_deletion_worker.stop()
+        profile_cache.stop()
+        db_service.close()
 
-# Create uploads directory if it doesn't exist
-UPLOADS_DIR = Path("uploads")
-UPLOADS_DIR.mkdir(exist_ok=True)
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+if QUERY_BUDGET_ENABLED:
+    app.add_middleware(QueryBudgetMiddleware)
+# Outermost: negotiates gzip/brotli and MessagePack for every response
+app.add_middleware(ContentEncodingMiddleware)
 
-# Mount static files for serving uploaded images
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Serve locally stored photos (sharded and legacy flat files alike)
+if isinstance(photo_storage, LocalPhotoStorage):
+    app.mount("/uploads", StaticFiles(directory=str(photo_storage.root)), name="uploads")
+
+# Real-time messaging between matches (in-process fan-out for this worker)
+messaging_hub = MessagingHub(db_service)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -40,6 +89,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     return user
 
 @app.post("/register", response_model=UserOut)
+@query_budget(1)
 def register(user: UserCreate):
     try:
         hashed_password = pwd_context.hash(user.password)
@@ -48,16 +98,17 @@ def register(user: UserCreate):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/login", response_model=LoginResponse)
+@app.post("/login", response_model=LoginResponse, response_class=FastJSONResponse)
+@query_budget(4)
 def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = db_service.get_user_by_email(form_data.username)
     if not user or not pwd_context.verify(form_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Get user profile
+    # trusted_response drops its internal fields (derived filter attributes, photo storage keys, ...)
     profile = db_service.get_profile(user["_id"])
     
-    return {
+    return trusted_response({
         "access_token": user["email"],
         "token_type": "bearer",
         "user": {
@@ -65,31 +116,44 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
             "email": user["email"],
             "profile": profile
         }
-    }
+    }, LoginResponse)
 
-@app.get("/profile", response_model=UserProfile)
-def get_profile(current_user: dict = Depends(get_current_user)):
-    profile = db_service.get_profile(current_user["_id"])
+@app.get("/profile", response_model=UserProfile, response_class=FastJSONResponse)
+@query_budget(4)
+def get_profile(request: Request, fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """
+    Get the current user's profile. fields= selects a sparse fieldset, e.g.
+    fields=name,photos.url for a preview; photos/prompts are only read when selected.
+    """
+    etag = content_etag(current_user, "profile", "photos", "prompts", variant=fields)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    try:
+        profile = db_service.get_profile(current_user["_id"], parse_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return profile
+    return with_etag(trusted_response(profile, UserProfile), etag)
 
 @app.post("/profile", response_model=UserProfile)
+@query_budget(6)
 def create_profile(profile_data: UserProfile, current_user: dict = Depends(get_current_user)):
-    # Check if profile already exists
-    existing_profile = db_service.get_profile(current_user["_id"])
-    if existing_profile:
-        raise HTTPException(status_code=400, detail="Profile already exists")
-    
     # Set the user_id in the profile data
     profile_dict = profile_data.dict()
     profile_dict["user_id"] = current_user["_id"]
     
-    profile_id = db_service.create_profile(current_user["_id"], profile_dict)
+    # The unique user_id index rejects a second profile, so there is no read up front
+    try:
+        db_service.create_profile(current_user["_id"], profile_dict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    feed_service.notify_changed(current_user["_id"])
     created_profile = db_service.get_profile(current_user["_id"])
     return created_profile
 
 @app.put("/profile", response_model=UserProfile)
+@query_budget(10)
 def update_profile(update_data: ProfileUpdate, current_user: dict = Depends(get_current_user)):
     print(f"=== Update Profile Request ===")
     print(f"User ID: {current_user['_id']}")
@@ -105,6 +169,11 @@ def update_profile(update_data: ProfileUpdate, current_user: dict = Depends(get_
     prompts = update_dict.pop("prompts", None)
     print(f"Prompts to save: {len(prompts) if prompts else 0}")
     
+    # Check the bound before replacing anything (only the embedded profile schema has one)
+    prompt_limit = db_service.CHILD_LIMITS.get("prompts")
+    if prompts and prompt_limit is not None and len(prompts) > prompt_limit:
+        raise HTTPException(status_code=400, detail=f"A profile can have at most {prompt_limit} prompts")
+    
     # Update profile (excluding prompts)
     if update_dict:
         success = db_service.update_profile(current_user["_id"], update_dict)
@@ -118,16 +187,19 @@ def update_profile(update_data: ProfileUpdate, current_user: dict = Depends(get_
         deleted_count = db_service.delete_user_prompts(current_user["_id"])
         print(f"Deleted {deleted_count} existing prompts")
         
-        # Then add new prompts
-        for i, prompt in enumerate(prompts):
-            prompt_data = {
+        # Then add new prompts in a single insert
+        prompt_ids = db_service.add_prompts(current_user["_id"], [
+            {
                 "user_id": current_user["_id"],
                 "question": prompt["question"],
                 "answer": prompt["answer"],
                 "order": prompt["order"]
             }
-            prompt_id = db_service.add_prompt(current_user["_id"], prompt_data)
-            print(f"Added prompt {i+1}: {prompt_id}")
+            for prompt in prompts
+        ])
+        print(f"Added {len(prompt_ids)} prompts")
+    
+    feed_service.notify_changed(current_user["_id"])
     
     # Get updated profile
     updated_profile = db_service.get_profile(current_user["_id"])
@@ -137,6 +209,7 @@ def update_profile(update_data: ProfileUpdate, current_user: dict = Depends(get_
     return updated_profile
 
 @app.post("/profile/photos")
+@query_budget(4)
 def upload_photo(
     file: UploadFile = File(...),
     caption: str = "",
@@ -146,71 +219,127 @@ def upload_photo(
     file_extension = Path(file.filename).suffix if file.filename else ".jpg"
     photo_id = str(uuid.uuid4())
     filename = f"{photo_id}{file_extension}"
-    file_path = UPLOADS_DIR / filename
     
-    # Save file locally
+    # Save file to the configured photo storage
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        photo_storage.save(filename, file.file, file.content_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
     # Generate URL for the uploaded file
-    photo_url = f"http://192.168.1.8:8001/uploads/{filename}"
+    photo_url = photo_storage.url(filename)
     
     photo_data = {
         "id": photo_id,
         "url": photo_url,
+        "storage_key": filename,
         "caption": caption,
-        "ai_suggestion": f"AI suggested caption for {file.filename}",
-        "order": 0,  # Will be calculated based on existing photos
-        "is_primary": False
+        "ai_suggestion": f"AI suggested caption for {file.filename}"
     }
     
-    db_service.add_photo(current_user["_id"], photo_data)
+    try:
+        db_service.add_photo(current_user["_id"], photo_data)
+    except ValueError as e:
+        # Photo limit reached (embedded profile schema)
+        photo_storage.delete(filename)
+        raise HTTPException(status_code=400, detail=str(e))
+    feed_service.notify_changed(current_user["_id"])
     return {"photo_id": photo_id, "url": photo_url}
 
-@app.get("/profile/photos")
-def get_photos(current_user: dict = Depends(get_current_user)):
-    photos = db_service.get_user_photos(current_user["_id"])
-    return {"photos": photos}
+@app.get("/profile/photos", response_class=FastJSONResponse)
+@query_budget(2)
+def get_photos(request: Request, fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    etag = content_etag(current_user, "photos", variant=fields)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    try:
+        photos = db_service.get_user_photos(current_user["_id"], parse_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return with_etag(trusted_response({"photos": photos}), etag)
+
+@app.put("/profile/photos/order")
+@query_budget(5)
+def reorder_photos(photo_order: PhotoOrder, current_user: dict = Depends(get_current_user)):
+    """Apply a complete new photo ordering; the first photo becomes primary"""
+    if not db_service.reorder_photos(current_user["_id"], photo_order.photo_ids):
+        raise HTTPException(status_code=400, detail="photo_ids must list each of your photos exactly once")
+    feed_service.notify_changed(current_user["_id"])
+    return {"message": "Photos reordered"}
+
+@app.put("/profile/photos/{photo_id}/primary")
+@query_budget(4)
+def set_primary_photo(photo_id: str, current_user: dict = Depends(get_current_user)):
+    if not db_service.set_primary_photo(current_user["_id"], photo_id):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    feed_service.notify_changed(current_user["_id"])
+    return {"message": "Primary photo updated"}
 
 @app.put("/profile/photos/{photo_id}")
+@query_budget(3)
 def update_photo_caption(
     photo_id: str,
     caption: str,
     current_user: dict = Depends(get_current_user)
 ):
-    success = db_service.update_photo(photo_id, {"caption": caption})
+    success = db_service.update_photo(current_user["_id"], photo_id, {"caption": caption})
     if not success:
         raise HTTPException(status_code=404, detail="Photo not found")
     return {"message": "Photo caption updated"}
 
 @app.delete("/profile/photos/{photo_id}")
+@query_budget(5)
 def delete_photo(photo_id: str, current_user: dict = Depends(get_current_user)):
     print(f"Attempting to delete photo with ID: {photo_id}")
     print(f"User ID: {current_user['_id']}")
     
-    # Check if photo exists and belongs to user
-    photos = db_service.get_user_photos(current_user["_id"])
-    photo_ids = [photo.get("_id") for photo in photos]
-    print(f"User's photo IDs: {photo_ids}")
-    
-    success = db_service.delete_photo(photo_id)
+    success = db_service.delete_photo(current_user["_id"], photo_id)
     if not success:
         raise HTTPException(status_code=404, detail="Photo not found")
+    feed_service.notify_changed(current_user["_id"])
     return {"message": "Photo deleted"}
 
-@app.get("/admin/update-photo-urls")
-def update_photo_urls():
-    """Update existing photo URLs to use localhost (admin endpoint)"""
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+@app.post("/admin/migrations/{name}", dependencies=[Depends(require_admin)])
+def start_migration(name: str, dry_run: bool = False, ops_per_second: Optional[float] = None):
+    """Run (or resume) a registered data migration in the background"""
+    migration = MIGRATIONS.get(name)
+    if migration is None:
+        raise HTTPException(status_code=404, detail="Unknown migration")
+    runner = MigrationRunner(db_service, ops_per_second=ops_per_second, dry_run=dry_run)
+    if dry_run:
+        threading.Thread(target=runner.run, args=(migration,), name=f"migration-{name}", daemon=True).start()
+        return {"message": f"Migration {name} started", "dry_run": dry_run}
+
+    state = runner.status(name)
+    if state and state.get("status") == "completed":
+        return {"message": f"Migration {name} already completed", "dry_run": dry_run}
+    # Claimed here, atomically, so concurrent requests can't both start it; a crashed run's lease expires
     try:
-        db_service.update_photo_urls_to_localhost()
-        return {"message": "Photo URLs updated successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to update photo URLs: {str(e)}")
+        state = runner.claim(name)
+    except MigrationLeaseHeld:
+        raise HTTPException(status_code=409, detail="Migration already running")
+    threading.Thread(target=runner.resume, args=(migration, state), name=f"migration-{name}", daemon=True).start()
+    return {"message": f"Migration {name} started", "dry_run": dry_run}
+
+@app.get("/admin/migrations/{name}", dependencies=[Depends(require_admin)])
+def migration_status(name: str):
+    if name not in MIGRATIONS:
+        raise HTTPException(status_code=404, detail="Unknown migration")
+    state = db_service.migrations.find_one({"_id": name}) or {"_id": name, "status": "not_started"}
+    return trusted_response(state)
+
+# Messages of recent conversation the LLM sees (it uses the last few of these)
+CHAT_CONTEXT_MESSAGES = 50
 
 @app.post("/chat/ai", response_model=AIResponse)
+@query_budget(14)
 def chat_with_ai(
     chat_message: ChatMessage,
     current_user: dict = Depends(get_current_user)
@@ -219,8 +348,9 @@ def chat_with_ai(
     Chat with AI using RAG-based LLM to gather personality insights and relationship preferences
     """
     try:
-        # Get user's chat history for context
-        chat_history = db_service.get_user_chat_history(current_user["_id"])
+        # Get user's latest chat messages for context, never reaching archived ones unless there
+        # are few (including this worker's turns still waiting in the write-behind buffer)
+        chat_history = chat_writer.get_recent_chat_messages(current_user["_id"], CHAT_CONTEXT_MESSAGES)
         
         # Get user's profile for additional context
         user_profile = db_service.get_profile(current_user["_id"])
@@ -242,24 +372,25 @@ def chat_with_ai(
         else:
             raise HTTPException(status_code=500, detail="Gemini AI service not available. Please check your API key and package installation.")
         
-        # Save the user message to chat history
-        db_service.save_chat_message(
+        # Save the user message to chat history (write-behind: batched with other
+        # requests' writes and saved a moment after the response)
+        chat_writer.save_chat_message(
             user_id=current_user["_id"],
             message=chat_message.message,
             sender="user"
         )
         
         # Save the AI response to chat history
-        db_service.save_chat_message(
+        chat_writer.save_chat_message(
             user_id=current_user["_id"],
             message=ai_response["message"],
             sender="ai",
             insights=ai_response.get("personality_insights", {})
         )
         
-        # Update personality insights if new ones are found
+        # Update personality insights if new ones are found (feeds refresh once they are saved)
         if ai_response.get("personality_insights"):
-            db_service.save_personality_insights(
+            chat_writer.save_personality_insights(
                 user_id=current_user["_id"],
                 insights=ai_response["personality_insights"]
             )
@@ -275,14 +406,37 @@ def chat_with_ai(
         print(f"AI chat error: {e}")
         raise HTTPException(status_code=500, detail=f"AI chat error: {str(e)}")
 
-@app.get("/chat/history")
-def get_chat_history(current_user: dict = Depends(get_current_user)):
+@app.get("/chat/history", response_class=FastJSONResponse)
+@query_budget(6)
+def get_chat_history(
+    request: Request,
+    fields: Optional[str] = None,
+    before: Optional[datetime] = None,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
     """
-    Get user's chat history with AI
+    Get the user's latest `limit` chat messages with AI, oldest first (304 when
+    unchanged since the client's ETag). Per-message insights are left out unless
+    selected, e.g. fields=message,sender,insights. With before=<timestamp>, returns
+    the `limit` messages just before it instead, so clients can page back from the
+    oldest message they have (archived ones included).
     """
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    if before is not None and before.tzinfo is not None:
+        before = before.astimezone(timezone.utc).replace(tzinfo=None)
+    variant = fields
+    if before is not None or limit != 50:
+        variant = f"{fields}|{before.isoformat() if before else ''}|{limit}"
+    etag = content_etag(current_user, "chat", variant=variant)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     try:
-        history = db_service.get_user_chat_history(current_user["_id"])
-        return {"chat_history": history}
+        history = db_service.get_recent_chat_messages(current_user["_id"], limit, parse_fields(fields), before=before)
+        return with_etag(trusted_response({"chat_history": history}), etag)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get chat history: {str(e)}")
 
@@ -292,7 +446,7 @@ def get_personality_summary(current_user: dict = Depends(get_current_user)):
     Get comprehensive personality summary from chat history
     """
     try:
-        chat_history = db_service.get_user_chat_history(current_user["_id"])
+        chat_history = db_service.get_recent_chat_messages(current_user["_id"], CHAT_CONTEXT_MESSAGES)
         if not chat_history:
             raise HTTPException(status_code=404, detail="No chat history found")
         
@@ -301,6 +455,319 @@ def get_personality_summary(current_user: dict = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate personality summary: {str(e)}")
 
+# Sections /bootstrap can return, each loaded by its own query
+BOOTSTRAP_SECTIONS = ("user", "profile", "photos", "prompts", "chat", "insights")
+BOOTSTRAP_SECTION_TIMEOUT = float(os.getenv("BOOTSTRAP_SECTION_TIMEOUT", "3"))
+# Collection behind each section whose fields can be selected
+BOOTSTRAP_COLLECTIONS = {
+    "profile": "profiles",
+    "photos": "photos",
+    "prompts": "prompts",
+    "chat": "chat_messages",
+    "insights": "personality_insights",
+}
+
+def _declared_profile(profile: Optional[dict]) -> Optional[dict]:
+    """A profile document without its internal fields (_id, derived filter attributes, ...)"""
+    return declared_fields(profile, UserProfile) if profile else None
+
+def _bootstrap_loaders(user: dict, chat_limit: int):
+    user_id = user["_id"]
+    return {
+        "user": lambda fields: {"id": user_id, "email": user["email"]},
+        "profile": lambda fields: _declared_profile(db_service.get_profile_document(user_id, fields)),
+        "photos": lambda fields: db_service.get_user_photos(user_id, fields),
+        "prompts": lambda fields: db_service.get_user_prompts(user_id, fields),
+        "chat": lambda fields: db_service.get_recent_chat_messages(user_id, chat_limit, fields),
+        "insights": lambda fields: db_service.get_personality_insights(user_id, fields),
+    }
+
+@app.get("/bootstrap", response_class=FastJSONResponse)
+@query_budget(10)
+async def bootstrap(
+    sections: Optional[str] = None,
+    fields: Optional[str] = None,
+    chat_limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Everything the app needs on launch in one response. Sections are loaded
+    concurrently; one that fails or times out comes back as null with
+    "failed" or "timed out" under "errors" instead of failing the whole
+    request.
+
+    sections= picks a subset (default: all). fields= takes section-prefixed
+    fields, e.g. fields=profile.name,photos.url,chat.message; sections not
+    mentioned use their default projection.
+    """
+    requested = parse_fields(sections) or list(BOOTSTRAP_SECTIONS)
+    unknown = set(requested) - set(BOOTSTRAP_SECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(sorted(unknown))}")
+    section_fields: dict = {}
+    for field in parse_fields(fields) or []:
+        section, _, name = field.partition(".")
+        if section not in requested or section not in BOOTSTRAP_COLLECTIONS or not name:
+            raise HTTPException(status_code=400, detail=f"fields must look like <section>.<field> for a requested section: {field}")
+        section_fields.setdefault(section, []).append(name)
+    try:
+        for section, names in section_fields.items():
+            projection_for(BOOTSTRAP_COLLECTIONS[section], names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    loaders = _bootstrap_loaders(current_user, max(1, min(chat_limit, 100)))
+
+    def load(section: str):
+        # The deadline goes on the queries themselves (maxTimeMS), so the server
+        # abandons a slow section instead of it holding a worker and a connection
+        with pymongo.timeout(BOOTSTRAP_SECTION_TIMEOUT):
+            return loaders[section](section_fields.get(section))
+
+    results = await asyncio.gather(*(run_in_threadpool(load, section) for section in requested), return_exceptions=True)
+    payload: dict = {"errors": {}}
+    for section, result in zip(requested, results):
+        if isinstance(result, Exception):
+            timed_out = getattr(result, "timeout", False)
+            if not timed_out:
+                print(f"❌ /bootstrap {section} failed for {current_user['_id']}: {result}")
+            payload[section] = None
+            payload["errors"][section] = "timed out" if timed_out else "failed"
+        else:
+            payload[section] = result
+    if len(payload["errors"]) == len(requested):
+        raise HTTPException(status_code=503, detail={"errors": payload["errors"]})
+    return trusted_response(payload)
+
+# Largest page of profiles one discovery request may ask for
+MAX_DISCOVER_PAGE = 100
+
+def check_discover_page(limit: int, skip: int):
+    """400 for a page Mongo shouldn't be asked for (too large, empty or negative)"""
+    if not 1 <= limit <= MAX_DISCOVER_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_DISCOVER_PAGE}")
+    if skip < 0:
+        raise HTTPException(status_code=400, detail="skip must not be negative")
+
+@app.get("/discover")
+def discover(limit: int = 20, skip: int = 0, current_user: dict = Depends(get_current_user)):
+    """
+    Get ranked candidate profiles from the user's precomputed feed
+    """
+    check_discover_page(limit, skip)
+    try:
+        profiles = feed_service.get_feed(current_user["_id"], limit=limit, skip=skip)
+        return {"profiles": profiles}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get candidate feed: {str(e)}")
+
+@app.get("/discover/nearby")
+def discover_nearby(
+    radius_km: float = 50,
+    limit: int = 20,
+    skip: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get profiles within radius_km of the user's home, nearest first
+    """
+    check_discover_page(limit, skip)
+    profile = db_service.get_profile(current_user["_id"])
+    if not profile or not profile.get("location"):
+        raise HTTPException(status_code=400, detail="Set a recognizable home location to search nearby")
+    
+    try:
+        matches = db_service.get_profiles_for_matching(
+            limit=limit,
+            skip=skip,
+            near=profile["location"],
+            radius_km=radius_km,
+            seen=db_service.get_seen_filter(current_user["_id"]),
+            exclude_user_id=current_user["_id"]
+        )
+        return {"profiles": matches}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search nearby profiles: {str(e)}")
+
+@app.get("/discover/search")
+def discover_search(
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    min_height_cm: Optional[int] = None,
+    max_height_cm: Optional[int] = None,
+    drinker: Optional[bool] = None,
+    has_kids: Optional[bool] = None,
+    radius_km: Optional[float] = None,
+    limit: int = 20,
+    skip: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Filter profiles on age, height, drinking, kids and optionally distance
+    """
+    check_discover_page(limit, skip)
+    near = None
+    if radius_km is not None:
+        profile = db_service.get_profile(current_user["_id"])
+        if not profile or not profile.get("location"):
+            raise HTTPException(status_code=400, detail="Set a recognizable home location to search nearby")
+        near = profile["location"]
+    
+    filters = build_attribute_filter(
+        min_age=min_age,
+        max_age=max_age,
+        min_height_cm=min_height_cm,
+        max_height_cm=max_height_cm,
+        drinker=drinker,
+        has_kids=has_kids
+    )
+    
+    try:
+        matches = db_service.get_profiles_for_matching(
+            limit=limit,
+            skip=skip,
+            near=near,
+            radius_km=radius_km,
+            filters=filters,
+            seen=db_service.get_seen_filter(current_user["_id"]),
+            exclude_user_id=current_user["_id"]
+        )
+        return {"profiles": matches}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search profiles: {str(e)}")
+
+@app.post("/discover/swipe")
+def swipe(swipe: Swipe, current_user: dict = Depends(get_current_user)):
+    """
+    Record a swipe so the profile stops showing up in discovery
+    """
+    if swipe.target_user_id == current_user["_id"]:
+        raise HTTPException(status_code=400, detail="Cannot swipe on yourself")
+    
+    try:
+        db_service.mark_seen(current_user["_id"], swipe.target_user_id)
+        
+        # The seen filter may report false positives, so likes are always
+        # recorded exactly, in the pair's match document
+        result = {"target_user_id": swipe.target_user_id, "liked": swipe.liked, "new_like": False, "matched": False}
+        if swipe.liked:
+            result.update(db_service.like_user(current_user["_id"], swipe.target_user_id))
+        
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to record swipe: {str(e)}")
+
+@app.post("/likes/{user_id}")
+@query_budget(5)
+def like_user(user_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Like a user; creates a match if they already liked you back
+    """
+    if user_id == current_user["_id"]:
+        raise HTTPException(status_code=400, detail="Cannot like yourself")
+    if not db_service.get_user_by_id(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    try:
+        db_service.mark_seen(current_user["_id"], user_id)
+        return db_service.like_user(current_user["_id"], user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to like user: {str(e)}")
+
+# Largest page of matches (or match messages) one request may ask for
+MAX_MATCHES_PAGE = 100
+
+def _encode_match_cursor(match: dict) -> str:
+    matched_at = match["matched_at"].replace(tzinfo=timezone.utc)
+    payload = {"t": int(matched_at.timestamp() * 1000), "id": match["_id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def _decode_match_cursor(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {"matched_at": datetime.utcfromtimestamp(payload["t"] / 1000), "_id": payload["id"]}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/matches")
+@query_budget(5)
+def get_matches(limit: int = 20, cursor: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """
+    Get the user's matches, newest first, paginated with an opaque cursor
+    """
+    if not 1 <= limit <= MAX_MATCHES_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_MATCHES_PAGE}")
+    decoded_cursor = _decode_match_cursor(cursor) if cursor else None
+    
+    try:
+        matches = db_service.get_user_matches(current_user["_id"], limit=limit, cursor=decoded_cursor)
+        other_ids = [next(u for u in match["users"] if u != current_user["_id"]) for match in matches]
+        profiles = {profile["user_id"]: profile for profile in db_service.get_profiles(other_ids)}
+        
+        return {
+            "matches": [
+                {
+                    "match_id": match["_id"],
+                    "user_id": other_id,
+                    "matched_at": match["matched_at"],
+                    "profile": profiles.get(other_id)
+                }
+                for match, other_id in zip(matches, other_ids)
+            ],
+            "next_cursor": _encode_match_cursor(matches[-1]) if len(matches) == limit else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get matches: {str(e)}")
+
+@app.get("/matches/{match_id}/messages")
+def get_match_messages(
+    match_id: str,
+    limit: int = 50,
+    before: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get earlier messages in a match conversation
+    """
+    if not 1 <= limit <= MAX_MATCHES_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_MATCHES_PAGE}")
+    if not db_service.get_match(match_id, current_user["_id"]):
+        raise HTTPException(status_code=404, detail="Match not found")
+    return {"messages": db_service.get_match_messages(match_id, limit=limit, before=before)}
+
+@app.websocket("/ws/matches/{match_id}")
+async def match_chat(websocket: WebSocket, match_id: str, token: str):
+    """
+    Real-time conversation between two matched users.
+    Clients send {"text": "..."} and receive {"type": "message", ...} events.
+    """
+    user = await run_in_threadpool(db_service.get_user_by_email, token)
+    if not user or not await run_in_threadpool(db_service.get_match, match_id, user["_id"]):
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    connection = messaging_hub.connect(websocket, user["_id"], match_id)
+    try:
+        while not connection.closed:
+            data = await websocket.receive_json()
+            text = str(data.get("text", "")).strip()
+            if text:
+                await messaging_hub.send(match_id, user["_id"], text)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Match chat error: {e}")
+    finally:
+        await messaging_hub.disconnect(connection)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus metrics: per-route latency/status, MongoDB and LLM timings
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def root():
     return {"message": "Dating app backend is running!"}
@@ -336,19 +803,48 @@ def chat_with_ai_test(chat_message: TestChatMessage):
         print(f"Error in AI chat test: {e}")
         raise HTTPException(status_code=500, detail=f"AI chat error: {str(e)}")
 
+# Flush streamed export lines to the socket in chunks of about this size
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def _export_ndjson(user_id: str):
+    buffer = bytearray()
+    for record_type, document in db_service.iter_user_export(user_id):
+        buffer += dumps({"type": record_type, "data": document})
+        buffer += b"\n"
+        if len(buffer) >= EXPORT_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+@app.get("/user/export")
+def export_user_data(current_user: dict = Depends(get_current_user)):
+    """
+    Download all of the user's data as NDJSON, one record per line,
+    streamed straight from MongoDB cursors
+    """
+    filename = f"zoobae-export-{datetime.utcnow():%Y%m%d}.ndjson"
+    return StreamingResponse(
+        _export_ndjson(current_user["_id"]),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Account deletion endpoints
 @app.delete("/user/delete-all")
 def delete_all_user_data(current_user: dict = Depends(get_current_user)):
     """
-    Delete all user data from all collections
+    Delete the account: access is revoked immediately and all data,
+    including photo files, is purged in the background
     """
     try:
         user_id = current_user["_id"]
-        results = db_service.delete_all_user_data(user_id)
+        db_service.mark_user_deleted(user_id)
+        account_deletion_worker.enqueue(user_id)
         
         return {
-            "message": "All user data deleted successfully",
-            "deleted_items": results
+            "message": "Account deleted. Remaining data is being removed.",
+            "status": "pending"
         }
         
     except Exception as e:
@@ -365,6 +861,7 @@ def delete_user_profile(current_user: dict = Depends(get_current_user)):
         
         if not success:
             raise HTTPException(status_code=404, detail="Profile not found")
+        feed_service.notify_changed(user_id)
             
         return {"message": "User profile deleted successfully"}
         
@@ -379,6 +876,7 @@ def delete_user_photos(current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user["_id"]
         deleted_count = db_service.delete_user_photos(user_id)
+        feed_service.notify_changed(user_id)
         
         return {
             "message": f"Deleted {deleted_count} photos successfully",
@@ -404,7 +902,3 @@ def delete_user_prompts(current_user: dict = Depends(get_current_user)):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting prompts: {str(e)}")
-
-@app.on_event("shutdown")
-def shutdown_event():
-    db_service.close() 
\ No newline at end of file
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+# Per-connection outbox size; a client this far behind is disconnected
+OUTBOX_SIZE = 256
+# Give up on a single websocket send after this many seconds
+SEND_TIMEOUT = 5.0
+# Message writes are batched into one insert_many per this many messages...
+WRITE_BATCH_SIZE = 100
+# ...or per this many seconds, whichever comes first
+WRITE_FLUSH_INTERVAL = 0.05
+# A failed write is retried after this many seconds, doubling up to WRITE_RETRY_MAX_DELAY
+WRITE_RETRY_DELAY = 0.5
+WRITE_RETRY_MAX_DELAY = 30.0
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class Broker(ABC):
+    """
+    Pub/sub interface used to fan messages out to every connection in a
+    conversation. InProcessBroker only reaches sockets in this worker; a
+    cross-worker broker (Redis, NATS, ...) implements the same three methods.
+    """
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: Dict):
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str, callback: Callable[[Dict], None]):
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, channel: str, callback: Callable[[Dict], None]):
+        ...
+
+class InProcessBroker(Broker):
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[Dict], None]]] = defaultdict(list)
+
+    async def publish(self, channel: str, payload: Dict):
+        # Callbacks only enqueue, so fan-out never awaits a client
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(payload)
+
+    def subscribe(self, channel: str, callback: Callable[[Dict], None]):
+        self._subscribers[channel].append(callback)
+
+    def unsubscribe(self, channel: str, callback: Callable[[Dict], None]):
+        callbacks = self._subscribers.get(channel)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscribers[channel]
+
+class Connection:
+    """
+    One websocket plus a bounded outbox drained by its own sender task.
+
+    Fan-out only ever does a non-blocking put; if the outbox is full or a
+    send stalls past SEND_TIMEOUT, the client is disconnected instead of
+    holding up the event loop or other clients.
+    """
+
+    def __init__(self, websocket, user_id: str, match_id: str, outbox_size: int = OUTBOX_SIZE):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.match_id = match_id
+        self.outbox: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=outbox_size)
+        self.closed = False
+        self.dropped = False
+        self._sender: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._sender = asyncio.ensure_future(self._send_loop())
+
+    def deliver(self, text: str):
+        if self.closed:
+            return
+        try:
+            self.outbox.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped = True
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Wake the sender so it can shut the socket down
+        try:
+            self.outbox.put_nowait(None)
+        except asyncio.QueueFull:
+            if self._sender:
+                self._sender.cancel()
+
+    async def _send_loop(self):
+        try:
+            while True:
+                text = await self.outbox.get()
+                if text is None:
+                    break
+                await asyncio.wait_for(self.websocket.send_text(text), SEND_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.dropped = True
+        except Exception as e:
+            print(f"Error sending to {self.user_id}: {e}")
+        finally:
+            self.closed = True
+            if self.dropped:
+                try:
+                    # 1013: try again later
+                    await self.websocket.close(code=1013)
+                except Exception:
+                    pass
+
+    async def wait_closed(self):
+        if self._sender:
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+
+class ConnectionRegistry:
+    """Tracks this worker's open connections by conversation"""
+
+    def __init__(self):
+        self._by_match: Dict[str, Set[Connection]] = defaultdict(set)
+
+    def add(self, connection: Connection) -> bool:
+        """Register a connection; returns True if it's the first for its conversation"""
+        connections = self._by_match[connection.match_id]
+        connections.add(connection)
+        return len(connections) == 1
+
+    def remove(self, connection: Connection) -> bool:
+        """Unregister a connection; returns True if it was the last for its conversation"""
+        connections = self._by_match.get(connection.match_id)
+        if not connections:
+            return False
+        connections.discard(connection)
+        if not connections:
+            del self._by_match[connection.match_id]
+            return True
+        return False
+
+    def fan_out(self, match_id: str, payload: Dict):
+        connections = self._by_match.get(match_id)
+        if not connections:
+            return
+        # Encode once per conversation, not once per socket
+        text = json.dumps(payload, default=_json_default)
+        for connection in list(connections):
+            connection.deliver(text)
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self._by_match.values())
+
+class MessageWriter:
+    """
+    Buffers outgoing messages and persists them with batched insert_many
+    calls. Messages are delivered before they are saved, so a failed batch
+    is retried with backoff (later ones queue behind it) until stop().
+    """
+
+    def __init__(self, db, batch_size: int = WRITE_BATCH_SIZE, flush_interval: float = WRITE_FLUSH_INTERVAL,
+                 retry_delay: float = WRITE_RETRY_DELAY):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._queue: "asyncio.Queue[Optional[Dict]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._stopping = True
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+    def enqueue(self, message: Dict):
+        self._queue.put_nowait(message)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        running = True
+        while running:
+            message = await self._queue.get()
+            if message is None:
+                break
+            batch = [message]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if message is None:
+                    running = False
+                    break
+                batch.append(message)
+            await self._save(batch)
+
+    async def _save(self, batch: List[Dict]):
+        """Write a batch, retrying with backoff; only stop() gives up on it"""
+        loop = asyncio.get_event_loop()
+        delay = self.retry_delay
+        while True:
+            try:
+                # pymongo is blocking, so the insert runs off the event loop
+                await loop.run_in_executor(None, self.db.save_messages, batch)
+                return
+            except Exception as e:
+                print(f"Error saving {len(batch)} messages: {e}")
+                if self._stopping:
+                    print(f"⚠️  {len(batch)} delivered messages were not saved")
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WRITE_RETRY_MAX_DELAY)
+
+class MessagingHub:
+    """Ties websocket connections, the broker and the batched writer together"""
+
+    def __init__(self, db, broker: Optional[Broker] = None):
+        self.db = db
+        self.broker = broker or InProcessBroker()
+        self.registry = ConnectionRegistry()
+        self.writer: Optional[MessageWriter] = None
+        self._callbacks: Dict[str, Callable[[Dict], None]] = {}
+
+    async def start(self):
+        self.writer = MessageWriter(self.db)
+        self.writer.start()
+
+    async def stop(self):
+        if self.writer:
+            await self.writer.stop()
+            self.writer = None
+
+    def connect(self, websocket, user_id: str, match_id: str) -> Connection:
+        connection = Connection(websocket, user_id, match_id)
+        connection.start()
+        if self.registry.add(connection):
+            # Subscribe once per conversation per worker, not per socket
+            callback = lambda payload, match_id=match_id: self.registry.fan_out(match_id, payload)
+            self._callbacks[match_id] = callback
+            self.broker.subscribe(self._channel(match_id), callback)
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        connection.close()
+        if self.registry.remove(connection):
+            callback = self._callbacks.pop(connection.match_id, None)
+            if callback:
+                self.broker.unsubscribe(self._channel(connection.match_id), callback)
+        await connection.wait_closed()
+
+    async def send(self, match_id: str, sender_id: str, text: str) -> Dict:
+        if self.writer is None:
+            # Fanning out a message that is never saved would lose it on reconnect
+            raise RuntimeError("MessagingHub is not started; call start() before sending")
+        message = {
+            "_id": str(uuid.uuid4()),
+            "match_id": match_id,
+            "sender_id": sender_id,
+            "text": text,
+            "sent_at": datetime.utcnow()
+        }
+        self.writer.enqueue(message)
+        await self.broker.publish(self._channel(match_id), {"type": "message", **message})
+        return message
+
+    def _channel(self, match_id: str) -> str:
+        return f"match:{match_id}"
@@ -0,0 +1,223 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+# Latency buckets in seconds, shared by HTTP, Mongo and LLM histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Metric(ABC):
+    """
+    Base for lock-free metrics.
+
+    Every thread writes to its own shard (a dict of label values -> list of
+    numbers), so recording never takes a lock and never races; /metrics sums
+    the shards when scraped. Arrays are allocated once per label set per
+    thread, not per observation.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._shards: List[Dict[Tuple[str, ...], List[float]]] = []
+        self._local = threading.local()
+        REGISTRY.append(self)
+
+    def _shard(self) -> Dict[Tuple[str, ...], List[float]]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            # list.append is atomic, and a shard is only ever written by its thread
+            self._shards.append(shard)
+        return shard
+
+    def _merged(self) -> Dict[Tuple[str, ...], List[float]]:
+        merged: Dict[Tuple[str, ...], List[float]] = {}
+        for shard in list(self._shards):
+            for labels, values in list(shard.items()):
+                total = merged.setdefault(labels, [0.0] * len(values))
+                for index, value in enumerate(values):
+                    total[index] += value
+        return merged
+
+    def _format_labels(self, labels: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, labels))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for name, value in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    @abstractmethod
+    def _render_samples(self) -> List[str]:
+        ...
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        shard = self._shard()
+        values = shard.get(labels)
+        if values is None:
+            values = shard[labels] = [0.0]
+        values[0] += amount
+
+    def _render_samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._format_labels(labels)} {values[0]:g}"
+            for labels, values in sorted(self._merged().items())
+        ]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        values = shard.get(labels)
+        if values is None:
+            # One slot per bucket, +Inf, then sum and count
+            values = shard[labels] = [0.0] * (len(self.buckets) + 3)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        for labels, values in sorted(self._merged().items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(labels, ('le', f'{bound:g}'))} {cumulative:g}")
+            cumulative += values[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{self._format_labels(labels, ('le', '+Inf'))} {cumulative:g}")
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {values[-1]:g}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render_metrics() -> str:
+    """Render every registered metric in Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# HTTP
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+)
+
+# MongoDB
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command")
+)
+mongo_command_failures = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command")
+)
+
+# LLM
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "LLM invoke latency", ("operation",)
+)
+llm_tokens = Counter(
+    "llm_tokens_total", "LLM tokens by operation and direction", ("operation", "direction")
+)
+llm_failures = Counter(
+    "llm_failures_total", "Failed LLM invocations", ("operation",)
+)
+
+# Profile cache (hit rate = hits / all requests, per kind)
+profile_cache_requests = Counter(
+    "profile_cache_requests_total", "Profile cache lookups by kind and result (local_hit, remote_hit, miss)", ("kind", "result")
+)
+profile_cache_errors = Counter(
+    "profile_cache_errors_total", "Failed shared-cache operations", ("operation",)
+)
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency and status per route template
+    (e.g. /profile/photos/{photo_id}), so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe(time.perf_counter() - start, method, route)
+            http_requests.inc(method, route, status[0])
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple[int, int], str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        # Commands like insert/find/aggregate name their collection; others (ping, endSessions) don't
+        self._collections[(event.request_id, event.operation_id)] = collection if isinstance(collection, str) else "-"
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.request_id, event.operation_id), "-")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.request_id, event.operation_id), "-")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
+
+def record_llm_usage(operation: str, response):
+    """Record token counts from a LangChain chat response, if the provider reported them"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        llm_tokens.inc(operation, "input", amount=usage.get("input_tokens", 0))
+        llm_tokens.inc(operation, "output", amount=usage.get("output_tokens", 0))
+        return
+    # Older langchain-google-genai only exposes Gemini's raw usage block
+    usage = (getattr(response, "response_metadata", None) or {}).get("usage_metadata") or {}
+    if usage:
+        llm_tokens.inc(operation, "input", amount=usage.get("prompt_token_count", 0))
+        llm_tokens.inc(operation, "output", amount=usage.get("candidates_token_count", 0))
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Resumable, batched data migrations for DatabaseService.
+
+Each migration selects documents with a query and turns each one into a
+write operation. The runner walks the matching documents in _id order,
+applies them as unordered bulk_write batches, checkpoints the last _id
+after every batch in the `migrations` collection (so an interrupted run
+resumes where it stopped), throttles to a target ops/sec and reports
+progress. Dry runs count and sample the operations without writing.
+
+A run holds a lease on its `migrations` document, claimed atomically and
+renewed by every checkpoint. A second runner is refused while the lease
+is live; one left behind by a crashed run expires after
+MIGRATION_LEASE_SECONDS and the migration can then be resumed.
+
+Usage:
+    python migrations.py list
+    python migrations.py run photo_urls --dry-run
+    python migrations.py run filter_attributes --ops-per-second 2000
+    python migrations.py status filter_attributes
+"""
+
+import argparse
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from fieldsets import PROFILE_CHILDREN
+from photo_storage import photo_storage
+from profile_cache import profile_cache
+
+# A run that stops checkpointing for this long is presumed dead and can be resumed
+MIGRATION_LEASE_SECONDS = int(os.getenv("MIGRATION_LEASE_SECONDS", "300"))
+
+class MigrationLeaseHeld(RuntimeError):
+    """Another runner holds a live lease on the migration"""
+
+class Migration(ABC):
+    """Base class: subclasses pick the documents and build one write per document"""
+
+    name = ""
+    description = ""
+    # Attribute name of the collection on DatabaseService
+    collection = ""
+    # Fields the operation needs; None fetches whole documents
+    projection: Optional[Dict[str, Any]] = None
+    # Content kinds the writes change ("profile", "photos", ...); after_write bumps
+    # them for the batch's users (by user_id, so project it) like a normal write would
+    content_kinds: Tuple[str, ...] = ()
+
+    def query(self) -> Dict[str, Any]:
+        """Filter selecting documents that still need migrating"""
+        return {}
+
+    @abstractmethod
+    def build_operation(self, db, document: Dict):
+        """Return a pymongo write operation for `document`, or None to skip it"""
+
+    def before_write(self, db, documents: List[Dict]):
+        """Called with a batch's documents before its operations are written (not in dry runs)"""
+
+    def after_write(self, db, documents: List[Dict]):
+        """Called with a batch's documents once its operations are written (not in dry runs)"""
+        if self.content_kinds:
+            # New ETags and no cached copies, so clients and caches don't keep serving the old content
+            db.contents_changed((document.get("user_id") for document in documents), *self.content_kinds)
+
+class PhotoUrlMigration(Migration):
+    name = "photo_urls"
+    description = "Rewrite placeholder storage.example.com photo URLs to served upload URLs"
+    collection = "photos"
+    projection = {"id": 1, "url": 1, "user_id": 1}
+    content_kinds = ("photos",)
+
+    PLACEHOLDER_PREFIX = "^https://storage\\.example\\.com/"
+
+    def query(self):
+        return {"url": {"$regex": self.PLACEHOLDER_PREFIX}}
+
+    @staticmethod
+    def storage_key(document: Dict) -> str:
+        return f"{document.get('id') or document['_id']}.jpg"
+
+    def build_operation(self, db, document):
+        key = self.storage_key(document)
+        return UpdateOne({"_id": document["_id"]}, {"$set": {"url": photo_storage.url(key), "storage_key": key}})
+
+    def before_write(self, db, documents):
+        # These uploads predate sharding and sit flat in the uploads root; url() points into the shards
+        for document in documents:
+            photo_storage.move_to_shard(self.storage_key(document))
+
+class FilterAttributeBackfill(Migration):
+    name = "filter_attributes"
+    description = "Derive typed age/height_cm/drinker/has_kids/location fields from essential_details"
+    collection = "profiles"
+    projection = {"essential_details": 1, "user_id": 1}
+    content_kinds = ("profile",)
+
+    def build_operation(self, db, document):
+        update = db.filter_attribute_update(document.get("essential_details"))
+        if not update:
+            return None
+        return UpdateOne({"_id": document["_id"]}, update)
+
+class PrimaryPhotoOrder(Migration):
+    name = "primary_photo_order"
+    description = "Fold the legacy is_primary flag into photo order (primary = lowest order)"
+    collection = "photos"
+    projection = {"is_primary": 1, "user_id": 1}
+    content_kinds = ("photos",)
+
+    def query(self):
+        return {"is_primary": {"$exists": True}}
+
+    def build_operation(self, db, document):
+        update: Dict[str, Any] = {"$unset": {"is_primary": ""}}
+        if document.get("is_primary"):
+            # Counter-assigned orders start at 1, so -1 puts it in front of the legacy 0s
+            update["$set"] = {"order": -1}
+        return UpdateOne({"_id": document["_id"]}, update)
+
+class EmbedProfileChildren(Migration):
+    name = "embed_profile_children"
+    description = "Move photos and prompts into their profile documents (run once every worker uses PROFILE_SCHEMA=embedded)"
+    collection = "profiles"
+    projection = {"user_id": 1}
+
+    def query(self):
+        return {"embedded": {"$ne": True}}
+
+    def build_operation(self, db, document):
+        return UpdateOne(
+            {"_id": document["_id"], "embedded": {"$ne": True}},
+            {"$set": {**db.embedded_children(document["user_id"]), "embedded": True}}
+        )
+
+    def after_write(self, db, documents):
+        # Every profile in the batch is embedded now (here or on first touch), so the copied children can go;
+        # read back what was embedded, as a child inserted since the copy is only in its collection
+        embedded = db.profiles.find(
+            {"_id": {"$in": [document["_id"] for document in documents]}, "embedded": True},
+            {f"{child}._id": 1 for child in PROFILE_CHILDREN}
+        )
+        db.drop_referenced_children(embedded)
+
+class ExtractProfileChildren(Migration):
+    name = "extract_profile_children"
+    description = "Move embedded photos and prompts back to their collections (run with writes paused, then use PROFILE_SCHEMA=referenced)"
+    collection = "profiles"
+    projection = {"user_id": 1, "photos": 1, "prompts": 1}
+
+    def query(self):
+        return {"embedded": True}
+
+    def build_operation(self, db, document):
+        return UpdateOne(
+            {"_id": document["_id"], "embedded": True},
+            {"$unset": {"photos": "", "prompts": "", "embedded": ""}}
+        )
+
+    def before_write(self, db, documents):
+        # Copy the arrays out first, so an interrupted batch never leaves a profile without them
+        # (dropping copies an interrupted run already made)
+        db.drop_referenced_children(documents)
+        for child in PROFILE_CHILDREN:
+            children = [
+                {**item, "user_id": document["user_id"]}
+                for document in documents
+                for item in document.get(child) or []
+            ]
+            if children:
+                getattr(db, child).insert_many(children)
+
+    def after_write(self, db, documents):
+        for document in documents:
+            profile_cache.invalidate(document["user_id"])
+
+class ChatBuckets(Migration):
+    name = "chat_buckets"
+    description = "Move chat_messages into per-user, per-day chat_buckets (run once every worker uses CHAT_STORAGE=buckets)"
+    collection = "users"
+    projection = {"_id": 1}
+
+    def query(self):
+        return {"chat_buckets_at": {"$exists": False}}
+
+    def build_operation(self, db, document):
+        # Marks the user done; their messages move in before_write
+        return UpdateOne({"_id": document["_id"]}, {"$set": {"chat_buckets_at": datetime.utcnow()}})
+
+    def before_write(self, db, documents):
+        for document in documents:
+            db.move_chat_messages_to_buckets(document["_id"])
+
+# Registered migrations, in the order they should run on a fresh deployment
+# (the layout ones only when switching PROFILE_SCHEMA or CHAT_STORAGE)
+MIGRATIONS: Dict[str, Migration] = {
+    migration.name: migration
+    for migration in [
+        PhotoUrlMigration(), FilterAttributeBackfill(), PrimaryPhotoOrder(),
+        EmbedProfileChildren(), ExtractProfileChildren(), ChatBuckets(),
+    ]
+}
+
+class MigrationRunner:
+    def __init__(self, db, batch_size: int = 500, ops_per_second: Optional[float] = None,
+                 dry_run: bool = False, sample_size: int = 3, lease_seconds: int = MIGRATION_LEASE_SECONDS):
+        self.db = db
+        self.batch_size = batch_size
+        self.ops_per_second = ops_per_second
+        self.dry_run = dry_run
+        self.sample_size = sample_size
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def status(self, name: str) -> Optional[Dict]:
+        return self.db.migrations.find_one({"_id": name})
+
+    def claim(self, name: str) -> Optional[Dict]:
+        """
+        Take the run lease with one findAndModify and return the state it
+        replaced (None on a first run). Raises MigrationLeaseHeld while
+        another runner's lease is live; an expired one is taken over.
+        """
+        now = datetime.utcnow()
+        try:
+            return self.db.migrations.find_one_and_update(
+                # Not running, or its runner stopped renewing the lease (leases predating this field count as expired)
+                {"_id": name, "$or": [{"status": {"$ne": "running"}}, {"lease_expires_at": {"$not": {"$gt": now}}}]},
+                {"$set": {
+                    "status": "running",
+                    "lease_owner": self.owner,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                }},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # The document exists but didn't match: the lease is live
+            raise MigrationLeaseHeld(f"{name} is already running")
+
+    def _checkpoint(self, name: str, fields: Dict[str, Any]):
+        """Save progress and renew the lease; raises MigrationLeaseHeld if another runner took it over"""
+        if self.dry_run:
+            return
+        now = datetime.utcnow()
+        fields["updated_at"] = now
+        fields["lease_expires_at"] = now + timedelta(seconds=self.lease_seconds)
+        result = self.db.migrations.update_one({"_id": name, "lease_owner": self.owner}, {"$set": fields})
+        if not result.matched_count:
+            raise MigrationLeaseHeld(f"{name}: lease lost to another runner")
+
+    def run(self, migration: Migration, restart: bool = False) -> Dict[str, Any]:
+        """Run (or resume) a migration and return its final status"""
+        if self.dry_run:
+            return self.resume(migration, None)
+        state = None if restart else self.status(migration.name)
+        if state and state.get("status") == "completed":
+            print(f"✅ {migration.name} already completed ({state['processed']} documents)")
+            return state
+        state = self.claim(migration.name)
+        return self.resume(migration, None if restart else state)
+
+    def resume(self, migration: Migration, state: Optional[Dict]) -> Dict[str, Any]:
+        """Process a claimed migration from the checkpoint in `state` (None starts over)"""
+        collection = getattr(self.db, migration.collection)
+        last_id = state.get("last_id") if state else None
+        processed = state.get("processed", 0) if state else 0
+        modified = state.get("modified", 0) if state else 0
+        self._checkpoint(migration.name, {
+            "status": "running",
+            "processed": processed,
+            "modified": modified,
+            "last_id": last_id,
+            "started_at": (state or {}).get("started_at") or datetime.utcnow(),
+        })
+
+        query = dict(migration.query())
+        if last_id is not None:
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]} if "_id" in query else {**query, "_id": {"$gt": last_id}}
+        remaining = collection.count_documents(query)
+        mode = "DRY RUN " if self.dry_run else ""
+        resumed = f" (resuming after {processed})" if last_id is not None else ""
+        print(f"🔄 {mode}{migration.name}: {remaining} documents to process{resumed}")
+
+        cursor = collection.find(query, migration.projection).sort("_id", 1).batch_size(self.batch_size)
+        started = time.perf_counter()
+        samples: List[Any] = []
+        operations = 0
+        done = 0
+        batch: List[Any] = []
+        batch_documents: List[Dict] = []
+
+        for document in cursor:
+            operation = migration.build_operation(self.db, document)
+            batch_documents.append(document)
+            last_id = document["_id"]
+            if operation is not None:
+                batch.append(operation)
+                operations += 1
+                if len(samples) < self.sample_size:
+                    samples.append(operation)
+            if len(batch_documents) < self.batch_size:
+                continue
+            modified += self._apply(migration, collection, batch, batch_documents)
+            processed += len(batch_documents)
+            done += len(batch_documents)
+            self._checkpoint(migration.name, {"processed": processed, "modified": modified, "last_id": last_id})
+            self._report(migration, started, done, remaining)
+            batch, batch_documents = [], []
+
+        if batch_documents:
+            modified += self._apply(migration, collection, batch, batch_documents)
+            processed += len(batch_documents)
+            done += len(batch_documents)
+            self._checkpoint(migration.name, {"processed": processed, "modified": modified, "last_id": last_id})
+            self._report(migration, started, done, remaining)
+
+        if self.dry_run:
+            for operation in samples:
+                print(f"   sample: {operation}")
+            print(f"✅ DRY RUN {migration.name}: {done} documents scanned, {operations} writes would be issued")
+            return {"_id": migration.name, "status": "dry_run", "processed": done, "operations": operations}
+
+        self._checkpoint(migration.name, {"status": "completed", "completed_at": datetime.utcnow()})
+        print(f"✅ {migration.name}: {processed} documents processed, {modified} modified")
+        return self.status(migration.name)
+
+    def _apply(self, migration: Migration, collection, batch: List[Any], documents: List[Dict]) -> int:
+        """Write one batch unordered; returns the number of modified documents"""
+        if not batch or self.dry_run:
+            return 0
+        migration.before_write(self.db, documents)
+        try:
+            modified = collection.bulk_write(batch, ordered=False).modified_count
+        except BulkWriteError as e:
+            self._checkpoint(migration.name, {"status": "failed", "error": str(e.details)[:1000]})
+            raise
+        migration.after_write(self.db, documents)
+        return modified
+
+    def _report(self, migration: Migration, started: float, done: int, remaining: int):
+        self._throttle(started, done)
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        print(f"   {migration.name}: {done}/{remaining} ({rate:,.0f} docs/s)")
+
+    def _throttle(self, started: float, done: int):
+        """Sleep just enough to keep the average rate at or under ops_per_second"""
+        if not self.ops_per_second:
+            return
+        ahead = done / self.ops_per_second - (time.perf_counter() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run resumable data migrations")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("list", help="list registered migrations")
+    run = subcommands.add_parser("run", help="run or resume a migration")
+    run.add_argument("name", choices=sorted(MIGRATIONS))
+    run.add_argument("--dry-run", action="store_true", help="count and sample operations without writing")
+    run.add_argument("--batch-size", type=int, default=500)
+    run.add_argument("--ops-per-second", type=float, help="throttle to this many documents per second")
+    run.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    status = subcommands.add_parser("status", help="show a migration's checkpoint")
+    status.add_argument("name", choices=sorted(MIGRATIONS))
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for migration in MIGRATIONS.values():
+            print(f"{migration.name:<24} {migration.description}")
+        return
+
+    from database import db_service
+    if args.command == "status":
+        print(MigrationRunner(db_service).status(args.name) or f"{args.name} has not run yet")
+        return
+
+    runner = MigrationRunner(
+        db_service,
+        batch_size=args.batch_size,
+        ops_per_second=args.ops_per_second,
+        dry_run=args.dry_run
+    )
+    try:
+        runner.run(MIGRATIONS[args.name], restart=args.restart)
+    except MigrationLeaseHeld as e:
+        print(f"❌ {e}")
+    db_service.close()
+
+if __name__ == "__main__":
+    main()
@@ -45,6 +45,13 @@ class ProfileUpdate(BaseModel):
     prompts: Optional[List[Prompt]] = None
     photos: Optional[List[Photo]] = None
 
+class PhotoOrder(BaseModel):
+    photo_ids: List[str]  # every photo of the user, primary first
+
+class Swipe(BaseModel):
+    target_user_id: str
+    liked: bool = False
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
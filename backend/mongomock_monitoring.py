@@ -0,0 +1,122 @@
+"""
+Command monitoring for mongomock, which has none of its own.
+
+A real MongoClient reports every command to its event listeners (metrics,
+query budgets). mongomock ignores event_listeners, so monitor() wraps its
+Collection methods to send the same started/succeeded/failed events, one
+per command the operation would send to a server. Cursors count as one
+find or aggregate (getMores of large results are not modelled), and
+durations are in-process times rather than server round trips.
+"""
+
+import functools
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from typing import Iterable, List
+
+# Collection method -> the command a server would receive
+COLLECTION_COMMANDS = {
+    "find": "find",
+    "find_one": "find",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "bulk_write": None,
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "estimated_document_count": "count",
+    "distinct": "distinct",
+    "create_index": "createIndexes",
+    "drop": "drop",
+}
+
+# bulk_write request class -> command; runs of the same command go in one batch
+BULK_COMMANDS = {
+    "InsertOne": "insert",
+    "UpdateOne": "update",
+    "UpdateMany": "update",
+    "ReplaceOne": "update",
+    "DeleteOne": "delete",
+    "DeleteMany": "delete",
+}
+
+_listeners: List = []
+_request_ids = itertools.count(1)
+# mongomock methods call each other (find_one -> find); only the outermost call is a command
+_state = threading.local()
+
+def _bulk_commands(requests, ordered: bool) -> List[str]:
+    commands = [BULK_COMMANDS.get(type(request).__name__, "update") for request in requests]
+    if ordered:
+        return [command for command, _ in itertools.groupby(commands)]
+    return sorted(set(commands), key=commands.index)
+
+def _monitored(method, command_name):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_state, "depth", 0) or not _listeners:
+            return method(self, *args, **kwargs)
+        if command_name is None:
+            requests = args[0] if args else kwargs.get("requests", [])
+            commands = _bulk_commands(requests, kwargs.get("ordered", True))
+            details = {}
+        else:
+            commands = [command_name]
+            first = args[0] if args else kwargs.get("filter", kwargs.get("pipeline"))
+            details = {"pipeline" if command_name == "aggregate" else "filter": first}
+        events = [
+            SimpleNamespace(
+                command_name=command,
+                command={command: self.name, **details},
+                database_name=self.database.name,
+                request_id=next(_request_ids),
+                operation_id=None,
+                duration_micros=0,
+                failure=None
+            )
+            for command in commands
+        ]
+        for event in events:
+            event.operation_id = event.request_id
+            for listener in _listeners:
+                listener.started(event)
+
+        _state.depth = 1
+        started = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as e:
+            for event in events:
+                event.duration_micros = int((time.perf_counter() - started) * 1e6)
+                event.failure = {"errmsg": str(e)}
+                for listener in _listeners:
+                    listener.failed(event)
+            raise
+        finally:
+            _state.depth = 0
+        for event in events:
+            event.duration_micros = int((time.perf_counter() - started) * 1e6)
+            for listener in _listeners:
+                listener.succeeded(event)
+        return result
+    wrapper.__monitored__ = True
+    return wrapper
+
+def monitor(listeners: Iterable):
+    """Send command events for every mongomock collection in this process to `listeners`"""
+    from mongomock.collection import Collection
+
+    _listeners[:] = list(listeners)
+    for method_name, command_name in COLLECTION_COMMANDS.items():
+        method = getattr(Collection, method_name, None)
+        if method is not None and not getattr(method, "__monitored__", False):
+            setattr(Collection, method_name, _monitored(method, command_name))
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+# boto3 is optional; it is only needed when PHOTO_STORAGE=s3
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+    ClientError = Exception
+
+# Where uploaded photos live and the public URL prefix they are served from
+PHOTO_STORAGE = os.getenv("PHOTO_STORAGE", "local").lower()
+UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", "uploads"))
+PHOTO_BASE_URL = os.getenv("PHOTO_BASE_URL", "http://localhost:8001/uploads").rstrip("/")
+
+class PhotoStorage(ABC):
+    """
+    Stores photo bytes under a key (e.g. "<photo_id>.jpg") and turns keys
+    into URLs. Also used, with its own root or bucket, for chat archive segments.
+    """
+
+    @abstractmethod
+    def save(self, key: str, data: BinaryIO, content_type: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        """Stored bytes for a key; raises FileNotFoundError if it is not there"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Remove a stored photo; returns False if it was not there"""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+    def move_to_shard(self, key: str) -> bool:
+        """Move a file stored before sharding to where url() points; False if there was none to move"""
+        return False
+
+    def key_for(self, photo: Dict) -> str:
+        """Storage key of a photo document (older documents only have a URL)"""
+        if photo.get("storage_key"):
+            return photo["storage_key"]
+        url = photo.get("url") or ""
+        if "/uploads/" in url:
+            return url.rsplit("/", 1)[-1]
+        return f"{photo.get('id', photo.get('_id'))}.jpg"
+
+class LocalPhotoStorage(PhotoStorage):
+    """
+    Files on local disk, fanned out over two levels of hash-prefix
+    directories (uploads/ab/cd/<key>, 65,536 leaves) so no single directory
+    grows to millions of entries. Files written before sharding stay flat
+    in the root and are still found and served.
+    """
+
+    def __init__(self, root: Path = UPLOADS_DIR, base_url: str = PHOTO_BASE_URL):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def shard(key: str) -> str:
+        digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{key}"
+
+    def path(self, key: str) -> Path:
+        return self.root / self.shard(key)
+
+    def save(self, key: str, data: BinaryIO, content_type: Optional[str] = None):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary name and rename so readers never see a partial file
+        partial = path.with_name(f".{key}.partial")
+        with open(partial, "wb") as buffer:
+            shutil.copyfileobj(data, buffer)
+        os.replace(partial, path)
+
+    def read(self, key: str) -> bytes:
+        for path in (self.path(key), self.root / key):
+            try:
+                return path.read_bytes()
+            except FileNotFoundError:
+                continue
+        raise FileNotFoundError(key)
+
+    def delete(self, key: str) -> bool:
+        for path in (self.path(key), self.root / key):
+            try:
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                continue
+        return False
+
+    def move_to_shard(self, key: str) -> bool:
+        flat = self.root / key
+        if not flat.is_file():
+            return False
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(flat, path)
+        return True
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{self.shard(key)}"
+
+class S3PhotoStorage(PhotoStorage):
+    """
+    Any S3-compatible object store (AWS S3, or MinIO locally via
+    S3_ENDPOINT_URL). Photos are served straight from the bucket, or from
+    S3_PUBLIC_URL when a CDN sits in front of it.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, public_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key: Optional[str] = None, secret_key: Optional[str] = None):
+        if boto3 is None:
+            raise RuntimeError("PHOTO_STORAGE=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+        if public_url:
+            self.base_url = public_url.rstrip("/")
+        elif endpoint_url:
+            self.base_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.base_url = f"https://{bucket}.s3.amazonaws.com"
+
+    def save(self, key: str, data: BinaryIO, content_type: Optional[str] = None):
+        extra = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(data, self.bucket, key, ExtraArgs=extra)
+
+    def read(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            raise FileNotFoundError(f"s3://{self.bucket}/{key}: {e}")
+
+    def delete(self, key: str) -> bool:
+        try:
+            # DeleteObject succeeds whether or not the key exists, so look first
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                print(f"Error deleting s3://{self.bucket}/{key}: {e}")
+            return False
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+def build_photo_storage() -> PhotoStorage:
+    """Pick the backend from PHOTO_STORAGE (local or s3)"""
+    if PHOTO_STORAGE == "s3":
+        return S3PhotoStorage(
+            bucket=os.getenv("S3_BUCKET", "zoobae-photos"),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+            public_url=os.getenv("S3_PUBLIC_URL"),
+            region=os.getenv("S3_REGION"),
+            access_key=os.getenv("S3_ACCESS_KEY"),
+            secret_key=os.getenv("S3_SECRET_KEY")
+        )
+    return LocalPhotoStorage()
+
+# Global photo storage instance
+photo_storage = build_photo_storage()
@@ -0,0 +1,113 @@
+import re
+from typing import List, Dict, Any, Optional
+
+from gazetteer import gazetteer
+
+# Top-level profile fields derived from essential_details for indexed filtering
+FILTER_ATTRIBUTE_FIELDS = ["age", "height_cm", "drinker", "has_kids", "location"]
+
+_YES_WORDS = {"yes", "y", "true", "sometimes", "socially", "often", "regularly", "occasionally", "have", "has"}
+_NO_WORDS = {"no", "n", "false", "never", "none", "sober", "dont", "don't", "doesnt", "doesn't", "not"}
+_UNSURE_WORDS = {"maybe", "unsure", "sure", "undecided", "prefer"}
+
+def parse_age(value: str) -> Optional[int]:
+    """Parse "25" or "25 years" into an integer age"""
+    match = re.search(r"\d+", value or "")
+    if not match:
+        return None
+    age = int(match.group())
+    return age if 18 <= age <= 120 else None
+
+def parse_height_cm(value: str) -> Optional[int]:
+    """Parse heights like 5'8", 5 ft 8 in, 173 cm or 1.73 m into centimetres"""
+    text = (value or "").lower().strip()
+    if not text:
+        return None
+
+    feet_inches = re.match(r"^(\d)\s*(?:'|ft|feet|foot)\s*(\d{1,2})?\s*(?:\"|''|in|inches)?$", text)
+    if feet_inches:
+        feet = int(feet_inches.group(1))
+        inches = int(feet_inches.group(2) or 0)
+        height = round((feet * 12 + inches) * 2.54)
+    else:
+        number = re.match(r"^(\d+(?:\.\d+)?)\s*(cm|m)?$", text)
+        if not number:
+            return None
+        amount = float(number.group(1))
+        unit = number.group(2)
+        if unit == "m" or (unit is None and amount < 3):
+            height = round(amount * 100)
+        else:
+            height = round(amount)
+
+    return height if 100 <= height <= 250 else None
+
+def parse_yes_no(value: str) -> Optional[bool]:
+    """Parse free-text answers such as "Socially" or "Don't have kids" into a boolean"""
+    words = set(re.findall(r"[a-z']+", (value or "").lower()))
+    if words & _UNSURE_WORDS:
+        return None
+    if words & _NO_WORDS:
+        return False
+    if words & _YES_WORDS:
+        return True
+    return None
+
+def derive_filter_attributes(essential_details: Optional[List[Dict]]) -> Dict[str, Any]:
+    """
+    Derive typed, indexable fields from essential_details.
+
+    Hidden details (is_visible=False) are never derived, so nobody can filter
+    on them. Every field in FILTER_ATTRIBUTE_FIELDS is present in the result;
+    None means the field should be removed from the profile.
+    """
+    attributes: Dict[str, Any] = {field: None for field in FILTER_ATTRIBUTE_FIELDS}
+    for detail in essential_details or []:
+        if not detail.get("is_visible", True):
+            continue
+        key = detail.get("key")
+        value = detail.get("value", "")
+        if key == "age":
+            attributes["age"] = parse_age(value)
+        elif key == "height":
+            attributes["height_cm"] = parse_height_cm(value)
+        elif key == "drinker":
+            attributes["drinker"] = parse_yes_no(value)
+        elif key == "kids":
+            attributes["has_kids"] = parse_yes_no(value)
+        elif key == "home":
+            attributes["location"] = gazetteer.to_geojson(value)
+    return attributes
+
+def build_attribute_filter(
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    min_height_cm: Optional[int] = None,
+    max_height_cm: Optional[int] = None,
+    drinker: Optional[bool] = None,
+    has_kids: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Build a profiles query over the derived fields (equality fields first to match the indexes)"""
+    query: Dict[str, Any] = {}
+    if drinker is not None:
+        query["drinker"] = drinker
+    if has_kids is not None:
+        query["has_kids"] = has_kids
+
+    age: Dict[str, int] = {}
+    if min_age is not None:
+        age["$gte"] = min_age
+    if max_age is not None:
+        age["$lte"] = max_age
+    if age:
+        query["age"] = age
+
+    height: Dict[str, int] = {}
+    if min_height_cm is not None:
+        height["$gte"] = min_height_cm
+    if max_height_cm is not None:
+        height["$lte"] = max_height_cm
+    if height:
+        query["height_cm"] = height
+
+    return query
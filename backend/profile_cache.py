@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+import bson
+
+from metrics import profile_cache_requests, profile_cache_errors
+
+# redis is optional; without it (or REDIS_URL) only the in-process tier is used
+try:
+    import redis
+    from redis.exceptions import WatchError
+except ImportError:
+    redis = None
+    WatchError = Exception
+
+REDIS_URL = os.getenv("REDIS_URL")
+PROFILE_CACHE_ENABLED = os.getenv("PROFILE_CACHE", "1").lower() in ("1", "true", "yes")
+# Shared tier TTL; entries are also dropped on write, this only bounds missed invalidations
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "300"))
+# In-process tier: small and short-lived, refreshed from the shared tier
+PROFILE_CACHE_LOCAL_TTL = float(os.getenv("PROFILE_CACHE_LOCAL_TTL", "5"))
+PROFILE_CACHE_LOCAL_SIZE = int(os.getenv("PROFILE_CACHE_LOCAL_SIZE", "10000"))
+
+# Per-user cache entries, all dropped together when the user's profile changes
+# ("embedded_profile" is the whole document under PROFILE_SCHEMA=embedded)
+PROFILE_CACHE_KINDS = ("profile", "photos", "prompts", "embedded_profile")
+INVALIDATION_CHANNEL = "profile-cache:invalidate"
+
+class LocalLRUCache:
+    """Thread-safe LRU with a per-entry TTL, holding encoded values"""
+
+    def __init__(self, max_entries: int = PROFILE_CACHE_LOCAL_SIZE, ttl: float = PROFILE_CACHE_LOCAL_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def connect_redis(url: Optional[str]):
+    """Redis client for a redis:// URL, fakeredis for fakeredis://, or None"""
+    if not url:
+        return None
+    if url.startswith("fakeredis://"):
+        # In-memory stand-in for local experiments and the load harness
+        import fakeredis
+        return fakeredis.FakeRedis()
+    if redis is None:
+        print("⚠️  redis not available. Profile cache will only use the in-process tier.")
+        return None
+    return redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+class ProfileCache:
+    """
+    Two-tier read-through cache for per-user profile data.
+
+    Reads check the in-process LRU, then the shared Redis tier, then call
+    the loader (MongoDB) and fill both tiers. Writers call invalidate(),
+    which drops the user's entries from both tiers and publishes the user
+    id so other workers drop their in-process copies too.
+
+    Values are stored BSON-encoded, which keeps datetimes intact and means
+    every hit returns a fresh copy that callers may mutate. Redis errors are
+    counted and fall through to the loader rather than failing the request.
+
+    A value loaded before a concurrent invalidate() must not be cached
+    after it. Each invalidation bumps a generation (one per worker for the
+    in-process tier, a per-user Redis counter for the shared tier), and a
+    fill is skipped if its generation moved since the read started.
+    """
+
+    def __init__(self, remote=None, local: Optional[LocalLRUCache] = None,
+                 ttl: int = PROFILE_CACHE_TTL, enabled: bool = PROFILE_CACHE_ENABLED):
+        self.remote = remote
+        self.local = local or LocalLRUCache()
+        self.ttl = ttl
+        self.enabled = enabled
+        self._stop = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        # Bumped by every invalidation this worker sees, to skip racing in-process fills
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+
+    @staticmethod
+    def key(kind: str, user_id: str) -> str:
+        return f"profile-cache:{kind}:{user_id}"
+
+    @staticmethod
+    def generation_key(user_id: str) -> str:
+        return f"profile-cache:generation:{user_id}"
+
+    def get(self, kind: str, user_id: str, loader: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return loader()
+        key = self.key(kind, user_id)
+
+        encoded = self.local.get(key)
+        if encoded is not None:
+            profile_cache_requests.inc(kind, "local_hit")
+            return bson.decode(encoded)["v"]
+
+        generation = self._generation
+        remote_generation = None
+        remote_ok = False
+        if self.remote is not None:
+            try:
+                # The user's generation comes back with the value, for guarding the fill below
+                encoded, remote_generation = self.remote.mget(key, self.generation_key(user_id))
+                remote_ok = True
+            except Exception as e:
+                profile_cache_errors.inc("get")
+                print(f"Profile cache read failed: {e}")
+                encoded = None
+            if encoded is not None:
+                profile_cache_requests.inc(kind, "remote_hit")
+                self._fill_local(key, encoded, generation)
+                return bson.decode(encoded)["v"]
+
+        profile_cache_requests.inc(kind, "miss")
+        value = loader()
+        if value is None:
+            return None
+        encoded = bson.encode({"v": value})
+        self._fill_local(key, encoded, generation)
+        if remote_ok:
+            self._fill_remote(key, user_id, encoded, remote_generation)
+        return bson.decode(encoded)["v"]
+
+    def _fill_local(self, key: str, encoded: bytes, generation: int):
+        with self._generation_lock:
+            if self._generation == generation:
+                self.local.set(key, encoded)
+
+    def _fill_remote(self, key: str, user_id: str, encoded: bytes, generation: Optional[bytes]):
+        """Cache a loaded value unless the user was invalidated since `generation` was read"""
+        generation_key = self.generation_key(user_id)
+        try:
+            with self.remote.pipeline() as pipeline:
+                pipeline.watch(generation_key)
+                if pipeline.get(generation_key) != generation:
+                    return
+                pipeline.multi()
+                pipeline.set(key, encoded, ex=self.ttl)
+                pipeline.execute()
+        except WatchError:
+            # Invalidated between the check and the write
+            pass
+        except Exception as e:
+            profile_cache_errors.inc("set")
+            print(f"Profile cache write failed: {e}")
+
+    def _clear_local(self):
+        with self._generation_lock:
+            self._generation += 1
+            self.local.clear()
+
+    def _drop_local(self, user_id: str):
+        with self._generation_lock:
+            self._generation += 1
+            self.local.delete(self.key(kind, user_id) for kind in PROFILE_CACHE_KINDS)
+
+    def invalidate(self, user_id: Optional[str]):
+        """Drop every cached entry for a user, in this worker and the shared tier"""
+        if not self.enabled or not user_id:
+            return
+        self._drop_local(user_id)
+        if self.remote is not None:
+            try:
+                pipeline = self.remote.pipeline(transaction=False)
+                pipeline.delete(*(self.key(kind, user_id) for kind in PROFILE_CACHE_KINDS))
+                # Outlives any in-flight load, so a fill that read the old generation is refused
+                pipeline.incr(self.generation_key(user_id))
+                pipeline.expire(self.generation_key(user_id), self.ttl)
+                pipeline.publish(INVALIDATION_CHANNEL, user_id)
+                pipeline.execute()
+            except Exception as e:
+                profile_cache_errors.inc("invalidate")
+                print(f"Profile cache invalidation failed for {user_id}: {e}")
+
+    def start(self):
+        """Listen for other workers' invalidations so in-process copies don't go stale"""
+        if not self.enabled or self.remote is None or (self._listener and self._listener.is_alive()):
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, name="profile-cache-invalidations", daemon=True)
+        self._listener.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._listener:
+            self._listener.join(timeout)
+        self._listener = None
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                pubsub = self.remote.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything cached before subscribing may have missed an invalidation
+                self._clear_local()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        user_id = message["data"].decode() if isinstance(message["data"], bytes) else message["data"]
+                        self._drop_local(user_id)
+                pubsub.close()
+            except Exception as e:
+                profile_cache_errors.inc("subscribe")
+                print(f"Profile cache invalidation listener error: {e}")
+                self._clear_local()
+                self._stop.wait(1.0)
+
+# Global profile cache instance
+profile_cache = ProfileCache(remote=connect_redis(REDIS_URL))
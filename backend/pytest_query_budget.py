@@ -0,0 +1,41 @@
+"""
+Pytest plugin that fails tests which regress a MongoDB query budget.
+
+Enable it from a conftest.py with:
+
+    pytest_plugins = ["pytest_query_budget"]
+
+and set QUERY_BUDGET=1 so the app installs QueryBudgetMiddleware.
+"""
+
+from contextlib import contextmanager
+
+import pytest
+
+import query_budget
+
+@pytest.fixture
+def max_queries():
+    """
+    Fail the test if the wrapped block issues more than `limit` MongoDB commands:
+
+        with max_queries(4):
+            client.get("/profile", headers=auth)
+    """
+    @contextmanager
+    def _max_queries(limit: int, label: str = "block"):
+        with query_budget.watch_queries(label, limit) as log:
+            yield log
+        if log.over_budget:
+            pytest.fail(log.describe(), pytrace=False)
+    return _max_queries
+
+@pytest.fixture(autouse=True)
+def route_query_budgets():
+    """Fail any test during which a route exceeded its @query_budget"""
+    query_budget.violations.clear()
+    yield
+    if query_budget.violations:
+        report = "\n\n".join(log.describe() for log in query_budget.violations)
+        query_budget.violations.clear()
+        pytest.fail(f"Route query budget exceeded:\n{report}", pytrace=False)
@@ -0,0 +1,122 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+# Enable per-request query counting in dev/test (off in production)
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET", "").lower() in ("1", "true", "yes")
+
+class QueryLog:
+    """Mongo commands issued within one request (or one test block)"""
+
+    def __init__(self, label: str = "", budget: Optional[int] = None):
+        self.label = label
+        self.budget = budget
+        self.commands: List[Tuple[str, str, str]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.commands)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+    def describe(self) -> str:
+        lines = [f"{self.label}: {self.count} MongoDB commands (budget {self.budget})"]
+        for index, (command, collection, summary) in enumerate(self.commands, 1):
+            lines.append(f"  {index:>3}. {command} {collection} {summary}")
+        return "\n".join(lines)
+
+_current_log: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+# Routes that went over budget since the last reset (read by the pytest fixture)
+violations: List[QueryLog] = []
+
+# Process-wide logs that see every command, whatever thread or request issued it
+_watchers: List[QueryLog] = []
+
+def start_query_log(label: str = "", budget: Optional[int] = None):
+    """Start counting commands in the current context; returns (log, token)"""
+    log = QueryLog(label, budget)
+    return log, _current_log.set(log)
+
+def stop_query_log(token):
+    _current_log.reset(token)
+
+@contextmanager
+def watch_queries(label: str = "", budget: Optional[int] = None):
+    """
+    Count every command issued while the block runs, across threads.
+    Used by tests, where the app may run on a different thread (TestClient).
+    """
+    log = QueryLog(label, budget)
+    _watchers.append(log)
+    try:
+        yield log
+    finally:
+        _watchers.remove(log)
+
+def query_budget(limit: int) -> Callable:
+    """Declare the maximum number of MongoDB commands a route may issue"""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.__query_budget__ = limit
+        return endpoint
+    return decorator
+
+class QueryCountingListener(monitoring.CommandListener):
+    """
+    Appends every command to the request-scoped QueryLog, if one is active.
+
+    The log lives in a context var, and Starlette copies the request's
+    context into the threadpool that runs sync endpoints, so commands issued
+    from handlers and dependencies land in the right request's log.
+    """
+
+    SUMMARY_FIELDS = ("filter", "q", "pipeline", "updates", "deletes")
+
+    def started(self, event):
+        log = _current_log.get()
+        if log is None and not _watchers:
+            return
+        collection = event.command.get(event.command_name)
+        summary = ""
+        for field in self.SUMMARY_FIELDS:
+            if field in event.command:
+                summary = str(event.command[field])[:200]
+                break
+        entry = (event.command_name, collection if isinstance(collection, str) else "-", summary)
+        if log is not None:
+            log.commands.append(entry)
+        for watcher in list(_watchers):
+            watcher.commands.append(entry)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class QueryBudgetMiddleware:
+    """Counts MongoDB commands per request and logs routes that exceed their declared budget"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log, token = start_query_log(f'{scope["method"]} {scope["path"]}')
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            stop_query_log(token)
+            route = scope.get("route")
+            log.budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+            if log.over_budget:
+                violations.append(log)
+                print(f"⚠️  Query budget exceeded\n{log.describe()}")
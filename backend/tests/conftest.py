@@ -0,0 +1,103 @@
+"""
+Shared fixtures: the app on an in-memory mongomock database, with a fake
+LLM, a temporary upload/archive directory and query budgets enforced.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WORKDIR = tempfile.mkdtemp(prefix="zoobae-tests-")
+
+os.environ["MONGO_URL"] = "mongomock://"
+os.environ["QUERY_BUDGET"] = "1"
+os.environ["CHAT_WRITE_BEHIND"] = "0"
+os.environ["UPLOADS_DIR"] = os.path.join(WORKDIR, "uploads")
+os.environ["CHAT_ARCHIVE_DIR"] = os.path.join(WORKDIR, "chat_archive")
+sys.path.insert(0, str(BACKEND_DIR))
+
+pytest_plugins = ["pytest_query_budget"]
+
+def _install_fake_llm():
+    from loadtest import FakeLLMService
+
+    fake_llm_module = types.ModuleType("llm_service")
+    fake_llm_module.llm_service = FakeLLMService(latency=0)
+    sys.modules["llm_service"] = fake_llm_module
+
+_install_fake_llm()
+
+def drain_feed_worker():
+    """Wait for queued feed refreshes, so they don't run (and query) during a test"""
+    from feed_service import feed_service
+
+    feed_service.stop()
+    feed_service.start()
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def db():
+    from database import db_service
+    return db_service
+
+@pytest.fixture
+def make_db():
+    """Factory for services on their own throwaway database, apart from the app's"""
+    def _make_db(service=None, create_indexes: bool = True, **options):
+        from database import DatabaseService
+
+        service = service or DatabaseService
+        return service(db_name=f"test-{uuid.uuid4().hex[:8]}", **options).connect(create_indexes=create_indexes)
+    return _make_db
+
+@pytest.fixture
+def bucket_db(make_db, monkeypatch):
+    """An isolated database storing chat in small buckets, so a few messages fill one"""
+    import database
+
+    monkeypatch.setattr(database, "CHAT_BUCKET_SIZE", 5)
+    return make_db(chat_storage="buckets")
+
+@pytest.fixture
+def make_user(client):
+    """Factory for registered, logged-in users with a profile: returns (user_id, auth headers)"""
+    def _make_user(home: str = "Austin, TX"):
+        email = f"test-{uuid.uuid4().hex[:12]}@example.com"
+        client.post("/register", json={"email": email, "password": "test-password"}).raise_for_status()
+        login = client.post("/login", data={"username": email, "password": "test-password"})
+        login.raise_for_status()
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        response = client.post("/profile", headers=headers, json={
+            "name": "Test User",
+            "pronouns": "they/them",
+            "essential_details": [
+                {"key": "age", "value": "30", "is_visible": True},
+                {"key": "height", "value": "5'8\"", "is_visible": True},
+                {"key": "home", "value": home, "is_visible": True}
+            ],
+            "prompts": [],
+            "photos": []
+        })
+        response.raise_for_status()
+        drain_feed_worker()
+        return login.json()["user"]["id"], headers
+    return _make_user
+
+@pytest.fixture
+def user(make_user):
+    """A registered, logged-in user with a profile: (user_id, auth headers)"""
+    return make_user()
@@ -0,0 +1,44 @@
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+
+from models import LoginResponse, UserProfile
+from tests.test_query_budgets import upload_photo
+
+def test_login_returns_only_declared_profile_fields(client):
+    email = f"test-{uuid.uuid4().hex[:12]}@example.com"
+    client.post("/register", json={"email": email, "password": "test-password"}).raise_for_status()
+    headers = {"Authorization": f"Bearer {email}"}
+    client.post("/profile", headers=headers, json={
+        "name": "Test User",
+        "pronouns": "they/them",
+        "essential_details": [{"key": "age", "value": "30", "is_visible": True}],
+        "prompts": [],
+        "photos": []
+    }).raise_for_status()
+
+    response = client.post("/login", data={"username": email, "password": "test-password"})
+
+    assert response.status_code == 200
+    user = response.json()["user"]
+    assert user["email"] == email
+    # Derived filter attributes such as "age" stay internal
+    assert user["profile"]["name"] == "Test User"
+    assert set(user["profile"]) <= set(UserProfile.model_fields)
+    assert "age" not in user["profile"]
+
+def test_trusted_bodies_match_the_response_models(client, db, make_user):
+    user_id, headers = make_user()
+    upload_photo(client, headers)
+    profile = db.get_profile(user_id)
+    # Stored photos carry internal fields the models don't declare
+    assert {"_id", "user_id", "storage_key"} <= set(profile["photos"][0])
+
+    body = client.get("/profile", headers=headers).json()
+    assert body == jsonable_encoder(UserProfile.model_validate(profile))
+
+    # Tokens are the account email
+    email = headers["Authorization"].split()[1]
+    login = client.post("/login", data={"username": email, "password": "test-password"}).json()
+    expected = {"access_token": email, "token_type": "bearer", "user": {"id": user_id, "email": email, "profile": profile}}
+    assert login == jsonable_encoder(LoginResponse.model_validate(expected))
@@ -0,0 +1,27 @@
+from pymongo import _csot
+from pymongo.errors import ExecutionTimeout
+
+import main
+from models import UserProfile
+
+def test_profile_section_leaves_out_internal_fields(client, user):
+    _, headers = user
+    profile = client.get("/bootstrap", headers=headers, params={"sections": "profile"}).json()["profile"]
+    assert profile["name"] == "Test User"
+    assert set(profile) <= set(UserProfile.model_fields)
+    assert "_id" not in profile and "age" not in profile
+
+def test_failed_sections_hide_the_error_and_queries_carry_the_deadline(client, db, user, monkeypatch):
+    _, headers = user
+    deadlines = []
+    def slow_insights(user_id, fields=None):
+        deadlines.append(_csot.get_timeout())
+        raise ExecutionTimeout("operation exceeded time limit", 50)
+    monkeypatch.setattr(db, "get_personality_insights", slow_insights)
+    monkeypatch.setattr(db, "get_user_prompts", lambda user_id, fields=None: 1 / 0)
+
+    body = client.get("/bootstrap", headers=headers, params={"sections": "profile,prompts,insights"}).json()
+
+    assert body["errors"] == {"prompts": "failed", "insights": "timed out"}
+    assert body["prompts"] is None and body["profile"]["name"] == "Test User"
+    assert 0 < deadlines[0] <= main.BOOTSTRAP_SECTION_TIMEOUT
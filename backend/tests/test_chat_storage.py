@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime, timedelta
+
+from database import DatabaseService
+
+def chat_messages(user_id, texts, start):
+    return [
+        {**DatabaseService.new_chat_message(user_id, text, "user"), "timestamp": start + timedelta(seconds=i)}
+        for i, text in enumerate(texts)
+    ]
+
+def test_bucket_appends_keep_order_across_batch_sizes(bucket_db):
+    user_id = str(uuid.uuid4())
+    start = datetime(2026, 10, 19, 12)
+    messages = chat_messages(user_id, [f"m{i}" for i in range(1, 10)], start)
+    # 4 fit in the first bucket, the next 2 don't, then single messages follow them
+    for batch in (messages[:4], messages[4:6], messages[6:7], messages[7:9]):
+        bucket_db.save_chat_messages(batch)
+
+    texts = [f"m{i}" for i in range(1, 10)]
+    assert [message["message"] for message in bucket_db.get_recent_chat_messages(user_id)] == texts
+    assert [message["message"] for message in bucket_db.get_recent_chat_messages(user_id, 3)] == texts[-3:]
+    assert bucket_db.chat_buckets.count_documents({"user_id": user_id, "sealed": {"$ne": True}}) == 1
+
+def test_a_new_day_starts_a_new_bucket(bucket_db):
+    user_id = str(uuid.uuid4())
+    start = datetime(2026, 10, 19, 23, 59, 58)
+    messages = chat_messages(user_id, ["late", "later", "next day"], start)
+    bucket_db.save_chat_messages(messages[:2])
+    bucket_db.save_chat_messages(messages[2:])
+
+    buckets = list(bucket_db.chat_buckets.find({"user_id": user_id}).sort("bucket_start", 1))
+    assert [bucket["count"] for bucket in buckets] == [2, 1]
+    assert [message["message"] for message in bucket_db.get_recent_chat_messages(user_id, 3)] == ["late", "later", "next day"]
+
+def test_history_starts_from_the_latest_messages_and_pages_into_the_archive(client, db, user, monkeypatch):
+    user_id, headers = user
+    now = datetime.utcnow()
+    db.save_chat_messages(chat_messages(user_id, ["old 1", "old 2"], now - timedelta(days=400)))
+    db.chat_archive.archive_user(user_id, now - timedelta(days=1))
+    db.save_chat_messages(chat_messages(user_id, ["new 1", "new 2", "new 3"], now - timedelta(minutes=5)))
+
+    read_segment = db.chat_archive.read_segment
+    segments_read = []
+    monkeypatch.setattr(db.chat_archive, "read_segment", lambda segment: segments_read.append(segment) or read_segment(segment))
+
+    latest = client.get("/chat/history", headers=headers, params={"limit": 2}).json()["chat_history"]
+    assert [message["message"] for message in latest] == ["new 2", "new 3"]
+    assert segments_read == []
+
+    older = client.get("/chat/history", headers=headers, params={"limit": 2, "before": latest[0]["timestamp"]})
+    assert older.status_code == 200, older.text
+    assert [message["message"] for message in older.json()["chat_history"]] == ["old 2", "new 1"]
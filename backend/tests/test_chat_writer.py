@@ -0,0 +1,71 @@
+import fcntl
+import uuid
+from datetime import datetime
+
+import chat_writer
+from chat_writer import ChatWriteBuffer, WriteAheadLog
+from database import DatabaseService
+
+def message_records(user_id, count):
+    return [
+        {"type": "message", "message": DatabaseService.new_chat_message(user_id, f"m{i}", "user")}
+        for i in range(count)
+    ]
+
+def saved_texts(db, user_id):
+    return [message["message"] for message in db.get_recent_chat_messages(user_id)]
+
+def test_a_retried_batch_is_not_saved_twice_in_buckets(bucket_db, monkeypatch):
+    user_id = str(uuid.uuid4())
+    records = message_records(user_id, 3) + [
+        {"type": "insights", "user_id": user_id, "insights": {"mood": "calm"}, "updated_at": datetime.utcnow()}
+    ]
+    # The messages are written, then the batch fails on the insights
+    save_insights = bucket_db.save_personality_insights_many
+    failures = [RuntimeError("connection reset")]
+    def flaky_save_insights(insights):
+        if failures:
+            raise failures.pop()
+        return save_insights(insights)
+    monkeypatch.setattr(bucket_db, "save_personality_insights_many", flaky_save_insights)
+    monkeypatch.setattr(chat_writer.time, "sleep", lambda seconds: None)
+
+    assert ChatWriteBuffer(db=bucket_db)._save(records)
+
+    assert saved_texts(bucket_db, user_id) == ["m0", "m1", "m2"]
+
+def test_replaying_a_log_of_saved_writes_is_a_no_op_in_buckets(bucket_db, tmp_path):
+    user_id = str(uuid.uuid4())
+    records = message_records(user_id, 2)
+    wal = WriteAheadLog(tmp_path, fsync=False)
+    for record in records:
+        wal.append(record)
+    # Saved, then the worker died before removing its log
+    bucket_db.save_chat_messages([record["message"] for record in records])
+    wal.close(remove=False)
+
+    buffer = ChatWriteBuffer(db=bucket_db, enabled=True, wal_dir=str(tmp_path))
+    buffer.start()
+    buffer.stop()
+
+    assert saved_texts(bucket_db, user_id) == ["m0", "m1"]
+    assert list(tmp_path.glob("chat-*.wal")) == []
+
+def test_a_starting_worker_never_takes_a_log_being_created(tmp_path, monkeypatch):
+    flock = fcntl.flock
+    taken = []
+    def flock_after_another_worker_scans(fd, operation):
+        # Another worker looks for orphaned logs between our open() and flock()
+        for path, handle in WriteAheadLog.orphaned(tmp_path):
+            taken.append(path)
+            handle.close()
+        flock(fd, operation)
+    monkeypatch.setattr(chat_writer.fcntl, "flock", flock_after_another_worker_scans)
+
+    wal = WriteAheadLog(tmp_path, fsync=False)
+    monkeypatch.setattr(chat_writer.fcntl, "flock", flock)
+
+    assert taken == []
+    assert WriteAheadLog.orphaned(tmp_path) == []
+    assert wal.path.exists()
+    wal.close(remove=True)
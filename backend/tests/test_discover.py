@@ -0,0 +1,36 @@
+import pytest
+
+class RecordingCollection:
+    """Stands in for db.profiles and records the pipeline (mongomock can't run $lookup with let)"""
+
+    def __init__(self):
+        self.pipelines = []
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        return iter([])
+
+@pytest.mark.parametrize("near", [None, {"type": "Point", "coordinates": [-97.74, 30.27]}])
+def test_matching_excludes_the_searcher_before_skip_and_limit(db, monkeypatch, near):
+    profiles = RecordingCollection()
+    monkeypatch.setattr(db, "profiles", profiles)
+
+    db.get_profiles_for_matching(limit=3, near=near, radius_km=50, filters={"age": {"$gte": 25}}, exclude_user_id="me")
+
+    first_stage = profiles.pipelines[0][0]
+    query = first_stage["$geoNear"]["query"] if near else first_stage["$match"]
+    assert query == {"age": {"$gte": 25}, "user_id": {"$ne": "me"}}
+
+DISCOVER_ROUTES = ["/discover", "/discover/nearby", "/discover/search"]
+
+@pytest.mark.parametrize("route", DISCOVER_ROUTES)
+@pytest.mark.parametrize("page, detail", [
+    ({"limit": 0}, "limit must be between 1 and 100"),
+    ({"limit": 101}, "limit must be between 1 and 100"),
+    ({"skip": -1}, "skip must not be negative"),
+])
+def test_discovery_pages_are_bounded(client, user, route, page, detail):
+    _, headers = user
+    response = client.get(route, headers=headers, params=page)
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
@@ -0,0 +1,26 @@
+from feed_service import FeedService
+
+def feed_ids(db, user_id):
+    feed = db.get_candidate_feed(user_id, limit=1000)
+    return {candidate["user_id"] for candidate in feed["candidates"]} if feed else set()
+
+def test_refresh_only_scores_the_pool(db, make_user, monkeypatch):
+    # mongomock has no $nearSphere, so the pool is the most recently updated profiles
+    users = [make_user()[0] for _ in range(4)]
+    scored = []
+    snapshots = db.get_matching_snapshots
+    monkeypatch.setattr(db, "get_matching_snapshots", lambda user_ids=None: scored.append(user_ids) or snapshots(user_ids))
+
+    FeedService(db, pool_size=2).refresh_for(users[0])
+
+    assert scored == [[users[0]], [users[3], users[2]]]
+    assert feed_ids(db, users[0]) == {users[2], users[3]}
+
+def test_refresh_removes_user_from_feeds_outside_the_pool(db, make_user):
+    old, first, second, third = (make_user()[0] for _ in range(4))
+    assert first in feed_ids(db, old)
+
+    FeedService(db, pool_size=2).refresh_for(first)
+
+    assert first not in feed_ids(db, old)
+    assert first in feed_ids(db, third)
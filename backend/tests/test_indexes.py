@@ -0,0 +1,46 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import INDEX_VERSION
+
+@pytest.fixture
+def fresh_db(make_db):
+    return make_db(create_indexes=False)
+
+def test_version_is_only_recorded_after_a_successful_build(fresh_db, monkeypatch):
+    create_indexes = fresh_db._create_indexes
+    monkeypatch.setattr(fresh_db, "_create_indexes", lambda: (_ for _ in ()).throw(RuntimeError("crashed mid-build")))
+    with pytest.raises(RuntimeError):
+        fresh_db.ensure_indexes()
+    assert fresh_db.migrations.find_one({"_id": "indexes"}).get("version") != INDEX_VERSION
+
+    monkeypatch.setattr(fresh_db, "_create_indexes", create_indexes)
+    assert fresh_db.ensure_indexes()
+    assert fresh_db.migrations.find_one({"_id": "indexes"})["version"] == INDEX_VERSION
+    assert not fresh_db.ensure_indexes()
+
+def test_other_workers_wait_for_the_build(fresh_db):
+    # Another worker holds the build lease...
+    building_until = datetime.utcnow() + timedelta(hours=1)
+    fresh_db.migrations.insert_one({"_id": "indexes", "building_version": INDEX_VERSION, "building_until": building_until})
+    with pytest.raises(RuntimeError):
+        fresh_db.ensure_indexes(wait_seconds=0)
+
+    # ...and finishes while this one waits
+    threading.Timer(0.5, fresh_db._record_index_version).start()
+    assert not fresh_db.ensure_indexes(wait_seconds=10)
+
+def test_a_dead_builders_lease_is_taken_over(fresh_db):
+    building_until = datetime.utcnow() - timedelta(seconds=1)
+    fresh_db.migrations.insert_one({"_id": "indexes", "version": INDEX_VERSION - 1, "building_version": INDEX_VERSION, "building_until": building_until})
+
+    assert fresh_db.ensure_indexes(wait_seconds=0)
+    assert fresh_db.migrations.find_one({"_id": "indexes"})["version"] == INDEX_VERSION
+
+def test_legacy_likes_are_not_indexed(fresh_db):
+    # Likes live in matches now; nothing writes to the likes collection
+    assert fresh_db.ensure_indexes()
+    assert set(fresh_db.likes.index_information()) <= {"_id_"}
+    assert fresh_db.matches.index_information()
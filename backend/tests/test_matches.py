@@ -0,0 +1,22 @@
+def test_mutual_like_creates_one_match(client, make_user, db, max_queries):
+    first, first_headers = make_user()
+    second, second_headers = make_user()
+
+    with max_queries(1, "like_user"):
+        liked = db.like_user(first, second)
+    assert liked["new_like"] and not liked["matched"]
+    assert db.has_liked(first, second) and not db.has_liked(second, first)
+    assert not client.post(f"/likes/{second}", headers=first_headers).json()["new_like"]
+
+    response = client.post(f"/likes/{first}", headers=second_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["new_match"]
+
+    matches = client.get("/matches", headers=first_headers).json()["matches"]
+    assert [match["user_id"] for match in matches] == [second]
+
+def test_matches_page_size_is_bounded(client, user):
+    _, headers = user
+    for limit in (0, -1, 101):
+        assert client.get("/matches", headers=headers, params={"limit": limit}).status_code == 400
+        assert client.get("/matches/any/messages", headers=headers, params={"limit": limit}).status_code == 400
@@ -0,0 +1,51 @@
+import asyncio
+import uuid
+
+import pytest
+
+from messaging import Broker, MessageWriter, MessagingHub
+
+def test_send_before_start_raises_instead_of_dropping(db):
+    hub = MessagingHub(db)
+    with pytest.raises(RuntimeError):
+        asyncio.run(hub.send("a:b", "a", "hello"))
+
+def test_brokers_must_implement_the_interface():
+    class PublishOnly(Broker):
+        async def publish(self, channel, payload):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+
+def test_a_failed_batch_is_retried_not_dropped():
+    class FlakyDatabase:
+        def __init__(self):
+            self.failures = 1
+            self.saved = []
+
+        def save_messages(self, messages):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("primary stepped down")
+            self.saved.extend(messages)
+
+    db = FlakyDatabase()
+
+    async def send_and_stop():
+        writer = MessageWriter(db, flush_interval=0.01, retry_delay=0.01)
+        writer.start()
+        writer.enqueue({"_id": "m1", "text": "hello"})
+        while not db.saved:
+            await asyncio.sleep(0.01)
+        writer.enqueue({"_id": "m2", "text": "still there?"})
+        await writer.stop()
+
+    asyncio.run(asyncio.wait_for(send_and_stop(), 5))
+    assert [message["_id"] for message in db.saved] == ["m1", "m2"]
+
+def test_saving_a_batch_again_skips_the_saved_messages(db):
+    messages = [{"_id": f"retry-{uuid.uuid4().hex}", "match_id": "a:b", "text": text} for text in ("one", "two")]
+    assert db.save_messages(messages[:1]) == 1
+    assert db.save_messages(messages) == 1
+    assert db.messages.count_documents({"_id": {"$in": [message["_id"] for message in messages]}}) == 2
@@ -0,0 +1,112 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import UpdateOne
+
+from migrations import MIGRATIONS, Migration, MigrationLeaseHeld, MigrationRunner
+
+class TouchUsers(Migration):
+    """Sets a marker on a fixed set of users"""
+
+    collection = "users"
+    projection = {"_id": 1}
+
+    def __init__(self, user_ids):
+        self.name = f"test-{uuid.uuid4().hex[:8]}"
+        self.user_ids = user_ids
+
+    def query(self):
+        return {"_id": {"$in": self.user_ids}}
+
+    def build_operation(self, db, document):
+        return UpdateOne({"_id": document["_id"]}, {"$set": {"touched_by": self.name}})
+
+def test_a_live_lease_refuses_a_second_runner(db):
+    migration = TouchUsers([])
+    MigrationRunner(db).claim(migration.name)
+
+    with pytest.raises(MigrationLeaseHeld):
+        MigrationRunner(db).claim(migration.name)
+
+def test_a_crashed_run_is_resumed_once_its_lease_expires(db, make_user):
+    user_ids = sorted(make_user()[0] for _ in range(3))
+    migration = TouchUsers(user_ids)
+    # A run that checkpointed the first user and then died
+    crashed = MigrationRunner(db, lease_seconds=0)
+    crashed.claim(migration.name)
+    crashed._checkpoint(migration.name, {"processed": 1, "modified": 1, "last_id": user_ids[0]})
+
+    state = MigrationRunner(db, batch_size=1).run(migration)
+
+    assert state["status"] == "completed" and state["processed"] == 3
+    touched = {user["_id"] for user in db.users.find({"touched_by": migration.name})}
+    assert touched == set(user_ids[1:])
+    with pytest.raises(MigrationLeaseHeld):
+        crashed._checkpoint(migration.name, {"processed": 2})
+
+def test_a_run_stuck_before_leases_existed_can_be_resumed(db):
+    migration = TouchUsers([])
+    db.migrations.insert_one({"_id": migration.name, "status": "running", "updated_at": datetime.utcnow() - timedelta(days=1)})
+
+    assert MigrationRunner(db).run(migration)["status"] == "completed"
+
+def test_photo_urls_moves_flat_uploads_into_their_shards(db):
+    from migrations import MIGRATIONS
+    from photo_storage import photo_storage
+
+    photo_id = str(uuid.uuid4())
+    key = f"{photo_id}.jpg"
+    (photo_storage.root / key).write_bytes(b"jpeg")
+    db.photos.insert_one({"_id": str(uuid.uuid4()), "id": photo_id, "user_id": "someone", "url": f"https://storage.example.com/{key}"})
+
+    MigrationRunner(db).run(MIGRATIONS["photo_urls"], restart=True)
+
+    photo = db.photos.find_one({"id": photo_id})
+    assert photo["url"] == photo_storage.url(key)
+    assert photo_storage.path(key).read_bytes() == b"jpeg"
+    assert not (photo_storage.root / key).exists()
+
+def test_backfills_bump_content_versions_and_drop_cached_profiles(client, db, user):
+    from migrations import MIGRATIONS
+    from profile_cache import profile_cache
+
+    user_id, headers = user
+    etag = client.get("/profile", headers=headers).headers["etag"]
+    db.profiles.update_one({"user_id": user_id}, {"$unset": {"age": ""}})
+
+    MigrationRunner(db).run(MIGRATIONS["filter_attributes"], restart=True)
+
+    assert profile_cache.local.get(profile_cache.key("profile", user_id)) is None
+    assert client.get("/profile", headers={**headers, "If-None-Match": etag}).status_code == 200
+    assert db.profiles.find_one({"user_id": user_id})["age"] == 30
+
+@pytest.fixture
+def embedded_db(make_db):
+    from database import EmbeddedProfileDatabaseService
+    return make_db(EmbeddedProfileDatabaseService)
+
+def insert_during_copy(db, monkeypatch, user_id):
+    """Make the next copy of user_id's children race an upload of a second photo"""
+    copy = db.embedded_children
+    def racing_copy(copied_user_id):
+        children = copy(copied_user_id)
+        db.photos.insert_one({"_id": "late-photo", "user_id": user_id, "order": 2})
+        return children
+    monkeypatch.setattr(db, "embedded_children", racing_copy)
+
+@pytest.mark.parametrize("embed", ["first_touch", "migration"])
+def test_embedding_keeps_children_inserted_during_the_copy(embedded_db, monkeypatch, embed):
+    user_id = str(uuid.uuid4())
+    embedded_db.profiles.insert_one({"_id": str(uuid.uuid4()), "user_id": user_id, "name": "Referenced"})
+    embedded_db.photos.insert_one({"_id": "early-photo", "user_id": user_id, "order": 1})
+    insert_during_copy(embedded_db, monkeypatch, user_id)
+
+    if embed == "first_touch":
+        embedded_db.embed_profile_children(user_id)
+    else:
+        MigrationRunner(embedded_db).run(MIGRATIONS["embed_profile_children"])
+
+    embedded = embedded_db.profiles.find_one({"user_id": user_id})
+    assert [photo["_id"] for photo in embedded["photos"]] == ["early-photo"]
+    assert [photo["_id"] for photo in embedded_db.photos.find({"user_id": user_id})] == ["late-photo"]
@@ -0,0 +1,35 @@
+import fakeredis
+import pytest
+
+from profile_cache import LocalLRUCache, ProfileCache
+
+@pytest.fixture(params=["local", "shared"])
+def cache(request):
+    remote = fakeredis.FakeRedis() if request.param == "shared" else None
+    return ProfileCache(remote=remote, local=LocalLRUCache(), enabled=True)
+
+def test_hits_after_a_fill(cache):
+    loads = []
+    assert cache.get("profile", "u1", lambda: loads.append(1) or {"name": "A"}) == {"name": "A"}
+    assert cache.get("profile", "u1", lambda: loads.append(1) or {"name": "B"}) == {"name": "A"}
+    assert len(loads) == 1
+
+def test_a_value_loaded_before_an_invalidation_is_not_cached(cache):
+    def stale_loader():
+        # A write lands (and invalidates) while this read is still loading
+        cache.invalidate("u1")
+        return {"name": "old"}
+
+    assert cache.get("profile", "u1", stale_loader) == {"name": "old"}
+    assert cache.get("profile", "u1", lambda: {"name": "new"}) == {"name": "new"}
+
+def test_other_workers_do_not_fill_the_shared_tier_with_stale_values():
+    remote = fakeredis.FakeRedis()
+    reader, writer = (ProfileCache(remote=remote, local=LocalLRUCache(), enabled=True) for _ in range(2))
+
+    def stale_loader():
+        writer.invalidate("u1")
+        return {"name": "old"}
+
+    reader.get("profile", "u1", stale_loader)
+    assert remote.get(ProfileCache.key("profile", "u1")) is None
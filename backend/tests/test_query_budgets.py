@@ -0,0 +1,76 @@
+"""
+Exercise the routes that declare a @query_budget. The autouse
+route_query_budgets fixture (pytest_query_budget) fails any test in which
+one of them issued more MongoDB commands than it declares.
+"""
+
+import io
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + bytes(1024) + b"\xff\xd9"
+
+def upload_photo(client, headers):
+    files = {"file": ("photo.jpg", io.BytesIO(JPEG_BYTES), "image/jpeg")}
+    response = client.post("/profile/photos", headers=headers, files=files)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_create_profile_rejects_a_second_profile(client, user):
+    _, headers = user
+    response = client.post("/profile", headers=headers, json={
+        "name": "Again", "pronouns": "they/them", "essential_details": [], "prompts": [], "photos": []
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Profile already exists"
+
+def test_profile_routes(client, user):
+    _, headers = user
+    assert client.get("/profile", headers=headers).status_code == 200
+    assert client.get("/profile", headers=headers, params={"fields": "name,photos.url"}).status_code == 200
+    prompts = [{"question": f"Question {i}", "answer": f"Answer {i}", "order": i} for i in range(3)]
+    assert client.put("/profile", headers=headers, json={"prompts": prompts}).status_code == 200
+
+def test_photo_routes(client, user):
+    _, headers = user
+    for _ in range(3):
+        upload_photo(client, headers)
+    photos = client.get("/profile/photos", headers=headers).json()["photos"]
+    assert len(photos) == 3
+
+    photo_ids = [photo["id"] for photo in photos]
+    assert client.put("/profile/photos/order", headers=headers, json={"photo_ids": photo_ids[::-1]}).status_code == 200
+    assert client.put(f"/profile/photos/{photo_ids[1]}/primary", headers=headers).status_code == 200
+    assert client.delete(f"/profile/photos/{photo_ids[0]}", headers=headers).status_code == 200
+
+def test_photos_can_only_be_changed_by_their_owner(client, make_user):
+    _, owner = make_user()
+    _, other = make_user()
+    upload_photo(client, owner)
+    photo_id = client.get("/profile/photos", headers=owner).json()["photos"][0]["id"]
+
+    assert client.put(f"/profile/photos/{photo_id}", headers=other, params={"caption": "mine now"}).status_code == 404
+    assert client.delete(f"/profile/photos/{photo_id}", headers=other).status_code == 404
+    photos = client.get("/profile/photos", headers=owner).json()["photos"]
+    assert [photo["id"] for photo in photos] == [photo_id] and photos[0].get("caption") != "mine now"
+
+    assert client.put(f"/profile/photos/{photo_id}", headers=owner, params={"caption": "Hiking"}).status_code == 200
+    assert client.get("/profile/photos", headers=owner).json()["photos"][0]["caption"] == "Hiking"
+    assert client.delete(f"/profile/photos/{photo_id}", headers=owner).status_code == 200
+    assert client.get("/profile/photos", headers=owner).json()["photos"] == []
+
+def test_chat_routes(client, user):
+    user_id, headers = user
+    for message in ("I love travel", "work has been a lot"):
+        response = client.post("/chat/ai", headers=headers, json={"message": message, "user_id": user_id})
+        assert response.status_code == 200, response.text
+    history = client.get("/chat/history", headers=headers)
+    assert history.status_code == 200
+    assert len(history.json()["chat_history"]) == 4
+    assert client.get("/bootstrap", headers=headers).status_code == 200
+
+def test_conditional_get_is_cheap(client, user, max_queries):
+    _, headers = user
+    etag = client.get("/profile", headers=headers).headers["etag"]
+    # Only the auth lookup: the ETag comes from the user document
+    with max_queries(1):
+        response = client.get("/profile", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
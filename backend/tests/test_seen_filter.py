@@ -0,0 +1,73 @@
+import uuid
+
+import database
+from bloom import BloomFilter, SeenFilter
+
+def new_id():
+    return str(uuid.uuid4())
+
+def test_swipe_writes_only_the_changed_words(db, monkeypatch):
+    user_id, first, second = new_id(), new_id(), new_id()
+    assert db.mark_seen(user_id, first)
+    updates = []
+    update_one = db.seen_filters.update_one
+    monkeypatch.setattr(db.seen_filters, "update_one", lambda query, update, **kwargs: updates.append(update) or update_one(query, update, **kwargs))
+
+    assert db.mark_seen(user_id, second)
+    assert not db.mark_seen(user_id, second)
+
+    (update,) = updates
+    words = [path for path in update["$set"] if ".words." in path]
+    assert 0 < len(words) <= db.get_seen_filter(user_id).layers[0].num_hashes
+    assert sum(len(update["$set"][path]) for path in words) <= len(words) * 64
+    seen = db.get_seen_filter(user_id)
+    assert first in seen and second in seen and seen.count == 2
+
+def test_full_layer_grows_the_filter(db, monkeypatch):
+    monkeypatch.setattr(database, "SEEN_FILTER_CAPACITY", 50)
+    # Layers hold 50, 100 and 200 profiles
+    user_id, targets = new_id(), [new_id() for _ in range(200)]
+    for target in targets:
+        db.mark_seen(user_id, target)
+
+    seen = db.get_seen_filter(user_id)
+    assert len(seen.layers) == 3
+    assert all(target in seen for target in targets)
+
+def test_filters_saved_as_one_binary_are_converted(db):
+    user_id, old, new = new_id(), new_id(), new_id()
+    legacy = SeenFilter(1000, 0.01)
+    legacy.add(old)
+    document = legacy.to_document()
+    for layer, bloom in zip(document["layers"], legacy.layers):
+        del layer["words"]
+        layer["bits"] = bytes(bloom.bits)
+    db.seen_filters.insert_one({"_id": new_id(), "user_id": user_id, "filter": document, "version": 1})
+
+    assert db.mark_seen(user_id, new)
+
+    stored = db.seen_filters.find_one({"user_id": user_id})["filter"]["layers"][0]
+    assert "words" in stored and "bits" not in stored
+    seen = db.get_seen_filter(user_id)
+    assert old in seen and new in seen
+
+def test_words_round_trip():
+    bloom = BloomFilter(500, 0.01)
+    bloom.add("a")
+    assert "a" in BloomFilter.from_document(bloom.to_document())
+
+def test_concurrent_swipes_keep_each_others_bits(db, monkeypatch):
+    user_id, first, second, third = new_id(), new_id(), new_id(), new_id()
+    db.mark_seen(user_id, first)
+    stale = db.seen_filters.find_one({"user_id": user_id})
+    db.mark_seen(user_id, second)
+    # The next swipe reads the filter as it was before `second` was saved
+    reads = [stale]
+    find_one = db.seen_filters.find_one
+    monkeypatch.setattr(db.seen_filters, "find_one", lambda *args, **kwargs: reads.pop() if reads else find_one(*args, **kwargs))
+
+    assert db.mark_seen(user_id, third)
+
+    monkeypatch.undo()
+    seen = db.get_seen_filter(user_id)
+    assert all(target in seen for target in (first, second, third))